@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_record
+from salesforce.queries import generate_plan_from_dbml
+from sheets.columnar import RecordBatch
+from sheets.manager import compile_flattener, flatten_record
+
+
+def flatten_with_record(records):
+    """The pre-plan path: flatten every record and infer headers from the first."""
+    rows = 0
+    headers = None
+    for record in records:
+        flattened = flatten_record(record)
+        if headers is None:
+            headers = [key for key in flattened.keys() if key not in ['attributes.type', 'attributes.url'] and not key.endswith(".attributes")]
+        [flattened.get(header, "") for header in headers]
+        rows += 1
+    return rows
+
+
+def flatten_with_plan(records, fields):
+    """The planned path: one flattener per table, reading only its fields."""
+    flattener = compile_flattener(fields)
+    rows = 0
+    for record in records:
+        flattener(record)
+        rows += 1
+    return rows
+
+
+def decode_batches(records, fields, types, page_size=2000):
+    """The streaming path: decode each page into a RecordBatch, then read its rows."""
+    flattener = compile_flattener(fields)
+    rows = 0
+    for start in range(0, len(records), page_size):
+        batch = RecordBatch.from_records(fields, records[start:start + page_size], types, flattener)
+        for _ in batch.iter_rows():
+            rows += 1
+    return rows
+
+
+def page_memory(records, fields, types):
+    """Returns the bytes one page holds as record dicts and as a RecordBatch."""
+    import tracemalloc
+
+    tracemalloc.start()
+    page = [make_record("Bench", fields, index, types) for index in range(len(records))]
+    as_records = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    batch = RecordBatch.from_records(fields, page, types)
+    del page
+    as_batch = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return as_records, as_batch, batch
+
+
+def run(dbml_file, object_name=None, rows=50000):
+    plan = generate_plan_from_dbml(dbml_file)
+    if not plan:
+        print(f"Error: No tables found in {dbml_file}.")
+        return
+
+    # Default to the widest table
+    if object_name is None:
+        object_name = max(plan, key=lambda name: len(plan[name]["fields"]))
+    fields = plan[object_name]["fields"]
+    types = plan[object_name].get("types")
+    records = [make_record(object_name, fields, i, types) for i in range(rows)]
+    print(f"Flattening {rows} {object_name} records with {len(fields)} columns")
+
+    for label, func in (
+        ("flatten_record", lambda: flatten_with_record(records)),
+        ("compile_flattener", lambda: flatten_with_plan(records, fields)),
+        ("RecordBatch", lambda: decode_batches(records, fields, types)),
+    ):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        print(f"  {label:<20} {elapsed:8.3f}s  {rows / elapsed:12,.0f} rows/sec")
+
+    as_records, as_batch, _ = page_memory(records[:2000], fields, types)
+    print(f"  One 2000-record page: {as_records / 1024:,.0f} KB as records, {as_batch / 1024:,.0f} KB as a RecordBatch")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark record flattening")
+    parser.add_argument("-d", "--dbml", default="config/MinProducts.dbml", help="Path to the DBML file")
+    parser.add_argument("-o", "--object", help="Object API Name (default: widest table)")
+    parser.add_argument("-n", "--rows", type=int, default=50000, help="Number of synthetic records")
+
+    args = parser.parse_args()
+    run(args.dbml, args.object, args.rows)
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules each command line entry point imports before it does anything
+ENTRY_POINTS = ("main", "validate_relationships", "debug_script", "sheets.diff")
+# Dependencies that cost tens or hundreds of milliseconds to import, and must
+# only be loaded by the code that uses them
+HEAVY_MODULES = ("simple_salesforce", "zeep", "lxml", "requests", "openpyxl", "pydbml", "pandas", "pyarrow", "numpy")
+# Milliseconds an entry point's own imports may take, on top of interpreter startup
+DEFAULT_BUDGET_MS = 150
+# Imports measured per entry point; the fastest counts, to smooth out noise
+DEFAULT_REPEATS = 3
+
+
+def measure_imports(module):
+    """
+    Imports a module in a fresh interpreter with `-X importtime`.
+
+    Args:
+        module (str): The module to import.
+
+    Returns:
+        tuple: (milliseconds spent on the imports after interpreter startup,
+        set of every module imported).
+
+    Raises:
+        Exception: If the module cannot be imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        text=True,
+        capture_output=True,
+    )
+    if result.returncode:
+        raise Exception(f"Error importing {module}: {result.stderr.strip().splitlines()[-1]}")
+    microseconds = 0
+    imported = set()
+    started = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        imported.add(name.strip())
+        # Lines without indentation are the top-level imports; `site` is interpreter startup
+        if not name.startswith("  "):
+            if started:
+                microseconds += int(cumulative)
+            elif name.strip() == "site":
+                started = True
+    return microseconds / 1000, imported
+
+
+def check(entry_points=ENTRY_POINTS, budget_ms=DEFAULT_BUDGET_MS, repeats=DEFAULT_REPEATS):
+    """
+    Checks that no entry point imports a heavy dependency up front and that
+    each stays within the import-time budget.
+
+    Returns:
+        list: Failure messages, empty if every entry point passed.
+    """
+    failures = []
+    for module in entry_points:
+        timings = []
+        for _ in range(max(1, repeats)):
+            milliseconds, imported = measure_imports(module)
+            timings.append(milliseconds)
+        milliseconds = min(timings)
+        heavy = sorted(name for name in HEAVY_MODULES if name in imported)
+        outcome = "ok"
+        if heavy:
+            outcome = "FAIL"
+            failures.append(f"{module} imports {', '.join(heavy)} at startup")
+        if milliseconds > budget_ms:
+            outcome = "FAIL"
+            failures.append(f"{module} takes {milliseconds:.1f} ms to import, over the {budget_ms} ms budget")
+        print(f"  {module:<24} {milliseconds:8.1f} ms  {outcome}")
+    return failures
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check the import time of the command line entry points")
+    parser.add_argument("-b", "--budget", type=float, default=DEFAULT_BUDGET_MS, help="Milliseconds allowed per entry point")
+    parser.add_argument("-r", "--repeats", type=int, default=DEFAULT_REPEATS, help="Imports measured per entry point")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS), help="Entry point modules to check")
+
+    args = parser.parse_args()
+    print(f"Import time of each entry point (budget {args.budget:g} ms):")
+    failures = check(args.modules, args.budget, args.repeats)
+    for failure in failures:
+        print(f"Error: {failure}")
+    sys.exit(1 if failures else 0)
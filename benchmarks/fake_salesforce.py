@@ -0,0 +1,511 @@
+import csv
+import datetime
+import gzip
+import io
+import ipaddress
+import itertools
+import json
+import os
+import re
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Page size Salesforce uses when no batch size is requested
+DEFAULT_PAGE_SIZE = 2000
+
+_SELECT = re.compile(
+    r"^\s*SELECT\s+(?P<fields>.+?)\s+FROM\s+(?P<object>\w+)(?P<rest>.*)$",
+    re.IGNORECASE | re.DOTALL,
+)
+_LIMIT = re.compile(r"\bLIMIT\s+(\d+)", re.IGNORECASE)
+_ORDER_BY_ID = re.compile(r"\bORDER\s+BY\s+Id(?:\s+(ASC|DESC))?", re.IGNORECASE)
+# Conditions the tool generates; anything else in a WHERE clause is treated as true
+_IN = re.compile(r"(\w+)\s+(NOT\s+)?IN\s*\(([^)]*)\)", re.IGNORECASE)
+_COMPARE = re.compile(r"\b(\w+)\s*(>=|<=|!=|=|<|>)\s*('(?:[^'\\]|\\.)*'|null\b)", re.IGNORECASE)
+_LITERAL = re.compile(r"'((?:[^'\\]|\\.)*)'")
+
+_OPERATORS = {
+    "=": lambda value, literal: value == literal,
+    "!=": lambda value, literal: value != literal,
+    "<": lambda value, literal: value is not None and literal is not None and value < literal,
+    "<=": lambda value, literal: value is not None and literal is not None and value <= literal,
+    ">": lambda value, literal: value is not None and literal is not None and value > literal,
+    ">=": lambda value, literal: value is not None and literal is not None and value >= literal,
+}
+
+
+def _parse_conditions(where):
+    """Turns the conditions the tool generates into record predicates."""
+    predicates = []
+    for field, negated, literals in _IN.findall(where):
+        values = {value.replace("\\'", "'") for value in _LITERAL.findall(literals)}
+        if negated:
+            predicates.append(lambda record, field=field, values=values: record.get(field) not in values)
+        else:
+            predicates.append(lambda record, field=field, values=values: record.get(field) in values)
+    for field, operator, literal in _COMPARE.findall(_IN.sub("", where)):
+        literal = None if literal.lower() == "null" else literal[1:-1].replace("\\'", "'")
+        compare = _OPERATORS[operator]
+        predicates.append(lambda record, field=field, literal=literal, compare=compare: compare(record.get(field), literal))
+    return predicates
+
+
+class FakeSalesforce:
+    """
+    A local stand-in for the Salesforce REST query endpoints.
+
+    Serves `query`, `queryAll`, `query/<locator>` and `composite/batch`
+    from an in-memory dataset, with `nextRecordsUrl` pagination, the
+    `Sforce-Query-Options` batch size, gzip responses and a fixed latency
+    per request. The conditions the tool generates (Id ranges, `IN`/`NOT IN`,
+    comparisons) are applied; other conditions are ignored. `SELECT COUNT()`
+    and `ORDER BY Id` are supported.
+
+    Bulk API 2.0 query jobs (`jobs/query`) run their query when created and
+    are complete from the first status check; their CSV results are served
+    in result sets of `maxRecords` rows (`page_size` by default), chained
+    with the `Sforce-Locator` header. Bulk API 2.0 ingest jobs
+    (`jobs/ingest`) upsert into the dataset on an external Id, resolving
+    `Relationship.ExternalId` columns against the parent records, and
+    `sobjects/<object>/describe` lists each object's fields.
+    """
+
+    def __init__(self, dataset, latency=0.0, page_size=DEFAULT_PAGE_SIZE, cert_dir=None,
+                 external_id_field=None, schema=None):
+        """
+        Args:
+            dataset (dict): Object names mapped to lists of records.
+            latency (float): Seconds added to every request.
+            page_size (int): Records per page when no batch size is requested.
+            cert_dir (str, optional): Serve HTTPS with a throwaway certificate
+                written to this directory, so `simple_salesforce` can connect
+                without changes (see `cert_file`).
+            external_id_field (str, optional): Field described as the external
+                Id of every object that has it.
+            schema (dict, optional): Object names mapped to their field names,
+                for describing objects without records.
+        """
+        self.dataset = dataset
+        self.latency = latency
+        self.page_size = page_size
+        self.external_id_field = external_id_field
+        self.schema = schema or {}
+        self.jobs = {}
+        self._record_ids = itertools.count(1)
+        self.requests = 0
+        self.bytes_sent = 0
+        self.cert_file = None
+        self._cursors = {}
+        self._cursor_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        if cert_dir:
+            self.cert_file, key_file = write_self_signed_certificate(cert_dir)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.cert_file, key_file)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        self._thread = None
+
+    @property
+    def instance_url(self):
+        scheme = "https" if self.cert_file else "http"
+        return f"{scheme}://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def connect(self):
+        """
+        Returns a `simple_salesforce` connection to the server, sharing the
+        tool's pooled HTTP session.
+        """
+        from simple_salesforce import Salesforce
+        from salesforce.auth import get_http_session
+
+        sf = Salesforce(instance_url=self.instance_url, session_id="benchmark", session=get_http_session())
+        if not self.cert_file:
+            sf.base_url = sf.base_url.replace("https://", "http://", 1)
+        return sf
+
+    def select(self, soql_query):
+        """
+        Runs a query against the dataset.
+
+        Returns:
+            tuple: (selected field names, matching records before projection).
+        """
+        match = _SELECT.match(soql_query)
+        if not match:
+            raise ValueError(f"Unsupported query: {soql_query}")
+        object_name = match.group("object")
+        if object_name not in self.dataset:
+            raise ValueError(f"sObject type '{object_name}' is not supported.")
+
+        rest = match.group("rest")
+        tail = re.search(r"\b(ORDER\s+BY|LIMIT|OFFSET)\b", rest, re.IGNORECASE)
+        where = rest[:tail.start()] if tail else rest
+        predicates = _parse_conditions(re.sub(r"^\s*WHERE\b", "", where.strip(), flags=re.IGNORECASE))
+        records = [record for record in self.dataset[object_name] if all(test(record) for test in predicates)]
+
+        order = _ORDER_BY_ID.search(rest)
+        if order:
+            records.sort(key=lambda record: record.get("Id") or "", reverse=(order.group(1) or "").upper() == "DESC")
+        limit = _LIMIT.search(rest)
+        if limit:
+            records = records[:int(limit.group(1))]
+        return [field.strip() for field in match.group("fields").split(",")], records
+
+    def query(self, soql_query, page_size):
+        """Runs a query against the dataset, returning its first page."""
+        fields, records = self.select(soql_query)
+        if [field.upper() for field in fields] == ["COUNT()"]:
+            return {"totalSize": len(records), "done": True, "records": []}
+
+        # Project to the selected top-level fields (relationship fields select their parent object)
+        selected = {field.split(".")[0] for field in fields}
+        if records and set(records[0]) - selected - {"attributes"}:
+            records = [
+                {key: value for key, value in record.items() if key == "attributes" or key in selected}
+                for record in records
+            ]
+        with self._lock:
+            cursor = f"01g{next(self._cursor_ids):015d}"
+            self._cursors[cursor] = records
+        return self.page(cursor, 0, page_size)
+
+    def page(self, cursor, offset, page_size):
+        """Returns one page of a query cursor."""
+        records = self._cursors[cursor]
+        end = offset + page_size
+        response = {"totalSize": len(records), "done": end >= len(records), "records": records[offset:end]}
+        if response["done"]:
+            with self._lock:
+                self._cursors.pop(cursor, None)
+        else:
+            response["nextRecordsUrl"] = f"/services/data/v62.0/query/{cursor}-{end}"
+        return response
+
+    def describe(self, object_name):
+        """Describes an object's fields: all writable except `Id`."""
+        if object_name not in self.dataset and object_name not in self.schema:
+            raise KeyError(object_name)
+        fields = self.schema.get(object_name)
+        if fields is None:
+            records = self.dataset[object_name]
+            fields = [
+                field for field, value in (records[0].items() if records else ())
+                if field != "attributes" and not isinstance(value, dict)
+            ]
+        return {
+            "name": object_name,
+            "fields": [
+                {
+                    "name": field,
+                    "createable": field != "Id",
+                    "updateable": field != "Id",
+                    "externalId": field == self.external_id_field,
+                }
+                for field in fields
+            ],
+        }
+
+    def _find_external_id(self, relationship, field, value):
+        """Returns the Id of the parent record whose `field` is `value`, or None."""
+        candidates = [relationship] if relationship in self.dataset else list(self.dataset)
+        for object_name in candidates:
+            for record in self.dataset[object_name]:
+                if record.get(field) == value:
+                    return record.get("Id")
+        return None
+
+    def ingest(self, job):
+        """Runs an uploaded upsert job against the dataset."""
+        key = job["externalIdFieldName"]
+        records = self.dataset.setdefault(job["object"], [])
+        index = {record.get(key): record for record in records if record.get(key)}
+        rows = list(csv.DictReader(io.StringIO(job.pop("data", ""))))
+        failed = []
+        for row in rows:
+            record = {}
+            error = None if row.get(key) else f"MISSING_ARGUMENT:{key} not specified"
+            for column, value in row.items():
+                if error or value == "":
+                    continue
+                if "." not in column:
+                    record[column] = value
+                    continue
+                relationship, field = column.split(".", 1)
+                parent_id = self._find_external_id(relationship, field, value)
+                if parent_id is None:
+                    error = f"INVALID_FIELD:Foreign key external ID: {value} not found for field {field} in entity {relationship}"
+                elif relationship.endswith("__r"):
+                    record[f"{relationship[:-3]}__c"] = parent_id
+                else:
+                    record[f"{relationship}Id"] = parent_id
+            if error:
+                failed.append({"sf__Id": "", "sf__Error": error, **row})
+            elif row[key] in index:
+                index[row[key]].update(record)
+            else:
+                record["Id"] = f"a99{next(self._record_ids):015d}"
+                records.append(record)
+                index[row[key]] = record
+        job.update(state="JobComplete", numberRecordsProcessed=len(rows), numberRecordsFailed=len(failed), failed=failed)
+
+    def _failed_results(self, job):
+        buffer = io.StringIO()
+        if job["failed"]:
+            writer = csv.DictWriter(buffer, fieldnames=list(job["failed"][0]), lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(job["failed"])
+        return buffer.getvalue()
+
+    @staticmethod
+    def _results_csv(fields, records):
+        """Formats records as Bulk API CSV: relationship fields flattened, nulls empty, booleans lowercase."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(fields)
+        for record in records:
+            row = []
+            for field in fields:
+                value = record
+                for part in field.split("."):
+                    value = value.get(part) if isinstance(value, dict) else None
+                if isinstance(value, bool):
+                    value = "true" if value else "false"
+                row.append("" if value is None else value)
+            writer.writerow(row)
+        return buffer.getvalue()
+
+    def route_query_job(self, method, path, payload):
+        """
+        Answers a Bulk API 2.0 query job request, returning (status, body),
+        plus the response headers for a result set.
+        """
+        url = urlparse(path)
+        match = re.search(r"/jobs/query(?:/(?P<job>[^/]+))?(?P<rest>/\w+)?/?$", url.path)
+        if not match:
+            return 404, [{"errorCode": "NOT_FOUND", "message": path}]
+        job_id, rest = match.group("job"), match.group("rest")
+        if method == "POST" and not job_id:
+            request = json.loads(payload)
+            try:
+                fields, records = self.select(request["query"])
+            except (KeyError, ValueError) as e:
+                return 400, [{"errorCode": "INVALIDJOB", "message": str(e)}]
+            with self._lock:
+                job_id = f"750{len(self.jobs) + 1:015d}"
+                self.jobs[job_id] = {
+                    "id": job_id,
+                    "operation": request.get("operation", "query"),
+                    "object": _SELECT.match(request["query"]).group("object"),
+                    "state": "UploadComplete",
+                    "fields": fields,
+                    "records": records,
+                }
+                return 200, self._query_job_info(self.jobs[job_id])
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or "records" not in job:
+                return 404, [{"errorCode": "NOT_FOUND", "message": f"Job {job_id} not found"}]
+            if method != "GET":
+                return 405, [{"errorCode": "METHOD_NOT_ALLOWED", "message": method}]
+            if not rest:
+                job.update(state="JobComplete", numberRecordsProcessed=len(job["records"]))
+                return 200, self._query_job_info(job)
+            if rest != "/results" or job["state"] != "JobComplete":
+                return 400, [{"errorCode": "INVALIDJOB", "message": f"Job {job_id} has no results"}]
+        params = parse_qs(url.query)
+        offset = int(params.get("locator", ["0"])[0])
+        end = offset + int(params.get("maxRecords", [self.page_size])[0])
+        records = job["records"][offset:end]
+        headers = {
+            "Sforce-Locator": str(end) if end < len(job["records"]) else "null",
+            "Sforce-NumberOfRecords": str(len(records)),
+        }
+        return 200, self._results_csv(job["fields"], records), headers
+
+    @staticmethod
+    def _query_job_info(job):
+        return {key: value for key, value in job.items() if key not in ("fields", "records")}
+
+    def route_ingest(self, method, path, payload):
+        """Answers a Bulk API 2.0 ingest request, returning (status, body)."""
+        match = re.search(r"/jobs/ingest(?:/(?P<job>[^/]+))?(?P<rest>/\w+)?/?$", urlparse(path).path)
+        if not match:
+            return 404, [{"errorCode": "NOT_FOUND", "message": path}]
+        job_id, rest = match.group("job"), match.group("rest")
+        with self._lock:
+            if method == "POST" and not job_id:
+                job_id = f"750{len(self.jobs) + 1:015d}"
+                self.jobs[job_id] = dict(json.loads(payload), id=job_id, state="Open")
+                return 200, {key: value for key, value in self.jobs[job_id].items()}
+            job = self.jobs.get(job_id)
+            if job is None:
+                return 404, [{"errorCode": "NOT_FOUND", "message": f"Job {job_id} not found"}]
+            if method == "PUT" and rest == "/batches":
+                job["data"] = payload.decode("utf-8")
+                return 201, None
+            if method == "PATCH" and not rest:
+                self.ingest(job)
+            if method == "GET" and rest == "/failedResults":
+                return 200, self._failed_results(job)
+            return 200, {key: value for key, value in job.items() if key not in ("data", "failed")}
+
+    def route(self, path, page_size):
+        """Answers one GET request, returning (status, body)."""
+        url = urlparse(path)
+        if "/jobs/ingest" in url.path:
+            return self.route_ingest("GET", path, None)
+        if "/jobs/query" in url.path:
+            return self.route_query_job("GET", path, None)
+        try:
+            describe = re.search(r"/sobjects/(\w+)/describe/?$", url.path)
+            if describe:
+                return 200, self.describe(describe.group(1))
+            if re.search(r"/(query|queryAll)/?$", url.path):
+                return 200, self.query(parse_qs(url.query)["q"][0], page_size)
+            if re.search(r"/(query|queryAll)/", url.path):
+                cursor, offset = url.path.rstrip("/").rsplit("/", 1)[1].rsplit("-", 1)
+                return 200, self.page(cursor, int(offset), page_size)
+            if re.search(r"/services/data/v[\d.]+/?$", url.path):
+                return 200, {"query": url.path + "query"}
+            return 404, [{"errorCode": "NOT_FOUND", "message": url.path}]
+        except (KeyError, ValueError) as e:
+            return 400, [{"errorCode": "MALFORMED_QUERY", "message": str(e)}]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                page_size = server.page_size
+                match = re.search(r"batchSize=(\d+)", self.headers.get("Sforce-Query-Options") or "")
+                if match:
+                    page_size = int(match.group(1))
+                self.send(*server.route(self.path, page_size))
+
+            def do_PUT(self):
+                self.send(*server.route_ingest("PUT", self.path, self.read_body()))
+
+            def do_PATCH(self):
+                self.send(*server.route_ingest("PATCH", self.path, self.read_body()))
+
+            def read_body(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def do_POST(self):
+                body = self.read_body()
+                if "/jobs/ingest" in urlparse(self.path).path:
+                    return self.send(*server.route_ingest("POST", self.path, body))
+                if "/jobs/query" in urlparse(self.path).path:
+                    return self.send(*server.route_query_job("POST", self.path, body))
+                payload = json.loads(body or b"{}")
+                if not re.search(r"/composite/batch/?$", urlparse(self.path).path):
+                    return self.send(404, [{"errorCode": "NOT_FOUND", "message": self.path}])
+                results = []
+                for request in payload.get("batchRequests", [])[:25]:
+                    status, body = server.route(f"/services/data/{request['url']}", server.page_size)[:2]
+                    results.append({"statusCode": status, "result": body})
+                self.send(200, {"hasErrors": any(result["statusCode"] >= 300 for result in results), "results": results})
+
+            def send(self, status, body, headers=None):
+                content_type = "application/json;charset=UTF-8"
+                if isinstance(body, str):
+                    content_type = "text/csv"
+                    payload = body.encode()
+                else:
+                    payload = json.dumps(body).encode() if body is not None else b""
+                gzipped = "gzip" in (self.headers.get("Accept-Encoding") or "")
+                if gzipped:
+                    payload = gzip.compress(payload, compresslevel=1)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                if gzipped:
+                    self.send_header("Content-Encoding", "gzip")
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                with server._lock:
+                    server.requests += 1
+                    server.bytes_sent += len(payload)
+
+        return Handler
+
+
+def write_self_signed_certificate(cert_dir):
+    """
+    Writes a certificate and key for 127.0.0.1, valid for one day.
+
+    Returns:
+        tuple: (certificate file, key file). Point `REQUESTS_CA_BUNDLE` at the
+        certificate file to trust it.
+    """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .add_extension(
+            x509.KeyUsage(
+                digital_signature=True, content_commitment=False, key_encipherment=False, data_encipherment=False,
+                key_agreement=False, key_cert_sign=True, crl_sign=False, encipher_only=False, decipher_only=False,
+            ),
+            critical=True,
+        )
+        .sign(key, hashes.SHA256())
+    )
+
+    os.makedirs(cert_dir, exist_ok=True)
+    cert_file = os.path.join(cert_dir, "fake_salesforce.pem")
+    key_file = os.path.join(cert_dir, "fake_salesforce.key")
+    with open(cert_file, "wb") as file:
+        file.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, "wb") as file:
+        file.write(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+    return cert_file, key_file
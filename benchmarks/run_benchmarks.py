@@ -0,0 +1,371 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_salesforce import FakeSalesforce
+from benchmarks.synthetic import generate_dataset
+from salesforce.model import DEFAULT_CACHE_DIR, load_dbml_model, model_cache_file
+from salesforce.planner import STRATEGIES
+from salesforce.queries import generate_plan_from_dbml
+from sheets.diff import diff_snapshots
+from sheets.manager import SheetRows, compile_flattener, create_workbook, flatten_record
+from sheets.utils import iter_sheet_rows
+from validate_relationships import obj_master_parent_parse, validate_all_relationships
+
+# How the run's Summary describes each strategy of the plan, None for an empty table
+_LOGGED_BACKENDS = {
+    "empty": None,
+    "composite": " via Composite Batch",
+    "single": "",
+    "rest": "",
+    "chunked": " in Id range slices",
+    "bulk": " via Bulk API",
+    "cached": " from the query cache",
+    "spooled": " from the run's spool",
+}
+# Org alias the extract runs against; its session is pre-seeded so the `sf` CLI is never called
+BENCHMARK_ALIAS = "bench"
+DEFAULT_RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+def _timed(func):
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True, capture_output=True, check=True
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _prepare_workspace(workspace, dbml_file, instance_url):
+    """
+    Lays out a working directory main.py can run in: config, DBML, its
+    cached model and a cached session. The model is parsed at most once,
+    so the extract timings leave out DBML parsing.
+    """
+    config_dir = os.path.join(workspace, "config")
+    os.makedirs(config_dir, exist_ok=True)
+    shutil.copy(dbml_file, config_dir)
+
+    load_dbml_model(dbml_file)
+    model_dir = os.path.join(workspace, DEFAULT_CACHE_DIR)
+    os.makedirs(model_dir, exist_ok=True)
+    shutil.copy(model_cache_file(dbml_file), model_cache_file(dbml_file, model_dir))
+    with open(os.path.join(config_dir, "config.json"), "w") as file:
+        json.dump({"org_alias": BENCHMARK_ALIAS, "api_version": "62.0"}, file)
+
+    session_dir = os.path.join(workspace, ".cache", "sessions")
+    os.makedirs(session_dir, mode=0o700)
+    session_file = os.path.join(session_dir, f"{BENCHMARK_ALIAS}.json")
+    fd = os.open(session_file, os.O_WRONLY | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "w") as file:
+        json.dump({"instance_url": instance_url, "access_token": "benchmark"}, file)
+
+
+def _run_extract(dbml_file, dataset, workspace, latency, extra_args):
+    """
+    Runs `main.py --extract` in a new workspace against a fake Salesforce server.
+
+    Returns:
+        tuple: (seconds, completed process, requests served, bytes sent).
+    """
+    with FakeSalesforce(dataset, latency=latency, cert_dir=os.path.join(workspace, "cert")) as server:
+        _prepare_workspace(workspace, dbml_file, server.instance_url)
+        env = dict(os.environ, REQUESTS_CA_BUNDLE=server.cert_file, PYTHONPATH=REPO_ROOT)
+        command = [
+            sys.executable, os.path.join(REPO_ROOT, "main.py"),
+            "--extract", os.path.basename(dbml_file),
+            *extra_args,
+        ]
+        elapsed, completed = _timed(lambda: subprocess.run(command, cwd=workspace, env=env, text=True, capture_output=True))
+        return elapsed, completed, server.requests, server.bytes_sent
+
+
+def bench_extract(dbml_file, dataset, workspace, latency, extra_args):
+    """
+    Runs `main.py --extract` end to end against a fake Salesforce server.
+
+    Returns:
+        tuple: (result dict, snapshot path).
+    """
+    trace_file = os.path.join(workspace, "trace.json")
+    elapsed, completed, requests_served, bytes_sent = _run_extract(
+        dbml_file, dataset, workspace, latency, ["--trace", trace_file, *extra_args]
+    )
+
+    snapshots = [name for name in os.listdir(workspace) if name.startswith(f"{BENCHMARK_ALIAS}_") and ".partial" not in name]
+    if completed.returncode != 0 or not snapshots:
+        raise Exception(f"Extract failed:\n{completed.stdout}{completed.stderr}")
+
+    with open(trace_file) as file:
+        trace = json.load(file)
+    result = {
+        "seconds": round(elapsed, 3),
+        "requests": requests_served,
+        "bytes": bytes_sent,
+        "peak_memory": trace.get("peak_memory"),
+        "phases": {
+            span["name"]: round(span["duration"], 3)
+            for span in trace["spans"]
+            if span["category"] == "phase"
+        },
+    }
+    return result, os.path.join(workspace, snapshots[0])
+
+
+def plan_strategies(dbml_file, dataset, workspace, latency, extra_args):
+    """
+    Runs `main.py --extract --plan` against a fake Salesforce server.
+
+    Returns:
+        dict: Object names mapped to the strategy keys of the printed plan.
+
+    Raises:
+        Exception: If the plan cannot be produced.
+    """
+    _, completed, _, _ = _run_extract(dbml_file, dataset, workspace, latency, ["--plan", *extra_args])
+    names = {description: strategy for strategy, description in STRATEGIES.items()}
+    strategies = {}
+    for line in completed.stderr.splitlines():
+        # Table rows of `format_plan`, after any org alias prefix
+        columns = re.split(r"\s{2,}", re.sub(r"^\[[^\]]*\] ", "", line).strip())
+        if len(columns) == 5 and columns[2] in names:
+            strategies[columns[0]] = names[columns[2]]
+    if completed.returncode != 0 or not strategies:
+        raise Exception(f"Plan failed:\n{completed.stdout}{completed.stderr}")
+    return strategies
+
+
+def check_plan_matches_run(strategies, snapshot):
+    """
+    Checks the backend the run logged for each object against the strategy
+    the plan predicted for it.
+
+    Raises:
+        Exception: If any object was extracted otherwise than planned.
+    """
+    logged = {}
+    for row in iter_sheet_rows(snapshot, "Summary"):
+        match = re.match(r"(?:Retrieved \d+ records|No records retrieved) for (\S+)(.*)", str(row[2]))
+        if match and row[1] == "Retrieve Records":
+            logged[match.group(1)] = match.group(2) if row[2].startswith("Retrieved") else None
+    mismatches = [
+        f"{object_name}: planned {strategy}, logged {logged.get(object_name)!r}"
+        for object_name, strategy in strategies.items()
+        if logged.get(object_name, "missing") != _LOGGED_BACKENDS[strategy]
+    ]
+    if mismatches:
+        raise Exception("The run did not follow the plan:\n" + "\n".join(mismatches))
+
+
+def check_bulk_matches_rest(rest_snapshot, bulk_snapshot):
+    """
+    Diffs the snapshots of the REST and Bulk API extracts of the same data.
+
+    Raises:
+        Exception: If any record differs, listing the first differences.
+    """
+    changes = list(diff_snapshots(rest_snapshot, bulk_snapshot, [])["Changes"].rows)
+    if changes:
+        raise Exception(
+            f"Bulk API extract differs from REST in {len(changes)} places, e.g.:\n"
+            + "\n".join(str(change) for change in changes[:5])
+        )
+
+
+def bench_flatten(plan, dataset):
+    """Times both flattening paths over the widest table's records."""
+    object_name = max(plan, key=lambda name: len(plan[name]["fields"]))
+    fields = plan[object_name]["fields"]
+    records = dataset[object_name]
+    headers = [key for key in flatten_record(records[0]) if key not in ("attributes.type", "attributes.url") and not key.endswith(".attributes")]
+
+    def with_record():
+        for record in records:
+            flattened = flatten_record(record)
+            [flattened.get(header, "") for header in headers]
+
+    def with_plan():
+        flattener = compile_flattener(fields)
+        for record in records:
+            flattener(record)
+
+    return {
+        "object": object_name,
+        "columns": len(fields),
+        "flatten_record": round(_timed(with_record)[0], 3),
+        "compile_flattener": round(_timed(with_plan)[0], 3),
+    }
+
+
+def bench_workbook(plan, dataset, workspace):
+    """Times writing every table to an xlsx workbook from tabulated rows."""
+    data = {
+        object_name: SheetRows(list(plan[object_name]["fields"]), map(compile_flattener(plan[object_name]["fields"]), records))
+        for object_name, records in dataset.items()
+    }
+    filename = os.path.join(workspace, "workbook.xlsx")
+    elapsed, _ = _timed(lambda: create_workbook(data, filename, [["Time", "Action", "Details", "Artifact", "Outcome"]]))
+    return {"seconds": round(elapsed, 3), "file_bytes": os.path.getsize(filename)}
+
+
+def bench_validate(dbml_file, plan, snapshot):
+    """Times the relationship validators over the extracted snapshot."""
+    elapsed, report = _timed(lambda: validate_all_relationships(dbml_file, snapshot))
+    result = {
+        "validate_all_relationships": round(elapsed, 3),
+        "relationships": len(report["relationships"]),
+    }
+
+    # The per-object validator prints its progress; keep it out of the results
+    object_name = next(
+        (name for name, table_plan in plan.items() if any(ref["not_null"] for ref in table_plan.get("refs", ()))),
+        None,
+    )
+    if object_name:
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, _ = _timed(lambda: obj_master_parent_parse(dbml_file, snapshot, object_name))
+        result["obj_master_parent_parse"] = round(elapsed, 3)
+        result["object"] = object_name
+    return result
+
+
+def run(dbml_file, sizes, latency=0.0, extra_args=()):
+    """
+    Benchmarks the extract (over REST and Bulk API query jobs), flatten,
+    write and validate paths at each size. The REST and Bulk API snapshots
+    must hold the same records, and each extract must use the backends
+    its `--plan` predicts.
+
+    Args:
+        dbml_file (str): Path to the DBML file describing the tables.
+        sizes (list): Records generated per table, one run each.
+        latency (float): Seconds the fake server adds to every request.
+        extra_args (iterable): Extra `main.py` arguments for the extract run.
+
+    Returns:
+        dict: The results, with the environment they were measured in.
+    """
+    plan = generate_plan_from_dbml(dbml_file)
+    if not plan:
+        raise Exception(f"No tables found in {dbml_file}.")
+
+    results = []
+    for rows in sizes:
+        print(f"{rows} records per table, {len(plan)} tables")
+        dataset = generate_dataset(plan, rows)
+        workspace = tempfile.mkdtemp(prefix="sc-datatool-bench-")
+        try:
+            rest_args = ["--bulk-threshold", "0", *extra_args]
+            extract, snapshot = bench_extract(dbml_file, dataset, workspace, latency, rest_args)
+            print(f"  extract   {extract['seconds']:8.3f}s  {extract['requests']} requests")
+            check_plan_matches_run(plan_strategies(dbml_file, dataset, os.path.join(workspace, "plan"), latency, rest_args), snapshot)
+            # Every table with records goes through Bulk API query jobs, small ones included:
+            # the bulk threshold takes precedence over the composite threshold
+            bulk_workspace = os.path.join(workspace, "bulk")
+            bulk_args = ["--bulk-threshold", "1", *extra_args]
+            extract_bulk, bulk_snapshot = bench_extract(dbml_file, dataset, bulk_workspace, latency, bulk_args)
+            print(f"  bulk      {extract_bulk['seconds']:8.3f}s  {extract_bulk['requests']} requests")
+            check_bulk_matches_rest(snapshot, bulk_snapshot)
+            check_plan_matches_run(
+                plan_strategies(dbml_file, dataset, os.path.join(workspace, "plan_bulk"), latency, bulk_args), bulk_snapshot
+            )
+            flatten = bench_flatten(plan, dataset)
+            print(f"  flatten   {flatten['flatten_record']:8.3f}s flatten_record, {flatten['compile_flattener']:.3f}s compile_flattener")
+            workbook = bench_workbook(plan, dataset, workspace)
+            print(f"  workbook  {workbook['seconds']:8.3f}s")
+            validate = bench_validate(dbml_file, plan, snapshot)
+            print(f"  validate  {validate['validate_all_relationships']:8.3f}s")
+        finally:
+            shutil.rmtree(workspace, ignore_errors=True)
+        results.append({
+            "rows": rows,
+            "extract": extract,
+            "extract_bulk": extract_bulk,
+            "flatten": flatten,
+            "workbook": workbook,
+            "validate": validate,
+        })
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "dbml": os.path.basename(dbml_file),
+        "latency": latency,
+        "results": results,
+    }
+
+
+def _timings(report):
+    """Flattens a report's timings to {(rows, measurement): seconds}."""
+    timings = {}
+    for result in report["results"]:
+        rows = result["rows"]
+        timings[(rows, "extract")] = result["extract"]["seconds"]
+        if "extract_bulk" in result:
+            timings[(rows, "extract_bulk")] = result["extract_bulk"]["seconds"]
+        for name in ("flatten_record", "compile_flattener"):
+            timings[(rows, name)] = result["flatten"][name]
+        timings[(rows, "create_workbook")] = result["workbook"]["seconds"]
+        for name in ("validate_all_relationships", "obj_master_parent_parse"):
+            if name in result["validate"]:
+                timings[(rows, name)] = result["validate"][name]
+    return timings
+
+
+def compare(previous, current):
+    """Prints each timing next to the same measurement in a previous report."""
+    before = _timings(previous)
+    print(f"Compared with {previous.get('commit') or 'previous run'} ({previous.get('timestamp')})")
+    for (rows, name), seconds in _timings(current).items():
+        if (rows, name) not in before:
+            continue
+        old = before[(rows, name)]
+        change = f"{(seconds - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {rows:>8} {name:<28} {old:8.3f}s -> {seconds:8.3f}s  {change}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark extraction, writing and validation offline")
+    parser.add_argument("-d", "--dbml", default="config/MinProducts.dbml", help="Path to the DBML file")
+    parser.add_argument("-s", "--sizes", default="1000,5000", help="Comma-separated records per table, one run each")
+    parser.add_argument("-l", "--latency", type=float, default=0.0, help="Seconds the fake server adds to every request")
+    parser.add_argument("-o", "--output", help="Results file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("-c", "--compare", metavar="PREVIOUS", help="Compare with a previous results file")
+    parser.add_argument("extract_args", nargs="*", help="Extra main.py arguments for the extract run, after --")
+
+    args = parser.parse_args()
+    report = run(os.path.abspath(args.dbml), [int(size) for size in args.sizes.split(",")], args.latency, args.extract_args)
+
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"{datetime.now().strftime('%Y-%m-%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), report)
@@ -0,0 +1,115 @@
+from salesforce.subset import order_plan_by_refs
+
+# API version used in synthetic record URLs
+API_VERSION = "62.0"
+
+
+def make_id(prefix, index):
+    """
+    Builds an 18 character record Id that sorts in index order.
+
+    Args:
+        prefix (str): Three character key prefix of the object.
+        index (int): Row number.
+
+    Returns:
+        str: e.g. `a01000000000000042`.
+    """
+    return f"{prefix}{index:015d}"
+
+
+def _value(field, field_type, index):
+    if field_type == "boolean":
+        return index % 2 == 0
+    if field_type == "integer":
+        return index
+    if field_type == "double":
+        return index * 1.5
+    return f"{field} {index}"
+
+
+def make_record(object_name, fields, index, types=None, record_id=None, lookups=None):
+    """
+    Builds a synthetic REST API record for the given field plan.
+
+    Args:
+        object_name (str): The object the record belongs to.
+        fields (list): Field paths from the table plan.
+        index (int): Row number, used to vary the values.
+        types (list, optional): Logical type of each field, defaulting to string.
+        record_id (str, optional): Value of the `Id` field.
+        lookups (dict, optional): Lookup fields mapped to the referenced
+            record's Id, or None for a null lookup.
+
+    Returns:
+        dict: A record shaped like a `simple_salesforce` query result.
+    """
+    types = types or ["string"] * len(fields)
+    lookups = lookups or {}
+    record = {"attributes": {"type": object_name, "url": f"/services/data/v{API_VERSION}/sobjects/{object_name}/{index}"}}
+    for field, field_type in zip(fields, types):
+        if "." in field:
+            relationship, sub_field = field.split(".", 1)
+            # Every tenth lookup is null, as in real data
+            record[relationship] = None if index % 10 == 0 else {
+                "attributes": {"type": relationship, "url": ""},
+                sub_field: f"{relationship} {index}",
+            }
+        elif field == "Id" and record_id:
+            record[field] = record_id
+        elif field in lookups:
+            record[field] = lookups[field]
+        else:
+            record[field] = _value(field, field_type, index)
+    return record
+
+
+def generate_dataset(plan, rows):
+    """
+    Generates records for every table in a plan, with lookups pointing at
+    records generated for the referenced tables.
+
+    Every table gets `rows` records. Lookups to tables in the plan reference
+    one of their records (every tenth optional lookup is null); lookups to
+    other objects, or to tables placed later by a reference cycle, get Ids
+    that match nothing.
+
+    Args:
+        plan (dict): Object names mapped to table plans from `generate_plan_from_dbml`.
+        rows (int): Records per table.
+
+    Returns:
+        dict: Object names mapped to lists of records, in plan order.
+    """
+    ordered = order_plan_by_refs(plan)
+    prefixes = {object_name: f"a{position:02d}" for position, object_name in enumerate(plan)}
+    ids = {}
+    dataset = {}
+    for object_name, table_plan in ordered.items():
+        prefix = prefixes[object_name]
+        ids[object_name] = [make_id(prefix, index) for index in range(rows)]
+
+        lookup_refs = {ref["column"]: ref for ref in table_plan.get("refs", ()) if ref["type"] == ">"}
+        records = []
+        for index in range(rows):
+            lookups = {}
+            for column, ref in lookup_refs.items():
+                if index % 10 == 0 and not ref["not_null"]:
+                    lookups[column] = None
+                elif ref["table"] in ids:
+                    parent_ids = ids[ref["table"]]
+                    # Spread children over the parents, several per parent
+                    lookups[column] = parent_ids[(index * 7) % len(parent_ids)]
+                else:
+                    lookups[column] = make_id("zzz", index)
+            records.append(make_record(
+                object_name,
+                table_plan["fields"],
+                index,
+                table_plan.get("types"),
+                ids[object_name][index],
+                lookups,
+            ))
+        dataset[object_name] = records
+
+    return {object_name: dataset[object_name] for object_name in plan}
@@ -2,10 +2,31 @@ import argparse
 import json
 import logging
 import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from salesforce.auth import get_salesforce_connection
-from salesforce.queries import query_objects, generate_soql_from_dbml
-from sheets.manager import create_workbook
+from salesforce.cache import DEFAULT_CACHE_MAX_BYTES, DEFAULT_CACHE_TTL, QueryCache
+from salesforce.composite import DEFAULT_COMPOSITE_THRESHOLD
+from salesforce.extraction import (
+    DEFAULT_BULK_THRESHOLD,
+    DEFAULT_ORG_CONCURRENCY,
+    DEFAULT_WORKERS,
+    get_org_limiter,
+    iter_sheet_data,
+    run_extractions,
+)
+from salesforce.incremental import load_watermarks, save_watermarks
+from salesforce.operations import DEFAULT_MAX_LOGGED_FAILURES, DEFAULT_UPSERT_WORKERS, upsert_snapshot
+from salesforce.planner import count_tables, format_plan, plan_extraction, schedule_order
+from salesforce.queries import generate_plan_from_dbml
+from salesforce.spool import RunSpool, new_run_id
+from sheets.diff import DEFAULT_MAX_INDEX_RECORDS, diff_snapshots
+from sheets.formats import FORMAT_EXTENSIONS, write_snapshot
+from sheets.manager import DEFAULT_WORKBOOK_ROWS, DEFAULT_WORKBOOK_WORKERS
+from sheets.utils import SnapshotReader, companion_filename, companion_workbooks
+from telemetry.tracing import describe_span, get_tracer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(message)s')
@@ -14,111 +35,605 @@ logging.basicConfig(level=logging.INFO, format='%(message)s')
 def main():
     # Parse arguments
     parser = argparse.ArgumentParser(description="Salesforce Data Tool")
+    parser.add_argument(
+        "-o", "--org",
+        action="append",
+        default=[],
+        metavar="ALIAS",
+        help="Org alias to extract from or upsert into (repeatable; default org_aliases or org_alias in config.json)",
+        required=False
+    )
     parser.add_argument(
         "-e", "--extract", 
         metavar="DBML_FILE", 
         help="Extract data based on the provided .dbml file",
         required=False
     )
-    # Additional operations can be added here
-    # parser.add_argument("--upsert", metavar="DBML_FILE", help="Upsert operation", required=False)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        metavar="N",
+        help="Records per query page requested from Salesforce (200-2000)",
+        required=False
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        metavar="N",
+        help=f"Number of objects to extract in parallel (default {DEFAULT_WORKERS})",
+        required=False
+    )
+    parser.add_argument(
+        "--bulk",
+        action="append",
+        default=[],
+        metavar="OBJECT",
+        help="Extract OBJECT with the Bulk API 2.0 (repeatable)",
+        required=False
+    )
+    parser.add_argument(
+        "--bulk-threshold",
+        type=int,
+        metavar="N",
+        help=f"Use the Bulk API 2.0 for objects with at least N records, 0 to disable "
+             f"(default {DEFAULT_BULK_THRESHOLD})",
+        required=False
+    )
+    parser.add_argument(
+        "--composite-threshold",
+        type=int,
+        metavar="N",
+        help=f"Fetch objects with at most N records in Composite Batch requests of up to 25 queries, "
+             f"unless they reach the bulk threshold, 0 to disable (default {DEFAULT_COMPOSITE_THRESHOLD})",
+        required=False
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        metavar="N",
+        help="Split REST objects with more than N records into Id range slices fetched concurrently",
+        required=False
+    )
+    parser.add_argument(
+        "--subset",
+        action="store_true",
+        help="Only extract the children of filtered parents, following ref: > relationships",
+        required=False
+    )
+    parser.add_argument(
+        "-i", "--incremental",
+        action="store_true",
+        help="Only fetch records changed since the last run and merge them into its snapshot",
+        required=False
+    )
+    parser.add_argument(
+        "-f", "--format",
+        choices=sorted(FORMAT_EXTENSIONS),
+        help="Snapshot output format (default xlsx)",
+        required=False
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Count every table and print the strategy, API calls and time each would take, without extracting",
+        required=False
+    )
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Reuse result sets of recent runs stored in .cache/queries, and store new ones "
+             "(default query_cache in config.json, off)",
+        required=False
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Run every query again and replace its cached results (implies --cache)",
+        required=False
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="RUN_ID",
+        help="Resume a failed run from its spooled pages, with the arguments it was started with",
+        required=False
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Write phase, object and page timings to FILE",
+        required=False
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=["json", "chrome"],
+        default="json",
+        help="Timing file format: json spans or a Chrome trace (default json)",
+        required=False
+    )
+    parser.add_argument(
+        "-u", "--upsert",
+        metavar="DBML_FILE",
+        help="Upsert the tables of the .dbml file from a snapshot with the Bulk API 2.0, parents first",
+        required=False
+    )
+    parser.add_argument(
+        "--diff",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="Compare two snapshots by record Id and write the added, removed and changed records",
+        required=False
+    )
+    parser.add_argument(
+        "--snapshot",
+        metavar="FILE",
+        help="Snapshot written by --extract to upsert from",
+        required=False
+    )
     args = parser.parse_args()
 
-    if args.extract:
-        dbml_file_path = os.path.join("config", args.extract)
+    if args.diff:
+        diff_command(*args.diff, args)
+        return
+
+    spool = None
+    if args.resume:
+        try:
+            spool = RunSpool.open(args.resume)
+        except Exception as e:
+            logging.error(str(e))
+            return
+        # The spooled pages only fit the run's original plan and options
+        for name, value in spool.arguments.items():
+            setattr(args, name, value)
+        logging.info(f"Resuming run {spool.run_id}...")
+
+    if args.extract or args.upsert:
+        dbml_file_path = os.path.join("config", args.extract or args.upsert)
         if not os.path.exists(dbml_file_path):
             logging.error(f"The file {dbml_file_path} does not exist.")
             return
     else:
-        logging.error("No operation specified. Use --extract with a .dbml file.")
+        logging.error("No operation specified. Use --extract or --upsert with a .dbml file.")
+        return
+    if args.extract and args.upsert:
+        logging.error("--extract and --upsert cannot be combined.")
+        return
+    if args.upsert and not (args.snapshot and os.path.exists(args.snapshot)):
+        logging.error("--upsert needs --snapshot FILE, an existing snapshot written by --extract.")
+        return
+    if args.subset and args.incremental:
+        logging.error("--subset and --incremental cannot be combined.")
+        return
+    if args.plan and args.incremental:
+        logging.error("--plan and --incremental cannot be combined.")
+        return
+    if (args.cache or args.refresh) and args.incremental:
+        logging.error("--cache and --incremental cannot be combined.")
         return
 
+    tracer = get_tracer()
     try:
         # Load configuration
         logging.info("Loading configuration...")
         with open("config/config.json") as config_file:
             config = json.load(config_file)
+        org_aliases = args.org or config.get("org_aliases") or [config["org_alias"]]
 
         # Parse .dbml file to generate SOQL queries
         logging.info(f"Generating SOQL queries from {dbml_file_path} using PyDBML...")
-        queries = generate_soql_from_dbml(dbml_file_path)
+        with tracer.span("Parse DBML"):
+            plan = generate_plan_from_dbml(dbml_file_path)
 
-        if not queries:
+        if not plan:
             logging.error("No valid queries generated from the .dbml file.")
             return
 
+        if args.upsert:
+            for org_alias in org_aliases:
+                upsert_org(org_alias, plan, args, config)
+        elif len(org_aliases) == 1:
+            extract_org(org_aliases[0], plan, args, config, spool)
+        else:
+            run_orgs(org_aliases, plan, args, config)
+
+    except Exception as e:
+        logging.error(f"An unexpected error occurred: {e}")
+    finally:
+        if args.trace:
+            tracer.export(args.trace, args.trace_format)
+            logging.info(f"Timings written to {args.trace}")
+
+
+def extract_org(org_alias, plan, args, config, spool=None):
+    """
+    Extracts the plan from one org and writes its snapshot.
+
+    Args:
+        org_alias (str): The Salesforce org alias.
+        plan (dict): Object names mapped to table plans from `generate_plan_from_dbml`.
+        args (argparse.Namespace): The command line arguments.
+        config (dict): The loaded config.json.
+        spool (RunSpool, optional): The spool of a run being resumed.
+
+    Returns:
+        dict: The org's run summary: `org_alias`, `status` (`success`,
+        `partial` when some objects failed, `planned` for `--plan`, or
+        `failed`), `output`, `failed_objects`, `run_id` and `seconds`.
+    """
+    tracer = get_tracer()
+    summary = {"org_alias": org_alias, "status": "failed", "output": None, "failed_objects": [], "run_id": None}
+    started = time.perf_counter()
+    try:
         # Authenticate with Salesforce
-        logging.info(f"Authenticating with Salesforce org {config['org_alias']}...")
-        sf = get_salesforce_connection(config["org_alias"])
+        logging.info(f"Authenticating with Salesforce org {org_alias}...")
+        # Every concurrent request against the org gets its own pooled connection
+        org_limit = config.get("max_concurrent_queries", DEFAULT_ORG_CONCURRENCY)
+        with tracer.span("Authenticate"):
+            sf = get_salesforce_connection(org_alias, pool_size=org_limit)
 
         if not sf:
             logging.error("Failed to connect to Salesforce.")
-            return
+            return summary
+
+        bulk_threshold = args.bulk_threshold
+        if bulk_threshold is None:
+            bulk_threshold = config.get("bulk_threshold", DEFAULT_BULK_THRESHOLD)
+        composite_threshold = args.composite_threshold
+        if composite_threshold is None:
+            composite_threshold = config.get("composite_threshold", DEFAULT_COMPOSITE_THRESHOLD)
+        options = {
+            "batch_size": args.batch_size or config.get("batch_size"),
+            "bulk_threshold": bulk_threshold,
+            "composite_threshold": composite_threshold,
+            "bulk_objects": set(args.bulk),
+            "chunk_size": args.chunk_size or config.get("chunk_size"),
+            "chunk_workers": config.get("chunk_workers"),
+            "subset": args.subset,
+            "max_soql_length": config.get("max_soql_length"),
+        }
+
+        # Extract the base name of the .dbml file without the extension
+        dbml_base_name = os.path.splitext(os.path.basename(args.extract))[0]
+        if args.incremental:
+            state = load_watermarks(org_alias, dbml_base_name)
+            options.update({
+                "incremental": True,
+                "watermarks": state["watermarks"],
+                # Opened once for every object's merge, and only loaded if an object needs it
+                "previous_snapshot": SnapshotReader(state["snapshot"]) if state["snapshot"] else None,
+            })
+            logging.info(f"Incremental run against snapshot {state['snapshot'] or '(none)'}")
+
+        query_cache = _query_cache(args, config)
+        if query_cache is not None:
+            options.update({"query_cache": query_cache, "org_alias": org_alias})
+            if query_cache.refresh:
+                logging.info(f"Refreshing the query cache in {query_cache.cache_dir}")
 
-        # Prepare data structures for the workbook
-        workbook_data = {}
+        # Count every table up front to pick each one's strategy and start the biggest first
+        workers = args.workers or config.get("workers", DEFAULT_WORKERS)
+        if args.plan or (config.get("preflight", True) and not args.incremental):
+            with tracer.span("Plan extraction"):
+                # Cached tables and those a resumed run spooled in full are not counted again;
+                # their entries know how many records they hold
+                spooled = spool.completed_objects() if spool is not None else {}
+                cached = {}
+                if query_cache is not None:
+                    for object_name, table_plan in plan.items():
+                        if object_name in spooled:
+                            continue
+                        entry = query_cache.lookup(org_alias, table_plan["soql"])
+                        if entry is not None:
+                            cached[object_name] = entry.records
+                counts = count_tables(
+                    sf,
+                    {
+                        object_name: table_plan
+                        for object_name, table_plan in plan.items()
+                        if object_name not in cached and object_name not in spooled
+                    },
+                    get_org_limiter(org_alias, org_limit),
+                    org_limit,
+                    batched=bool(composite_threshold),
+                )
+                counts.update(cached)
+                counts.update(spooled)
+                extraction_plan = plan_extraction(
+                    plan, counts, dict(options, cached=set(cached), spooled=set(spooled)), workers, config.get("plan_costs")
+                )
+            if args.plan:
+                for line in format_plan(extraction_plan):
+                    logging.info(line)
+                if args.subset:
+                    logging.info("A subset extraction only fetches part of these records.")
+                summary["status"] = "planned"
+                return summary
+            logging.info(
+                f"Planned {extraction_plan['records']} records in about {extraction_plan['api_calls']} API calls "
+                f"and {extraction_plan['seconds']}s"
+            )
+            options["counts"] = counts
+            if not args.subset:
+                options["schedule"] = schedule_order(extraction_plan)
+
+        if spool is None and config.get("spool", True):
+            arguments = {
+                name: getattr(args, name)
+                for name in (
+                    "extract", "batch_size", "workers", "bulk", "bulk_threshold",
+                    "composite_threshold", "chunk_size", "subset", "incremental", "format",
+                )
+            }
+            spool = RunSpool.create(new_run_id(org_alias, dbml_base_name), dict(arguments, org=[org_alias]))
+            logging.info(f"Spooling retrieved pages for run {spool.run_id}")
+        options["spool"] = spool
+        summary["run_id"] = spool.run_id if spool is not None else None
+
+        # Prepare the Summary log
         log_data = [
             ["Time", "Action", "Details", "Artifact", "Outcome"]
         ]
+        log_data.extend(tracer.summary_rows("phase"))
 
         # Query data for all objects
-        logging.info(f"Querying data from Salesforce org {config['org_alias']}...")
-        for object_name, soql_query in queries.items():
-            try:
-                # Log query start
-                log_data.append([
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "Run Query",
-                    f"On {object_name}",
-                    soql_query,
-                    "In Progress"
-                ])
-
-                # Execute query
-                data = query_objects(sf, soql_query)
-
-                if data:
-                    logging.info(f"Retrieved {len(data)} records for {object_name}.")
-                    workbook_data[object_name] = data
-
-                    # Update log for success
-                    log_data.append([
-                        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "Retrieve Records",
-                        f"Retrieved {len(data)} records for {object_name}",
-                        f"Sheet {object_name} in Workbook",
-                        "Success"
-                    ])
-                else:
-                    logging.warning(f"No data retrieved for {object_name}.")
-                    log_data.append([
-                        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "Retrieve Records",
-                        f"No records retrieved for {object_name}",
-                        "",
-                        "No Data"
-                    ])
-            except Exception as e:
-                logging.error(f"Error querying {object_name}: {e}")
-                log_data.append([
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "Error querying Salesforce",
-                    f"{e}",
-                    soql_query,
-                    "Failure"
-                ])
-
-        # Create and save the workbook
-        # Extract the base name of the .dbml file without the extension
-        dbml_base_name = os.path.splitext(os.path.basename(args.extract))[0]
-        # Create and save the workbook with the constructed filename
-        output_file = os.path.join(os.getcwd(), f"{config['org_alias']}_{datetime.now().strftime('%Y-%m-%d')}_{dbml_base_name}.xlsx")
-        logging.info("Creating workbook...")
-        create_workbook(workbook_data, output_file, log_data)
+        logging.info(f"Querying data from Salesforce org {org_alias} "
+                     f"with {workers} worker(s)...")
+        streams = run_extractions(
+            sf, plan, workers, get_org_limiter(org_alias, org_limit), options
+        )
+
+        # Create and save the snapshot with the constructed filename
+        output_format = args.format or config.get("output_format", "xlsx")
+        extension = FORMAT_EXTENSIONS[output_format]
+        output_file = os.path.join(os.getcwd(), f"{org_alias}_{datetime.now().strftime('%Y-%m-%d')}_{dbml_base_name}{extension}")
+        # The previous snapshot may be today's file, so never write over it while reading it
+        partial_file = f"{os.path.splitext(output_file)[0]}.partial{extension}"
+        schema = {
+            object_name: dict(zip(table_plan["fields"], table_plan["types"]))
+            for object_name, table_plan in plan.items()
+        }
+        logging.info(f"Creating {output_format} snapshot...")
+        try:
+            # Tables are written as each object's records stream in
+            with tracer.span("Extract and write snapshot") as span:
+                write_snapshot(
+                    output_format, iter_sheet_data(streams, log_data), partial_file, log_data, schema,
+                    workbook_options={
+                        "max_workbook_rows": config.get("max_workbook_rows", DEFAULT_WORKBOOK_ROWS),
+                        "workers": config.get("workbook_workers", DEFAULT_WORKBOOK_WORKERS),
+                    },
+                )
+            logging.info(f"Extracted and wrote the snapshot in {describe_span(span)}")
+        finally:
+            for stream in streams:
+                stream.cancel()
+            if options.get("previous_snapshot") is not None:
+                options["previous_snapshot"].close()
+        if os.path.isdir(output_file):
+            shutil.rmtree(output_file)
+        os.replace(partial_file, output_file)
+        # Oversized xlsx snapshots continue in companion workbooks named after the snapshot
+        for _, companion_file in companion_workbooks(output_file):
+            os.remove(companion_file)
+        for part, companion_file in companion_workbooks(partial_file):
+            os.replace(companion_file, companion_filename(output_file, part))
+            logging.info(f"Data continued in {companion_filename(output_file, part)}")
         logging.info(f"Data saved to {output_file}")
+        summary["output"] = output_file
+        summary["failed_objects"] = [stream.object_name for stream in streams if stream.failed]
+        summary["status"] = "partial" if summary["failed_objects"] else "success"
+
+        if spool is not None:
+            if summary["failed_objects"]:
+                logging.warning(f"Some objects failed; retry them with --resume {spool.run_id}")
+            else:
+                spool.remove()
+
+        if query_cache is not None:
+            query_cache.evict()
+
+        if args.incremental:
+            # Objects that failed or had no sheet are extracted in full next time
+            watermarks = {
+                stream.object_name: stream.watermark
+                for stream in streams
+                if stream.watermark and not stream.failed
+            }
+            save_watermarks(org_alias, dbml_base_name, output_file, watermarks)
 
     except Exception as e:
         logging.error(f"An unexpected error occurred: {e}")
+        if spool is not None:
+            logging.error(f"Retrieved pages were kept; resume with --resume {spool.run_id}")
+    finally:
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def _query_cache(args, config):
+    """
+    Opens the query cache when `--cache`, `--refresh` or the `query_cache`
+    config key turns it on and `--no-cache` does not turn it off.
+
+    Returns:
+        QueryCache or None: The cache, or None when it is off or the run is incremental.
+    """
+    enabled = args.cache if args.cache is not None else args.refresh or config.get("query_cache", False)
+    if not enabled or args.incremental:
+        return None
+    return QueryCache(
+        ttl=config.get("cache_ttl", DEFAULT_CACHE_TTL),
+        max_bytes=config.get("cache_max_bytes", DEFAULT_CACHE_MAX_BYTES),
+        refresh=args.refresh,
+    )
+
+
+def upsert_org(org_alias, plan, args, config):
+    """
+    Upserts a snapshot's tables into one org and writes a workbook with the
+    Summary log, including every row Salesforce rejected.
+
+    Args:
+        org_alias (str): The Salesforce org alias to load into.
+        plan (dict): Object names mapped to table plans from `generate_plan_from_dbml`.
+        args (argparse.Namespace): The command line arguments.
+        config (dict): The loaded config.json.
+
+    Returns:
+        list: The `upsert_object` result of each object, or None if the
+        org could not be reached.
+    """
+    tracer = get_tracer()
+    logging.info(f"Authenticating with Salesforce org {org_alias}...")
+    org_limit = config.get("max_concurrent_queries", DEFAULT_ORG_CONCURRENCY)
+    with tracer.span("Authenticate"):
+        sf = get_salesforce_connection(org_alias, pool_size=org_limit)
+    if not sf:
+        logging.error("Failed to connect to Salesforce.")
+        return None
+
+    workers = args.workers or config.get("upsert_workers", DEFAULT_UPSERT_WORKERS)
+    options = {
+        "external_ids": config.get("external_ids"),
+        "max_job_bytes": config.get("max_job_bytes"),
+        "max_logged_failures": config.get("max_logged_failures", DEFAULT_MAX_LOGGED_FAILURES),
+    }
+    logging.info(f"Upserting {args.snapshot} into Salesforce org {org_alias} with {workers} worker(s)...")
+    with tracer.span("Upsert snapshot") as span:
+        results = upsert_snapshot(sf, plan, args.snapshot, workers, options)
+    logging.info(f"Upserted the snapshot in {describe_span(span)}")
+
+    log_data = [
+        ["Time", "Action", "Details", "Artifact", "Outcome"]
+    ]
+    log_data.extend(tracer.summary_rows("phase"))
+    for result in results:
+        log_data.extend(result["log_rows"])
+
+    dbml_base_name = os.path.splitext(os.path.basename(args.upsert))[0]
+    output_file = os.path.join(os.getcwd(), f"upsert_{org_alias}_{datetime.now().strftime('%Y-%m-%d')}_{dbml_base_name}.xlsx")
+    write_snapshot("xlsx", {}, output_file, log_data)
+    failed = [result["object"] for result in results if result["status"] in ("failed", "partial")]
+    if failed:
+        logging.warning(f"Some rows failed to load ({', '.join(failed)}); see the Summary in {output_file}")
+    logging.info(f"Upsert summary saved to {output_file}")
+    return results
+
+
+def diff_command(old_path, new_path, args):
+    """
+    Compares two snapshots and writes the differences, with a Summary of
+    the counts per table, in the requested snapshot format.
+
+    Args:
+        old_path (str): The earlier snapshot.
+        new_path (str): The later snapshot.
+        args (argparse.Namespace): The command line arguments.
+    """
+    for path in (old_path, new_path):
+        if not os.path.exists(path):
+            logging.error(f"The snapshot {path} does not exist.")
+            return
+
+    config = {}
+    if os.path.exists("config/config.json"):
+        with open("config/config.json") as config_file:
+            config = json.load(config_file)
+    tracer = get_tracer()
+    output_format = args.format or config.get("output_format", "xlsx")
+    names = [os.path.splitext(os.path.basename(path.rstrip(os.sep)))[0] for path in (old_path, new_path)]
+    output_file = os.path.join(os.getcwd(), f"diff_{names[0]}_to_{names[1]}{FORMAT_EXTENSIONS[output_format]}")
+
+    log_data = [
+        ["Time", "Action", "Details", "Artifact", "Outcome"]
+    ]
+    try:
+        logging.info(f"Comparing {old_path} with {new_path}...")
+        data = diff_snapshots(
+            old_path, new_path, log_data, config.get("diff_index_records", DEFAULT_MAX_INDEX_RECORDS)
+        )
+        with tracer.span("Compare snapshots") as span:
+            write_snapshot(output_format, data, output_file, log_data)
+        for log_row in log_data[1:]:
+            logging.info(log_row[2])
+        logging.info(f"Compared the snapshots in {describe_span(span)}")
+        logging.info(f"Differences saved to {output_file}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred: {e}")
+    finally:
+        if args.trace:
+            tracer.export(args.trace, args.trace_format)
+            logging.info(f"Timings written to {args.trace}")
+
+
+def _extract_org_process(org_alias, plan, args, config):
+    """Runs `extract_org` in a worker process, with the org alias on every log line."""
+    logging.basicConfig(level=logging.INFO, format=f"[{org_alias}] %(message)s", force=True)
+    try:
+        return extract_org(org_alias, plan, args, config)
+    finally:
+        if args.trace:
+            trace_file = _org_trace_file(args.trace, org_alias)
+            get_tracer().export(trace_file, args.trace_format)
+            logging.info(f"Timings written to {trace_file}")
+
+
+def _org_trace_file(trace_file, org_alias):
+    base, extension = os.path.splitext(trace_file)
+    return f"{base}_{org_alias}{extension}"
+
+
+def run_orgs(org_aliases, plan, args, config):
+    """
+    Extracts the plan from several orgs at once, one worker process per org,
+    and writes a combined run summary.
+
+    The DBML is parsed once and the plan handed to every worker. Each org
+    gets its own snapshot, spool, sessions and request limiter, so the run
+    takes about as long as the slowest org.
+
+    Args:
+        org_aliases (list): The Salesforce org aliases.
+        plan (dict): Object names mapped to table plans from `generate_plan_from_dbml`.
+        args (argparse.Namespace): The command line arguments.
+        config (dict): The loaded config.json.
+
+    Returns:
+        list: The run summary of each org, in the order given.
+    """
+    org_workers = min(len(org_aliases), config.get("org_workers") or len(org_aliases))
+    logging.info(f"Extracting from {len(org_aliases)} orgs with {org_workers} worker process(es)...")
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=org_workers) as executor:
+        futures = [
+            executor.submit(_extract_org_process, org_alias, plan, args, config)
+            for org_alias in org_aliases
+        ]
+        summaries = []
+        for org_alias, future in zip(org_aliases, futures):
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                logging.error(f"Error extracting from {org_alias}: {e}")
+                summaries.append({"org_alias": org_alias, "status": "failed", "output": None, "failed_objects": [], "run_id": None, "seconds": None})
+
+    dbml_base_name = os.path.splitext(os.path.basename(args.extract))[0]
+    summary_file = os.path.join(os.getcwd(), f"runs_{datetime.now().strftime('%Y-%m-%d')}_{dbml_base_name}.json")
+    with open(summary_file, "w") as file:
+        json.dump({
+            "dbml": args.extract,
+            "seconds": round(time.perf_counter() - started, 3),
+            "orgs": summaries,
+        }, file, indent=2)
+
+    for summary in summaries:
+        details = summary["output"] or "no snapshot"
+        if summary["failed_objects"]:
+            details += f", failed: {', '.join(summary['failed_objects'])}"
+        logging.info(f"{summary['org_alias']}: {summary['status']} ({details})")
+    logging.info(f"Run summary saved to {summary_file}")
+    return summaries
 
 
 if __name__ == "__main__":
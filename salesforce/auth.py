@@ -1,20 +1,232 @@
-from simple_salesforce import Salesforce
 import subprocess
+import threading
 import json
+import os
+import stat
+from telemetry.tracing import count_response_bytes
 
-def get_salesforce_connection(org_alias):
+# Directory holding cached sessions per org alias, relative to the working directory
+DEFAULT_SESSION_DIR = os.path.join(".cache", "sessions")
+# Connections kept alive per host in the shared HTTP session
+DEFAULT_POOL_SIZE = 10
+
+# One pooled HTTP session shared by every connection and query thread in the process
+_http_session = None
+# Org alias mapped to (connection, session directory), and access tokens mapped to their org alias
+_connections = {}
+_token_aliases = {}
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def _session_file(org_alias, session_dir):
+    return os.path.join(session_dir, f"{org_alias}.json")
+
+
+def load_cached_session(org_alias, session_dir=DEFAULT_SESSION_DIR):
+    """
+    Loads the cached instance URL and access token for an org alias.
+
+    A cache file readable by other users is ignored, so it gets rewritten
+    with owner-only permissions.
+
+    Args:
+        org_alias (str): The Salesforce org alias.
+        session_dir (str): Directory holding the cached sessions.
+
+    Returns:
+        dict or None: `{"instance_url": ..., "access_token": ...}`, or None if
+        there is no usable cached session.
+    """
+    session_file = _session_file(org_alias, session_dir)
     try:
-        result = subprocess.run(
-            ["sf", "org", "display", "-o", org_alias, "--json"],
-            text=True,
-            capture_output=True,
-            check=True,
-        )
-        auth_details = json.loads(result.stdout)
-        return Salesforce(
-            instance_url=auth_details["result"]["instanceUrl"],
-            session_id=auth_details["result"]["accessToken"]
+        if os.name == "posix" and stat.S_IMODE(os.stat(session_file).st_mode) & 0o077:
+            return None
+        with open(session_file, "r") as file:
+            auth = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not auth.get("instance_url") or not auth.get("access_token"):
+        return None
+    return auth
+
+
+def save_cached_session(org_alias, auth, session_dir=DEFAULT_SESSION_DIR):
+    """
+    Caches the instance URL and access token for an org alias, readable by
+    the current user only.
+
+    Args:
+        org_alias (str): The Salesforce org alias.
+        auth (dict): `{"instance_url": ..., "access_token": ...}`.
+        session_dir (str): Directory holding the cached sessions.
+    """
+    os.makedirs(session_dir, mode=0o700, exist_ok=True)
+    session_file = _session_file(org_alias, session_dir)
+    tmp_file = f"{session_file}.{os.getpid()}.tmp"
+    # Create the file with owner-only permissions before the token is written to it
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as file:
+        json.dump(auth, file)
+    os.chmod(tmp_file, 0o600)
+    os.replace(tmp_file, session_file)
+
+
+def fetch_cli_session(org_alias):
+    """
+    Reads the org's instance URL and access token from the `sf` CLI, which
+    refreshes the token if it has expired.
+
+    Args:
+        org_alias (str): The Salesforce org alias.
+
+    Returns:
+        dict: `{"instance_url": ..., "access_token": ...}`.
+
+    Raises:
+        Exception: If the CLI fails or returns no session.
+    """
+    result = subprocess.run(
+        ["sf", "org", "display", "-o", org_alias, "--json"],
+        text=True,
+        capture_output=True,
+        check=True,
+    )
+    auth_details = json.loads(result.stdout)
+    return {
+        "instance_url": auth_details["result"]["instanceUrl"],
+        "access_token": auth_details["result"]["accessToken"],
+    }
+
+
+def get_http_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Returns the pooled HTTP session shared by every Salesforce connection.
+
+    Connections are kept alive between requests and responses are requested
+    gzip-compressed. A request rejected with 401 is retried once after the
+    org's token has been refreshed through the `sf` CLI. Every response is
+    counted against the current timing span.
+
+    Args:
+        pool_size (int): Connections kept per host, used when the session is first created.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _http_session
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with _lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, int(pool_size)))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Accept-Encoding"] = "gzip, deflate"
+            session.hooks["response"].append(_retry_unauthorized)
+            session.hooks["response"].append(count_response_bytes)
+            _http_session = session
+        return _http_session
+
+
+def _set_access_token(org_alias, sf, access_token):
+    sf.session_id = access_token
+    sf.headers["Authorization"] = f"Bearer {access_token}"
+    _token_aliases[access_token] = org_alias
+
+
+def _refresh_access_token(org_alias, failed_token):
+    """
+    Replaces an org's rejected access token with a fresh one from the CLI.
+
+    Only the first thread to see a token rejected runs the CLI; the others
+    pick up the token it fetched.
+
+    Returns:
+        str: The access token to retry with.
+    """
+    with _refresh_lock:
+        sf, session_dir = _connections[org_alias]
+        if sf.session_id != failed_token:
+            return sf.session_id
+        auth = fetch_cli_session(org_alias)
+        save_cached_session(org_alias, auth, session_dir)
+        _set_access_token(org_alias, sf, auth["access_token"])
+        return auth["access_token"]
+
+
+def _retry_unauthorized(response, *args, **kwargs):
+    """Response hook: retries a 401 once with a refreshed token for the request's org."""
+    if response.status_code != 401:
+        return response
+    authorization = response.request.headers.get("Authorization", "")
+    org_alias = _token_aliases.get(authorization[len("Bearer "):])
+    if org_alias is None:
+        return response
+
+    try:
+        access_token = _refresh_access_token(org_alias, authorization[len("Bearer "):])
+    except Exception as e:
+        print(f"Error refreshing the Salesforce session for {org_alias}: {e}")
+        return response
+
+    response.close()
+    request = response.request.copy()
+    request.headers["Authorization"] = f"Bearer {access_token}"
+    # Sent straight through the adapter, so a second 401 is returned rather than retried
+    retried = response.connection.send(request, **kwargs)
+    retried.history.append(response)
+    retried.request = request
+    return retried
+
+
+def get_salesforce_connection(org_alias, session_dir=DEFAULT_SESSION_DIR, pool_size=DEFAULT_POOL_SIZE):
+    """
+    Returns a Salesforce connection for an org alias.
+
+    The instance URL and access token are cached on disk per alias, so the
+    `sf` CLI only runs when there is no cached session or the token has been
+    rejected. A cached token is checked with one request to the API root.
+    Connections are reused within the process and share one pooled HTTP
+    session.
+
+    Args:
+        org_alias (str): The Salesforce org alias.
+        session_dir (str): Directory holding the cached sessions.
+        pool_size (int): Connections kept per host in the shared HTTP session.
+
+    Returns:
+        Salesforce or None: The connection, or None if authentication failed.
+    """
+    # simple_salesforce pulls in zeep and lxml, so it is only loaded once a connection is needed
+    from simple_salesforce import Salesforce
+
+    with _lock:
+        if org_alias in _connections:
+            return _connections[org_alias][0]
+
+    try:
+        auth = load_cached_session(org_alias, session_dir)
+        if auth is None:
+            auth = fetch_cli_session(org_alias)
+            save_cached_session(org_alias, auth, session_dir)
+
+        sf = Salesforce(
+            instance_url=auth["instance_url"],
+            session_id=auth["access_token"],
+            session=get_http_session(pool_size),
         )
+        with _lock:
+            _connections[org_alias] = (sf, session_dir)
+            _token_aliases[auth["access_token"]] = org_alias
+
+        # A rejected token is refreshed and retried by the session's response hook
+        sf.restful("")
+        return sf
     except Exception as e:
+        with _lock:
+            _connections.pop(org_alias, None)
         print(f"Error authenticating with Salesforce: {e}")
         return None
@@ -0,0 +1,308 @@
+import csv
+import io
+import time
+from contextlib import nullcontext
+from telemetry.tracing import get_tracer
+
+# Seconds between job status checks while a Bulk API 2.0 job is running
+BULK_POLL_INTERVAL = 2.0
+# Terminal Bulk API 2.0 job states that mean the job did not complete
+BULK_FAILED_STATES = ("Failed", "Aborted")
+
+
+def _bulk_headers(sf, accept="application/json"):
+    """
+    Builds request headers for the Bulk API 2.0 from the connection's session headers.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        accept (str): Value for the Accept header.
+
+    Returns:
+        dict: The request headers.
+    """
+    headers = dict(sf.headers)
+    headers["Accept"] = accept
+    return headers
+
+
+def _check_response(response, action):
+    """
+    Raises an exception describing a failed Bulk API 2.0 request.
+
+    Args:
+        response (requests.Response): The response to check.
+        action (str): Description of the request, used in the error message.
+
+    Raises:
+        Exception: If the response status is not successful.
+    """
+    if response.status_code >= 300:
+        raise Exception(f"Error {action}: {response.status_code} {response.text}")
+
+
+def submit_query_job(sf, soql_query, include_deleted=False):
+    """
+    Creates a Bulk API 2.0 query job.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        soql_query (str): The SOQL query to execute.
+        include_deleted (bool): Run the job as `queryAll` to include deleted records.
+
+    Returns:
+        str: The Id of the created job.
+
+    Raises:
+        Exception: If the job cannot be created.
+    """
+    response = sf.session.post(
+        f"{sf.base_url}jobs/query",
+        headers=_bulk_headers(sf),
+        json={
+            "operation": "queryAll" if include_deleted else "query",
+            "query": soql_query,
+            "contentType": "CSV",
+            "columnDelimiter": "COMMA",
+            "lineEnding": "LF",
+        },
+    )
+    _check_response(response, "creating Bulk API query job")
+    return response.json()["id"]
+
+
+def wait_for_query_job(sf, job_id, poll_interval=BULK_POLL_INTERVAL, timeout=None, limiter=None):
+    """
+    Polls a Bulk API 2.0 query job until it completes.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        job_id (str): The query job Id.
+        poll_interval (float): Seconds to wait between status checks.
+        timeout (float, optional): Give up after this many seconds.
+        limiter (optional): Context manager held around each status check,
+            such as the org limiter, but not while waiting between them.
+
+    Returns:
+        dict: The final job info, including `numberRecordsProcessed`.
+
+    Raises:
+        Exception: If the job fails, is aborted or does not finish in time.
+    """
+    return _wait_for_job(sf, "query", job_id, poll_interval, timeout, limiter)
+
+
+def _wait_for_job(sf, job_type, job_id, poll_interval, timeout, limiter=None):
+    """Polls a `query` or `ingest` job until it completes (see `wait_for_query_job`)."""
+    limiter = limiter or nullcontext()
+    started = time.monotonic()
+    while True:
+        with limiter:
+            response = sf.session.get(f"{sf.base_url}jobs/{job_type}/{job_id}", headers=_bulk_headers(sf))
+        _check_response(response, f"checking Bulk API {job_type} job {job_id}")
+        job_info = response.json()
+
+        state = job_info.get("state")
+        if state == "JobComplete":
+            return job_info
+        if state in BULK_FAILED_STATES:
+            raise Exception(f"Bulk API {job_type} job {job_id} {state.lower()}: {job_info.get('errorMessage')}")
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise Exception(f"Bulk API {job_type} job {job_id} did not complete within {timeout} seconds")
+
+        time.sleep(poll_interval)
+
+
+def iter_query_job_results(sf, job_id, max_records=None, parent_span=None, limiter=None):
+    """
+    Streams the CSV results of a completed Bulk API 2.0 query job, following
+    the `Sforce-Locator` header from one result set to the next.
+
+    Rows are parsed straight from the response stream as lists of strings,
+    without decoding them into per-record dicts.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        job_id (str): The completed query job Id.
+        max_records (int, optional): Maximum rows per result set request.
+        parent_span (Span, optional): Span the result set spans belong to, as
+            the rows are usually read on the writer's thread.
+        limiter (optional): Context manager held around each result set
+            request until its response starts, such as the org limiter. It
+            is not held while the rows are read, which waits on the writer.
+
+    Yields:
+        list: The header row first, then each data row.
+
+    Raises:
+        Exception: If a result request fails.
+    """
+    limiter = limiter or nullcontext()
+    locator = None
+    header_sent = False
+    while True:
+        params = {}
+        if max_records:
+            params["maxRecords"] = int(max_records)
+        if locator:
+            params["locator"] = locator
+
+        span = get_tracer().start_span("Bulk results page", "page", parent=parent_span)
+        with limiter:
+            response = sf.session.get(
+                f"{sf.base_url}jobs/query/{job_id}/results",
+                headers=_bulk_headers(sf, accept="text/csv"),
+                params=params,
+                stream=True,
+            )
+        record_count = 0
+        try:
+            _check_response(response, f"retrieving results for Bulk API query job {job_id}")
+            # Keep the raw stream open at EOF so the text wrapper can finish reading
+            response.raw.decode_content = True
+            response.raw.auto_close = False
+            reader = csv.reader(io.TextIOWrapper(response.raw, encoding="utf-8", newline=""))
+
+            # Every result set repeats the header row
+            header = next(reader, None)
+            if header is not None and not header_sent:
+                header_sent = True
+                yield header
+            for row in reader:
+                record_count += 1
+                yield row
+        finally:
+            span.add(requests=1, records=record_count, bytes=response.raw.tell())
+            span.finish()
+            response.close()
+
+        locator = response.headers.get("Sforce-Locator")
+        if not locator or locator == "null":
+            break
+
+
+def query_bulk(sf, soql_query, max_records=None, poll_interval=BULK_POLL_INTERVAL, timeout=None, limiter=None):
+    """
+    Runs a SOQL query through a Bulk API 2.0 query job.
+
+    The job is submitted and polled to completion immediately. Result rows
+    are downloaded lazily as the returned iterator is consumed, so they can
+    be streamed straight into the output writer.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        soql_query (str): The SOQL query to execute.
+        max_records (int, optional): Maximum rows per result set request.
+        poll_interval (float): Seconds to wait between job status checks.
+        timeout (float, optional): Give up waiting for the job after this many seconds.
+        limiter (optional): Context manager held around each request, such
+            as the org limiter, so other objects' queries run while the job
+            is polled and its results are read.
+
+    Returns:
+        tuple: (headers, rows iterator, number of records).
+
+    Raises:
+        Exception: If the job fails or its results cannot be retrieved.
+    """
+    try:
+        tracer = get_tracer()
+        with tracer.span("Bulk query job", "bulk"):
+            with limiter or nullcontext():
+                job_id = submit_query_job(sf, soql_query)
+            job_info = wait_for_query_job(sf, job_id, poll_interval, timeout, limiter)
+        record_count = job_info.get("numberRecordsProcessed", 0)
+
+        rows = iter_query_job_results(sf, job_id, max_records, tracer.current(), limiter)
+        headers = next(rows, []) if record_count else []
+        return headers, rows, record_count
+    except Exception as e:
+        raise Exception(f"Error querying Salesforce with Bulk API: {e}")
+
+
+def submit_ingest_job(sf, object_name, csv_data, operation="upsert", external_id_field=None):
+    """
+    Creates a Bulk API 2.0 ingest job, uploads its CSV data and closes it so
+    Salesforce starts processing.
+
+    A job takes a single upload, so data larger than Salesforce's upload
+    limit (100 MB of CSV) has to be split across jobs by the caller.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        object_name (str): The object to load.
+        csv_data (bytes): UTF-8 CSV with a header row of field names.
+        operation (str): `insert`, `update`, `upsert` or `delete`.
+        external_id_field (str, optional): The field matching records for an upsert.
+
+    Returns:
+        str: The Id of the job.
+
+    Raises:
+        Exception: If the job cannot be created, uploaded or closed.
+    """
+    job = {
+        "object": object_name,
+        "operation": operation,
+        "contentType": "CSV",
+        "columnDelimiter": "COMMA",
+        "lineEnding": "LF",
+    }
+    if external_id_field:
+        job["externalIdFieldName"] = external_id_field
+    response = sf.session.post(f"{sf.base_url}jobs/ingest", headers=_bulk_headers(sf), json=job)
+    _check_response(response, f"creating Bulk API ingest job for {object_name}")
+    job_id = response.json()["id"]
+
+    headers = _bulk_headers(sf)
+    headers["Content-Type"] = "text/csv"
+    response = sf.session.put(f"{sf.base_url}jobs/ingest/{job_id}/batches", headers=headers, data=csv_data)
+    _check_response(response, f"uploading data to Bulk API ingest job {job_id}")
+
+    response = sf.session.patch(
+        f"{sf.base_url}jobs/ingest/{job_id}", headers=_bulk_headers(sf), json={"state": "UploadComplete"}
+    )
+    _check_response(response, f"closing Bulk API ingest job {job_id}")
+    return job_id
+
+
+def wait_for_ingest_job(sf, job_id, poll_interval=BULK_POLL_INTERVAL, timeout=None):
+    """
+    Polls a Bulk API 2.0 ingest job until it completes.
+
+    Returns:
+        dict: The final job info, including `numberRecordsProcessed` and
+        `numberRecordsFailed`.
+
+    Raises:
+        Exception: If the job fails, is aborted or does not finish in time.
+    """
+    return _wait_for_job(sf, "ingest", job_id, poll_interval, timeout)
+
+
+def iter_failed_results(sf, job_id):
+    """
+    Streams the rows a completed ingest job could not load.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        job_id (str): The completed ingest job Id.
+
+    Yields:
+        dict: Each failed row's uploaded fields, with `sf__Id` and `sf__Error`.
+
+    Raises:
+        Exception: If the results cannot be retrieved.
+    """
+    response = sf.session.get(
+        f"{sf.base_url}jobs/ingest/{job_id}/failedResults",
+        headers=_bulk_headers(sf, accept="text/csv"),
+        stream=True,
+    )
+    try:
+        _check_response(response, f"retrieving failed results of Bulk API ingest job {job_id}")
+        response.raw.decode_content = True
+        response.raw.auto_close = False
+        yield from csv.DictReader(io.TextIOWrapper(response.raw, encoding="utf-8", newline=""))
+    finally:
+        response.close()
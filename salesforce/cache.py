@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+from salesforce.spool import ObjectSpool, SpoolReader
+
+# Directory holding cached query results, relative to the working directory
+DEFAULT_CACHE_DIR = os.path.join(".cache", "queries")
+# Seconds a cached result set is reused before the query is run again
+DEFAULT_CACHE_TTL = 3600
+# Compressed bytes kept in the cache; the least recently used results go first
+DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# A quoted SOQL literal, kept as is, or a run of whitespace outside one
+_WHITESPACE = re.compile(r"('(?:[^'\\]|\\.)*')|\s+")
+
+
+def normalize_soql(soql_query):
+    """
+    Collapses the whitespace of a query outside its string literals, so
+    reformatting a DBML note does not miss the cache.
+
+    Returns:
+        str: The normalized query.
+    """
+    return _WHITESPACE.sub(lambda match: match.group(1) or " ", soql_query).strip()
+
+
+def _read_state(state_file):
+    """Returns an entry's state without opening it, so a page another process is writing is never cut off."""
+    try:
+        with open(state_file) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+class QueryCache:
+    """
+    Result sets of earlier runs, keyed by org alias and normalized SOQL.
+
+    Each entry is a spool named by the key's hash: gzip-compressed pages of
+    records (REST queries) or rows with a header (Bulk API results), plus a
+    state file recording when the query was run. Entries are written through
+    an `ObjectSpool` and read through a `SpoolReader`, which never changes
+    them. They are only reused once complete and for `ttl` seconds; a hit
+    touches the state file, so `evict` removes the least recently used
+    entries first.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_CACHE_TTL, max_bytes=DEFAULT_CACHE_MAX_BYTES, refresh=False):
+        """
+        Args:
+            cache_dir (str): Directory holding the entries.
+            ttl (int): Seconds an entry is reused for.
+            max_bytes (int): Size `evict` trims the cache to.
+            refresh (bool): Ignore the entries, running every query again
+                and replacing its entry.
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        # Keys being read or written by this process, never evicted
+        self._active = set()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+    @staticmethod
+    def key(org_alias, soql_query):
+        return hashlib.sha256(f"{org_alias}\n{normalize_soql(soql_query)}".encode("utf-8")).hexdigest()[:32]
+
+    def _is_fresh(self, state):
+        try:
+            created = datetime.fromisoformat(state["created"])
+        except (KeyError, TypeError, ValueError):
+            return False
+        return (datetime.now() - created).total_seconds() < self.ttl
+
+    def lookup(self, org_alias, soql_query):
+        """
+        Finds the cached results of a query.
+
+        Args:
+            org_alias (str): The org the query runs against.
+            soql_query (str): The query.
+
+        Returns:
+            SpoolReader or None: A read-only view of the complete, unexpired
+            entry, or None on a miss or when refreshing.
+        """
+        if self.refresh:
+            return None
+        key = self.key(org_alias, soql_query)
+        state_file = os.path.join(self.cache_dir, f"{key}.state.json")
+        with self._lock:
+            state = _read_state(state_file)
+            if state.get("status") != "complete" or not self._is_fresh(state):
+                return None
+            self._active.add(key)
+            os.utime(state_file)
+            return SpoolReader(self.cache_dir, key)
+
+    def store(self, org_alias, soql_query, kind="records", headers=None):
+        """
+        Starts a new entry for a query, replacing any earlier one. The entry
+        is only used by later runs once it has been marked complete.
+
+        Args:
+            org_alias (str): The org the query runs against.
+            soql_query (str): The query.
+            kind (str): `records` for record pages, `rows` for tabulated rows.
+            headers (list, optional): Column names of a `rows` entry.
+
+        Returns:
+            ObjectSpool: The empty entry to append pages to.
+        """
+        key = self.key(org_alias, soql_query)
+        with self._lock:
+            self._active.add(key)
+            entry = ObjectSpool(self.cache_dir, key)
+            entry.reset(
+                kind,
+                headers,
+                org=org_alias,
+                soql=normalize_soql(soql_query),
+                created=datetime.now().isoformat(timespec="seconds"),
+            )
+        return entry
+
+    def evict(self):
+        """
+        Removes expired entries, including unfinished ones, then the least
+        recently used until the cache fits in `max_bytes`. Entries this
+        process has read or written are kept.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        entries = []
+        with self._lock:
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".state.json"):
+                    continue
+                key = name[:-len(".state.json")]
+                state_file = os.path.join(self.cache_dir, name)
+                data_file = os.path.join(self.cache_dir, f"{key}.jsonl.gz")
+                state = _read_state(state_file)
+                try:
+                    used = os.path.getmtime(state_file)
+                    size = os.path.getsize(data_file) if os.path.exists(data_file) else 0
+                except OSError:
+                    used, size = 0, 0
+                entries.append((used, size, key, state, (data_file, state_file)))
+            entries.sort(key=lambda entry: entry[0])
+            total = sum(entry[1] for entry in entries)
+            removed = 0
+            for used, size, key, state, paths in entries:
+                if key in self._active or (self._is_fresh(state) and total <= self.max_bytes):
+                    continue
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+                removed += 1
+        if removed:
+            logging.info(f"Removed {removed} entries from the query cache in {self.cache_dir}.")
+        return removed
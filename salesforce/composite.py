@@ -0,0 +1,82 @@
+from contextlib import nullcontext
+from urllib.parse import quote
+from telemetry.tracing import get_tracer
+
+# Sub-requests Salesforce accepts in one Composite Batch request
+MAX_BATCH_REQUESTS = 25
+# Record count up to which an object's query is sent in a Composite Batch request
+DEFAULT_COMPOSITE_THRESHOLD = 200
+
+
+def batch_queries(sf, soql_queries, limiter=None):
+    """
+    Runs SOQL queries as sub-requests of Composite Batch requests, up to
+    `MAX_BATCH_REQUESTS` per round trip, and splits the responses back out.
+
+    Salesforce runs the sub-requests of a batch one after another, so this
+    suits queries that return a single small page each. A failed sub-request
+    does not stop the others.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        soql_queries (list): The queries to run.
+        limiter (optional): Context manager held around each request, such as
+            the org limiter.
+
+    Returns:
+        list: For each query in order, its first page of results (`records`,
+        `totalSize`, `done` and `nextRecordsUrl`), or an Exception describing
+        why the sub-request failed.
+
+    Raises:
+        Exception: If a batch request itself fails.
+    """
+    limiter = limiter or nullcontext()
+    results = []
+    for start in range(0, len(soql_queries), MAX_BATCH_REQUESTS):
+        batch = soql_queries[start:start + MAX_BATCH_REQUESTS]
+        batch_requests = [
+            {"method": "GET", "url": f"v{sf.sf_version}/query?q={quote(soql_query)}"}
+            for soql_query in batch
+        ]
+        with get_tracer().span("Composite batch", "page", isolate=("records",)) as span:
+            try:
+                with limiter:
+                    response = sf.restful(
+                        "composite/batch", method="POST", json={"batchRequests": batch_requests, "haltOnError": False}
+                    )
+            except Exception as e:
+                raise Exception(f"Error running Composite Batch request: {e}")
+
+            for soql_query, result in zip(batch, response["results"]):
+                if result.get("statusCode", 500) >= 300:
+                    errors = result.get("result") or []
+                    message = "; ".join(error.get("message", "") for error in errors if isinstance(error, dict))
+                    results.append(Exception(f"Error querying Salesforce: {result.get('statusCode')} {message or errors}"))
+                else:
+                    span.add(records=len(result["result"].get("records") or []))
+                    results.append(result["result"])
+    return results
+
+
+def count_records_batched(sf, count_queries, limiter=None):
+    """
+    Counts several tables' records with `SELECT COUNT()` queries sent in
+    Composite Batch requests.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        count_queries (dict): Object names mapped to their count queries.
+        limiter (optional): Context manager held around each request.
+
+    Returns:
+        dict: Object names mapped to their record counts. Objects whose
+        count failed are left out.
+    """
+    object_names = list(count_queries)
+    results = batch_queries(sf, [count_queries[object_name] for object_name in object_names], limiter)
+    return {
+        object_name: result["totalSize"]
+        for object_name, result in zip(object_names, results)
+        if not isinstance(result, Exception)
+    }
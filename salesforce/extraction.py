@@ -0,0 +1,1006 @@
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import chain
+from salesforce.bulk import query_bulk
+from salesforce.composite import batch_queries, count_records_batched
+from salesforce.incremental import (
+    build_delta_soql,
+    fetch_high_water_mark,
+    iter_changed_ids,
+    iter_deleted_ids,
+    merge_snapshot_rows,
+)
+from salesforce.model import build_soql, combine_filters
+from salesforce.queries import (
+    DEFAULT_CHUNK_WORKERS,
+    build_count_soql,
+    chunking_saves_time,
+    count_records,
+    iter_id_chunked_pages,
+    iter_query_pages,
+    next_locator,
+    split_soql,
+)
+from salesforce.subset import (
+    DEFAULT_MAX_SOQL_LENGTH,
+    build_subset_constraints,
+    build_subset_queries,
+    order_plan_by_refs,
+)
+from sheets.columnar import RecordBatch
+from sheets.formats import VALUE_CONVERTERS
+from sheets.manager import SheetRows, compile_flattener
+from sheets.utils import iter_sheet_rows
+from telemetry.tracing import describe_span, get_tracer
+
+# Default number of objects extracted in parallel
+DEFAULT_WORKERS = 4
+# Default cap on concurrent API requests per org. Salesforce rejects long-running
+# requests beyond the org's concurrent request limit, so stay well below it.
+DEFAULT_ORG_CONCURRENCY = 10
+# Default record count at which an object is extracted with the Bulk API 2.0
+DEFAULT_BULK_THRESHOLD = 100000
+# Pages each object holds in memory ahead of the workbook writer; later pages spill to disk
+DEFAULT_BUFFER_PAGES = 4
+
+# One limiter per org alias, shared by every scheduler in the process
+_org_limiters = {}
+_org_limiters_lock = threading.Lock()
+
+# Marks the end of an object's pages in its stream
+_END = object()
+
+
+def get_org_limiter(org_alias, limit):
+    """
+    Returns the semaphore that bounds concurrent API requests against an org.
+
+    Args:
+        org_alias (str): The Salesforce org alias.
+        limit (int): Maximum concurrent requests, used when the limiter is first created.
+
+    Returns:
+        threading.BoundedSemaphore: The org's limiter.
+    """
+    with _org_limiters_lock:
+        if org_alias not in _org_limiters:
+            _org_limiters[org_alias] = threading.BoundedSemaphore(max(1, int(limit)))
+        return _org_limiters[org_alias]
+
+
+class _SpillingPages:
+    """
+    A first-in, first-out buffer of pages that holds up to `max_pages` in
+    memory and appends the rest to a temporary file, so adding a page never
+    waits for the reader.
+
+    Once a page has spilled, later pages spill too until the reader has
+    caught up with the file, which keeps the pages in order. The file is
+    emptied whenever the reader catches up and deleted when the buffer is
+    discarded. There is one writing and one reading thread.
+    """
+
+    def __init__(self, max_pages, spill_dir=None, prefix="pages-"):
+        self.max_pages = max(1, int(max_pages))
+        self.spill_dir = spill_dir
+        self.prefix = prefix
+        # Pages that went through the file, for the log
+        self.spilled = 0
+        self._memory = deque()
+        self._file = None
+        # Sizes of the pickled pages in the file not read yet, oldest first
+        self._unread = deque()
+        self._read_offset = 0
+        self._closed = False
+        self._discarded = False
+        self._condition = threading.Condition()
+
+    def put(self, page):
+        """Adds a page. Returns False once the buffer has been discarded."""
+        with self._condition:
+            if self._discarded:
+                return False
+            if not self._unread and len(self._memory) < self.max_pages:
+                self._memory.append(page)
+                self._condition.notify()
+                return True
+        data = pickle.dumps(page, pickle.HIGHEST_PROTOCOL)
+        with self._condition:
+            if self._discarded:
+                return False
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(prefix=self.prefix, dir=self.spill_dir)
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(data)
+            self._unread.append(len(data))
+            self.spilled += 1
+            self._condition.notify()
+        return True
+
+    def close(self):
+        """Marks the end of the pages."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def get(self):
+        """
+        Waits for the next page.
+
+        Returns:
+            The page, or `_END` once every page has been read after `close`.
+        """
+        with self._condition:
+            while not self._memory and not self._unread and not self._closed:
+                self._condition.wait()
+            if self._memory:
+                return self._memory.popleft()
+            if not self._unread:
+                return _END
+            size = self._unread.popleft()
+            self._file.seek(self._read_offset)
+            data = self._file.read(size)
+            self._read_offset += size
+            if not self._unread:
+                # Caught up: later pages go to memory again and the file starts over
+                self._file.seek(0)
+                self._file.truncate()
+                self._read_offset = 0
+        return pickle.loads(data)
+
+    def discard(self):
+        """Drops every buffered page and deletes the file; later pages are refused."""
+        with self._condition:
+            self._discarded = True
+            self._closed = True
+            self._memory.clear()
+            self._unread.clear()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._condition.notify()
+
+
+class ExtractionStream:
+    """
+    Hands one object's records from its extraction thread to the writer.
+
+    The writer consumes the streams one at a time in plan order, so the
+    objects it has not reached yet would otherwise wait for it with their
+    queries idle. Instead each stream holds a few pages in memory and spills
+    the rest to a temporary file, so every extraction runs at full speed
+    while memory stays independent of row count. With a column plan, each
+    page is decoded into a `RecordBatch` before it is buffered, so the
+    buffered pages hold compact columns rather than the API's record dicts.
+    """
+
+    def __init__(self, object_name, buffer_pages=DEFAULT_BUFFER_PAGES, columns=None, types=None, spill_dir=None):
+        self.object_name = object_name
+        self.columns = columns
+        self.types = types
+        self._flattener = compile_flattener(columns) if columns else None
+        self.log_rows = []
+        # High-water SystemModstamp taken before an incremental extraction
+        self.watermark = None
+        self.failed = False
+        # Columns whose values subset children filter on, and the values once complete
+        self.key_columns = set()
+        self.keys = None
+        # (reference, parent stream) pairs narrowing a subset extraction, driving reference first
+        self.constraints = []
+        # The run's ObjectSpool for this object, when pages are spooled to disk
+        self.spool = None
+        # The query cache entry replayed instead of running the query, on a cache hit
+        self.cached = None
+        self._pages = _SpillingPages(buffer_pages, spill_dir, prefix=f"{object_name}-pages-")
+        self._ready = threading.Event()
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._keys_ready = threading.Event()
+        self._collected_keys = {}
+        self._sheet_rows = None
+
+    def put(self, records):
+        """
+        Buffers a page of records for the writer, in memory or on disk.
+
+        Returns:
+            bool: False if the writer has cancelled the stream.
+        """
+        if self._cancelled.is_set():
+            return False
+        if self._flattener is not None:
+            records = RecordBatch.from_records(self.columns, records, self.types, self._flattener)
+        if self.key_columns:
+            for column in self.key_columns:
+                if isinstance(records, RecordBatch) and column in records.columns:
+                    values = records.column(column)
+                else:
+                    values = [record.get(column) for record in records]
+                self._collected_keys.setdefault(column, set()).update(value for value in values if value is not None)
+        return self._pages.put(records)
+
+    @property
+    def spilled_pages(self):
+        """Pages that waited for the writer on disk rather than in memory."""
+        return self._pages.spilled
+
+    def set_sheet_rows(self, sheet_rows):
+        """Delivers pre-tabulated rows (Bulk API results) instead of record pages."""
+        if self.key_columns:
+            # Keys are complete only once the writer has consumed every row
+            sheet_rows = SheetRows(sheet_rows.headers, self._collect_row_keys(sheet_rows.headers, sheet_rows.rows))
+        self._sheet_rows = sheet_rows
+        self._ready.set()
+
+    def mark_ready(self):
+        """Signals that records will follow as pages."""
+        self._ready.set()
+
+    def _collect_row_keys(self, headers, rows):
+        indexes = {column: list(headers).index(column) for column in self.key_columns if column in headers}
+        collected = {column: set() for column in self.key_columns}
+        try:
+            for row in rows:
+                for column, index in indexes.items():
+                    if row[index] is not None:
+                        collected[column].add(row[index])
+                yield row
+            if not self.failed:
+                self.keys = collected
+        finally:
+            self._keys_ready.set()
+
+    def finish(self):
+        """Marks the end of the stream once the extraction's log rows are complete."""
+        if self._sheet_rows is None or not self.key_columns or self.failed:
+            if not self.failed:
+                self.keys = self._collected_keys
+            self._keys_ready.set()
+        self._finished.set()
+        self._ready.set()
+        self._pages.close()
+
+    def wait_finished(self):
+        """Waits until the extraction thread has finished with this stream."""
+        self._finished.wait()
+
+    def wait_parent_keys(self, parent, column):
+        """
+        Waits until a subset parent's key values are complete.
+
+        Args:
+            parent (ExtractionStream): The parent object's stream.
+            column (str): The parent column the reference points to.
+
+        Returns:
+            set: The parent's non-null values of `column`.
+
+        Raises:
+            Exception: If the parent failed or this stream was cancelled.
+        """
+        while not parent._keys_ready.wait(1):
+            if self._cancelled.is_set():
+                raise Exception("Extraction cancelled")
+        if parent.keys is None:
+            raise Exception(f"Parent {parent.object_name} was not extracted")
+        return parent.keys.get(column, set())
+
+    def cancel(self):
+        """Stops the extraction thread from buffering further pages and drops those buffered."""
+        self._cancelled.set()
+        self._pages.discard()
+
+    def _iter_pages(self):
+        while True:
+            records = self._pages.get()
+            if records is _END:
+                return
+            yield records
+
+    def sheet_data(self):
+        """
+        Waits until the extraction has picked its backend.
+
+        Returns:
+            SheetRows or iterator: The object's data for `create_workbook`.
+            With a column plan, the row tuples are read from the buffered
+            `RecordBatch` pages as they are consumed.
+        """
+        self._ready.wait()
+        if self._sheet_rows is not None:
+            return self._sheet_rows
+        if self.columns:
+            return SheetRows(list(self.columns), chain.from_iterable(batch.iter_rows() for batch in self._iter_pages()))
+        return chain.from_iterable(self._iter_pages())
+
+
+class CompositePrefetch:
+    """
+    Counts a run's tables with Composite Batch requests, then fetches the
+    first page of every table at or under the threshold the same way, so a
+    small object costs a share of a round trip rather than one of its own.
+    Only tables `choose_backend` would query over REST are fetched; one
+    whose count reaches the bulk threshold still goes through the Bulk API.
+
+    Runs on a background thread; each object's extraction waits for it.
+    Objects whose count or query failed are extracted one by one as usual.
+    """
+
+    def __init__(self, sf, plan, threshold, org_limiter, counts=None, options=None):
+        """
+        Args:
+            sf (Salesforce): The Salesforce connection object.
+            plan (dict): The table plans to count.
+            threshold (int): Largest record count fetched in a batch.
+            org_limiter (threading.Semaphore): Limits concurrent requests against the org.
+            counts (dict, optional): Record counts already known from the
+                planning stage, so the tables are not counted again.
+            options (dict, optional): Extraction options for `choose_backend`.
+        """
+        self.sf = sf
+        self.plan = plan
+        self.threshold = threshold
+        self.org_limiter = org_limiter
+        self.known_counts = counts
+        self.options = options or {}
+        self.counts = {}
+        self.pages = {}
+        self._done = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        try:
+            if self.known_counts is not None:
+                self.counts = {
+                    object_name: count for object_name, count in self.known_counts.items() if object_name in self.plan
+                }
+            else:
+                self.counts = count_records_batched(
+                    self.sf,
+                    {object_name: build_count_soql(object_name, table_plan.get("filter")) for object_name, table_plan in self.plan.items()},
+                    self.org_limiter,
+                )
+            batched = {
+                object_name: count
+                for object_name, count in self.counts.items()
+                if count <= self.threshold
+                and choose_backend(None, object_name, self.plan[object_name], self.options, count) == "rest"
+            }
+            small = [object_name for object_name, count in batched.items() if count > 0]
+            # Empty objects need no query at all
+            self.pages = {
+                object_name: {"totalSize": 0, "done": True, "records": []}
+                for object_name, count in batched.items() if count == 0
+            }
+            results = batch_queries(self.sf, [self.plan[object_name]["soql"] for object_name in small], self.org_limiter)
+            for object_name, result in zip(small, results):
+                if not isinstance(result, Exception):
+                    self.pages[object_name] = result
+        except Exception as e:
+            logging.warning(f"Composite Batch requests failed, querying objects one by one: {e}")
+        finally:
+            self._done.set()
+
+    def get(self, object_name):
+        """
+        Waits for the batched requests to finish.
+
+        Returns:
+            tuple: (record count or None, first page of results or None).
+        """
+        if object_name not in self.plan:
+            return None, None
+        self._done.wait()
+        return self.counts.get(object_name), self.pages.pop(object_name, None)
+
+
+def choose_backend(sf, object_name, table_plan, options, record_count=None):
+    """
+    Picks the extraction backend for a table.
+
+    Objects named with `--bulk` always use the Bulk API, then a `BULK`/`REST`
+    directive in the table note wins. Otherwise the Bulk API is used when the
+    table's record count reaches the bulk threshold. REST tables with more
+    records than the chunk size are fetched as concurrent Id range slices,
+    unless walking their Ids for the slice boundaries would take as long as
+    one query cursor (see `chunking_saves_time`).
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        object_name (str): The object being extracted.
+        table_plan (dict): The table's plan from `generate_plan_from_dbml`.
+        options (dict): Extraction options (`bulk_objects`, `bulk_threshold`,
+            `chunk_size`, `chunk_workers`, `batch_size`).
+        record_count (int, optional): The table's record count, if already known.
+
+    Returns:
+        str: `bulk`, `chunked` or `rest`.
+    """
+    if object_name in options.get("bulk_objects", ()) or table_plan.get("mode") == "bulk":
+        return "bulk"
+    bulk_threshold = None if table_plan.get("mode") else options.get("bulk_threshold")
+    chunk_size = options.get("chunk_size") if split_soql(table_plan["soql"]) else None
+    if not bulk_threshold and not chunk_size:
+        return "rest"
+
+    if record_count is None:
+        record_count = count_records(sf, object_name, table_plan.get("filter"))
+    if bulk_threshold and record_count >= bulk_threshold:
+        return "bulk"
+    if chunk_size and record_count > chunk_size and chunking_saves_time(
+        record_count, chunk_size, options.get("batch_size"), options.get("chunk_workers") or DEFAULT_CHUNK_WORKERS
+    ):
+        return "chunked"
+    return "rest"
+
+
+def extract_object(sf, stream, table_plan, org_limiter, options):
+    """
+    Runs the query for a single object, feeding its records into `stream`
+    and recording its Summary log rows on `stream.log_rows`.
+
+    The org limiter is held only while a request is in flight, never while
+    waiting for the writer to drain the stream.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        stream (ExtractionStream): Receives the object's records.
+        table_plan (dict): The table's plan from `generate_plan_from_dbml`.
+        org_limiter (threading.Semaphore): Limits concurrent requests against the org.
+        options (dict): Extraction options (`batch_size`, `bulk_objects`, `bulk_threshold`,
+            `chunk_size`, `chunk_workers`, and for incremental runs `incremental`,
+            `watermarks`, `previous_snapshot`). With a spool, an object spooled
+            in full by an earlier attempt of the run is replayed from disk and a
+            partly spooled one continues from its cursor where possible.
+    """
+    try:
+        with get_tracer().span(f"Extract {stream.object_name}", "object", object=stream.object_name) as span:
+            _extract_object(sf, stream, table_plan, org_limiter, options)
+        stream.log_rows.append([
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "Timing",
+            describe_span(span),
+            f"Extract {stream.object_name}",
+            "Success"
+        ])
+    finally:
+        stream.finish()
+
+
+def _extract_object(sf, stream, table_plan, org_limiter, options):
+    """Runs the extraction for `extract_object`, logging any error on the stream."""
+    object_name = stream.object_name
+    soql_query = table_plan["soql"]
+    stream.log_rows.append([
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "Run Query",
+        f"On {object_name}",
+        soql_query,
+        "In Progress"
+    ])
+    try:
+        spool = stream.spool
+        spooled = spool is not None and spool.complete
+        previous_rows = None
+        if options.get("incremental") and not spooled:
+            with org_limiter:
+                stream.watermark = fetch_high_water_mark(sf, object_name)
+            previous_rows = _previous_snapshot_rows(object_name, table_plan, options)
+
+        if previous_rows is not None:
+            _extract_delta(sf, stream, table_plan, org_limiter, options, previous_rows)
+            return
+
+        if spooled:
+            # Spooled in full by an earlier attempt of this run
+            record_count, via = _replay_spool(stream), " from the run's spool"
+        elif stream.constraints:
+            _reset_spool(stream)
+            record_count, via = _extract_subset(sf, stream, table_plan, org_limiter, options)
+        elif stream.cached is not None:
+            _reset_spool(stream)
+            record_count, via = _replay_cache(stream), " from the query cache"
+        else:
+            resumed = _continue_spooled_pages(sf, stream, soql_query, org_limiter, options)
+            if resumed:
+                backend, pages, record_count = resumed
+            else:
+                _reset_spool(stream)
+                known_count, first_page = (options.get("counts") or {}).get(object_name), None
+                if options.get("prefetch") is not None:
+                    prefetched_count, first_page = options["prefetch"].get(object_name)
+                    if prefetched_count is not None:
+                        known_count = prefetched_count
+                if first_page is not None:
+                    backend = "composite"
+                    pages = _iter_prefetched_pages(sf, soql_query, first_page, org_limiter, options)
+                else:
+                    with org_limiter:
+                        backend = choose_backend(sf, object_name, table_plan, options, known_count)
+                    if backend == "bulk":
+                        # Each request of the job takes the limiter, so polling never holds it
+                        headers, rows, record_count = query_bulk(sf, soql_query, limiter=org_limiter)
+                        rows = _typed_bulk_rows(stream, headers, rows)
+                if backend == "chunked":
+                    pages = _iter_chunked_pages(sf, soql_query, org_limiter, options)
+                elif backend == "rest":
+                    pages = _iter_pages(sf, soql_query, org_limiter, options)
+                if options.get("query_cache") is not None:
+                    if backend == "bulk":
+                        rows = _cache_rows(soql_query, headers, rows, options)
+                    else:
+                        pages = _cache_pages(soql_query, pages, options)
+
+            if backend == "bulk":
+                # Results are downloaded while the workbook is written
+                if record_count:
+                    stream.set_sheet_rows(SheetRows(headers, _spooled_rows(stream, headers, rows)))
+                via = " via Bulk API"
+            else:
+                stream.mark_ready()
+                if not resumed:
+                    record_count = 0
+                for records, cursor in pages:
+                    record_count += len(records)
+                    _deliver(stream, records, cursor)
+                via = {"chunked": " in Id range slices", "composite": " via Composite Batch"}.get(backend, "")
+
+        if spool is not None and spool.kind == "records" and not spool.complete:
+            spool.mark_complete()
+
+        if record_count:
+            logging.info(f"Retrieved {record_count} records for {object_name}{via}.")
+            if stream.spilled_pages:
+                logging.info(f"{stream.spilled_pages} pages of {object_name} waited for the writer on disk.")
+            stream.log_rows.append([
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "Retrieve Records",
+                f"Retrieved {record_count} records for {object_name}{via}",
+                f"Sheet {object_name} in Workbook",
+                "Success"
+            ])
+        else:
+            logging.warning(f"No data retrieved for {object_name}.")
+            stream.log_rows.append([
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "Retrieve Records",
+                f"No records retrieved for {object_name}",
+                "",
+                "No Data"
+            ])
+    except Exception as e:
+        stream.failed = True
+        logging.error(f"Error querying {object_name}: {e}")
+        stream.log_rows.append([
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "Error querying Salesforce",
+            f"{e}",
+            soql_query,
+            "Failure"
+        ])
+
+
+def _iter_pages(sf, soql_query, org_limiter, options, locator=None):
+    """
+    Yields (records, cursor) for each non-empty page, holding the org limiter
+    only during requests. The cursor holds the locator of the next page, or
+    is None after the last page.
+    """
+    pages = iter_query_pages(sf, soql_query, options.get("batch_size"), locator=locator)
+    while True:
+        with org_limiter:
+            page = next(pages, None)
+        if page is None:
+            return
+        if page["records"]:
+            locator = next_locator(page)
+            yield page["records"], {"locator": locator} if locator else None
+
+
+def _iter_chunked_pages(sf, soql_query, org_limiter, options):
+    """
+    Yields (records, cursor) for each non-empty page of records from
+    concurrent Id range slices, in Id order. The cursor holds the last Id
+    retrieved, when the query selects it.
+    """
+    pages = iter_id_chunked_pages(
+        sf,
+        soql_query,
+        options["chunk_size"],
+        options.get("batch_size"),
+        options.get("chunk_workers") or DEFAULT_CHUNK_WORKERS,
+        org_limiter,
+    )
+    for page in pages:
+        records = page["records"]
+        if records:
+            yield records, {"after_id": records[-1]["Id"]} if records[-1].get("Id") else None
+
+
+def _iter_prefetched_pages(sf, soql_query, first_page, org_limiter, options):
+    """Yields (records, cursor) for a first page fetched by `CompositePrefetch`, then any further pages."""
+    locator = next_locator(first_page)
+    if first_page["records"]:
+        span = get_tracer().current()
+        if span is not None:
+            span.add(records=len(first_page["records"]))
+        yield first_page["records"], {"locator": locator} if locator else None
+    if locator:
+        yield from _iter_pages(sf, soql_query, org_limiter, options, locator)
+
+
+def _deliver(stream, records, cursor=None):
+    """Spools a page of records, when the run is spooled, then buffers it for the writer."""
+    if stream.spool is not None:
+        stream.spool.append(records, cursor)
+    if not stream.put(records):
+        raise Exception("Extraction cancelled")
+
+
+def _reset_spool(stream):
+    """Empties the object's spool before it is extracted from the start."""
+    if stream.spool is not None:
+        stream.spool.reset(watermark=stream.watermark)
+
+
+def _spooled_rows(stream, headers, rows):
+    """Spools tabulated rows as the writer consumes them, when the run is spooled."""
+    if stream.spool is None:
+        return rows
+    stream.spool.reset("rows", list(headers), watermark=stream.watermark)
+    return stream.spool.spool_rows(rows)
+
+
+def _replay_records(stream):
+    """Queues the record pages spooled so far, returning how many records they hold."""
+    record_count = 0
+    for records in stream.spool.iter_pages():
+        record_count += len(records)
+        if not stream.put(records):
+            raise Exception("Extraction cancelled")
+    return record_count
+
+
+def _replay_spool(stream):
+    """
+    Delivers an object spooled in full by an earlier attempt of the run.
+
+    Returns:
+        int: The number of records replayed.
+    """
+    spool = stream.spool
+    stream.watermark = spool.state.get("watermark")
+    if spool.kind == "rows":
+        stream.set_sheet_rows(SheetRows(spool.state["headers"], spool.iter_rows()))
+    else:
+        stream.mark_ready()
+        _replay_records(stream)
+    return spool.records
+
+
+def _replay_cache(stream):
+    """
+    Delivers an object from the results an earlier run left in the query cache.
+
+    Returns:
+        int: The number of records replayed.
+    """
+    entry = stream.cached
+    if entry.kind == "rows":
+        if entry.records:
+            headers = entry.state["headers"]
+            # Entries cached before Bulk rows were typed still hold the CSV strings
+            rows = _typed_bulk_rows(stream, headers, entry.iter_rows())
+            stream.set_sheet_rows(SheetRows(headers, _spooled_rows(stream, headers, rows)))
+    else:
+        stream.mark_ready()
+        for records in entry.iter_pages():
+            _deliver(stream, records)
+    return entry.records
+
+
+def _typed_bulk_rows(stream, headers, rows):
+    """
+    Converts Bulk API CSV rows to the values a REST query returns: empty
+    cells, which is how the CSV writes nulls, to None, then each planned
+    field to its logical type, so both backends write identical cells.
+    """
+    types = dict(zip(stream.columns or (), stream.types or ()))
+    converters = [VALUE_CONVERTERS[types.get(header, "string")] for header in headers]
+    for row in rows:
+        yield tuple(None if value == "" else convert(value) for convert, value in zip(converters, row))
+
+
+def _cache_pages(soql_query, pages, options):
+    """Passes (records, cursor) pages through while storing them in the query cache, completing the entry at the end."""
+    entry = options["query_cache"].store(options["org_alias"], soql_query)
+    for records, cursor in pages:
+        entry.append(records)
+        yield records, cursor
+    entry.mark_complete()
+
+
+def _cache_rows(soql_query, headers, rows, options):
+    """Passes Bulk API rows through while storing them in the query cache as the writer consumes them."""
+    return options["query_cache"].store(options["org_alias"], soql_query, "rows", list(headers)).spool_rows(rows)
+
+
+def _continue_spooled_pages(sf, stream, soql_query, org_limiter, options):
+    """
+    Continues an object from the cursor an earlier attempt of the run left in
+    its spool: the query locator of a REST query, or the last Id of an Id
+    range extraction. The spooled pages are replayed into the stream once
+    the query has been continued, so an expired locator only means the
+    object is extracted again from the start.
+
+    Returns:
+        tuple or None: (backend, iterator of the remaining (records, cursor)
+        pages, number of records replayed), or None if the object has to be
+        extracted from the start.
+    """
+    cursor = stream.spool.cursor if stream.spool is not None else None
+    if not cursor:
+        return None
+
+    if "after_id" in cursor:
+        backend = "chunked"
+        fields, object_name, filter_clause = split_soql(soql_query)
+        remaining_query = build_soql(object_name, fields, combine_filters(filter_clause, f"Id > '{cursor['after_id']}'"))
+        pages = _iter_chunked_pages(sf, remaining_query, org_limiter, options)
+    else:
+        backend = "rest"
+        pages = _iter_pages(sf, soql_query, org_limiter, options, cursor["locator"])
+    try:
+        first_page = next(pages, None)
+    except Exception as e:
+        logging.warning(f"Cannot continue {stream.object_name} from the spool, extracting it again: {e}")
+        return None
+
+    logging.info(f"Continuing {stream.object_name} after {stream.spool.records} spooled records.")
+    stream.watermark = stream.spool.state.get("watermark") or stream.watermark
+    stream.mark_ready()
+    record_count = _replay_records(stream)
+    return backend, chain([first_page] if first_page else [], pages), record_count
+
+
+def _extract_subset(sf, stream, table_plan, org_limiter, options):
+    """
+    Queries only the records whose parents are in the subset, once every
+    parent's keys are complete. The driving reference's keys are sent in
+    batched `IN` clauses and any other restricted references are checked as
+    records arrive.
+
+    Returns:
+        tuple: (record count, description of the queries for the log).
+    """
+    object_name = stream.object_name
+    parent_keys = [(ref, stream.wait_parent_keys(parent, ref["ref_column"])) for ref, parent in stream.constraints]
+    (driver, driver_keys), checks = parent_keys[0], parent_keys[1:]
+    queries = build_subset_queries(
+        object_name,
+        table_plan,
+        driver["column"],
+        driver_keys,
+        options.get("max_soql_length") or DEFAULT_MAX_SOQL_LENGTH,
+    )
+
+    stream.mark_ready()
+    record_count = 0
+    for soql_query in queries:
+        for records, _ in _iter_pages(sf, soql_query, org_limiter, options):
+            if checks:
+                records = [
+                    record for record in records
+                    if all(record.get(ref["column"]) is None or record[ref["column"]] in keys for ref, keys in checks)
+                ]
+            record_count += len(records)
+            if records:
+                # A partly spooled subset object is extracted again from the start
+                _deliver(stream, records)
+    return record_count, f" via {len(queries)} subset queries on {driver['column']}"
+
+
+def _previous_snapshot_rows(object_name, table_plan, options):
+    """
+    Opens the object's sheet in the previous snapshot for an incremental merge.
+
+    Returns:
+        iterator or None: The sheet's data rows, or None if the object needs a
+        full extraction (no watermark, no sheet, or the column plan changed).
+    """
+    snapshot = options.get("previous_snapshot")
+    if not options.get("watermarks", {}).get(object_name) or not snapshot or not os.path.exists(snapshot.path):
+        return None
+    if "Id" not in table_plan["fields"]:
+        return None
+
+    try:
+        rows = iter_sheet_rows(snapshot, object_name)
+        header = next(rows, None)
+    except KeyError:
+        return None
+    if header is None or list(header) != list(table_plan["fields"]):
+        rows.close()
+        return None
+    return _padded_rows(rows, len(header))
+
+
+def _padded_rows(rows, width):
+    """Pads rows to `width` cells, as an xlsx snapshot drops the trailing empty cells of a row."""
+    try:
+        for row in rows:
+            yield row if len(row) >= width else tuple(row) + (None,) * (width - len(row))
+    finally:
+        rows.close()
+
+
+def _extract_delta(sf, stream, table_plan, org_limiter, options, previous_rows):
+    """
+    Queries records changed and deleted since the object's watermark and
+    merges them by Id into the previous snapshot's rows.
+
+    With a note filter, the changed records are queried through the filter,
+    and the Ids of every changed record without it, so a record edited out
+    of the filter loses its previous row too.
+    """
+    object_name = stream.object_name
+    fields = table_plan["fields"]
+    watermark = options["watermarks"][object_name]
+
+    flattener = compile_flattener(fields)
+    delta_rows = []
+    for records, _ in _iter_pages(sf, build_delta_soql(object_name, table_plan, watermark), org_limiter, options):
+        delta_rows.extend(map(flattener, records))
+    with org_limiter:
+        removed_ids = set(iter_deleted_ids(sf, object_name, watermark))
+    id_index = fields.index("Id")
+    changed = f"{len(delta_rows)} changed"
+    deleted = f"{len(removed_ids)} deleted"
+    if table_plan.get("filter"):
+        with org_limiter:
+            changed_ids = set(iter_changed_ids(sf, object_name, watermark))
+        outside = len(changed_ids.difference(row[id_index] for row in delta_rows))
+        if outside:
+            changed = f"{len(delta_rows) + outside} changed ({outside} outside the filter)"
+        removed_ids.update(changed_ids)
+
+    merged_rows = merge_snapshot_rows(previous_rows, delta_rows, removed_ids, id_index)
+    stream.set_sheet_rows(SheetRows(list(fields), _spooled_rows(stream, fields, merged_rows)))
+
+    logging.info(f"Merged {changed} and {deleted} records for {object_name}.")
+    stream.log_rows.append([
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "Merge Records",
+        f"Merged {changed} and {deleted} records for {object_name} since {watermark}",
+        f"Sheet {object_name} in Workbook",
+        "Success"
+    ])
+
+
+def run_extractions(sf, plan, workers, org_limiter, options=None):
+    """
+    Starts extracting every object in parallel on a thread pool.
+
+    Returns immediately with one stream per object, in plan order, which is
+    the order they are written in. Objects are started in plan order too,
+    or in `schedule` order when given; pages of a stream the writer has not
+    reached yet wait in its buffer.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        plan (dict): Object names mapped to table plans from `generate_plan_from_dbml`.
+        workers (int): Maximum number of objects extracted at once.
+        org_limiter (threading.Semaphore): Limits concurrent requests against the org.
+        options (dict, optional): Extraction options (`batch_size`, `bulk_objects`,
+            `bulk_threshold`, `chunk_size`, `chunk_workers`, `buffer_pages`,
+            `spill_dir`, where pages waiting for the writer spill,
+            `incremental`, `watermarks`, `previous_snapshot`, a
+            `SnapshotReader` shared by every object's merge, `subset`
+            with `max_soql_length`, `spool`, the run's `RunSpool`, and
+            `composite_threshold`, the largest record count fetched in a
+            Composite Batch request, 0 to disable, `counts`, record counts
+            from the planning stage, `schedule`, object names in the
+            order to start them, biggest first, and `query_cache`, a
+            `QueryCache` replaying and storing result sets under `org_alias`).
+
+    Returns:
+        list: ExtractionStream objects in the order of `plan`, or parents
+        first for a subset extraction.
+    """
+    options = options or {}
+    buffer_pages = options.get("buffer_pages", DEFAULT_BUFFER_PAGES)
+    constraints = {}
+    if options.get("subset"):
+        # Parents are written first too, so their keys are complete before a child needs them
+        plan = order_plan_by_refs(plan)
+        constraints = build_subset_constraints(plan)
+    streams = [
+        ExtractionStream(object_name, buffer_pages, table_plan.get("fields"), table_plan.get("types"), options.get("spill_dir"))
+        for object_name, table_plan in plan.items()
+    ]
+
+    if options.get("spool") is not None:
+        for stream in streams:
+            stream.spool = options["spool"].object_spool(stream.object_name)
+
+    query_cache = options.get("query_cache")
+    if query_cache is not None and not options.get("incremental"):
+        for stream in streams:
+            if stream.object_name not in constraints and not _has_spooled_pages(stream):
+                stream.cached = query_cache.lookup(options["org_alias"], plan[stream.object_name]["soql"])
+
+    by_name = {stream.object_name: stream for stream in streams}
+    threshold = options.get("composite_threshold")
+    if threshold and not options.get("incremental"):
+        # Tables extracted from the start that may go over REST; the counts also pick their backend
+        batched = {
+            object_name: table_plan
+            for object_name, table_plan in plan.items()
+            if object_name not in constraints
+            and object_name not in options.get("bulk_objects", ())
+            and table_plan.get("mode") != "bulk"
+            and not _has_spooled_pages(by_name[object_name])
+            and by_name[object_name].cached is None
+        }
+        if batched:
+            prefetch = CompositePrefetch(sf, batched, threshold, org_limiter, options.get("counts"), options)
+            options = dict(options, prefetch=prefetch.start())
+    for object_name, refs in constraints.items():
+        for ref in refs:
+            by_name[ref["table"]].key_columns.add(ref["ref_column"])
+            by_name[object_name].constraints.append((ref, by_name[ref["table"]]))
+
+    start_order = streams
+    if options.get("schedule") and not options.get("subset"):
+        # Starting the longest extractions first shortens the run; objects not scheduled go last.
+        # Only the start order changes: the writer still takes the streams in plan order.
+        start_order = [by_name[object_name] for object_name in options["schedule"] if object_name in by_name]
+        start_order += [stream for stream in streams if stream not in start_order]
+    executor = ThreadPoolExecutor(max_workers=max(1, int(workers)))
+    for stream in start_order:
+        executor.submit(extract_object, sf, stream, plan[stream.object_name], org_limiter, options)
+    # Let the pool wind down as the streams are drained
+    executor.shutdown(wait=False)
+    return streams
+
+
+def _has_spooled_pages(stream):
+    """Whether an earlier attempt of the run left pages to replay or continue from."""
+    return stream.spool is not None and (stream.spool.complete or stream.spool.cursor is not None)
+
+
+def iter_sheet_data(streams, log_data):
+    """
+    Yields (object name, data) pairs for `create_workbook` in stream order,
+    appending each object's log rows to `log_data` once its data is consumed
+    so the Summary rows stay in a deterministic order.
+
+    Args:
+        streams (list): ExtractionStream objects from `run_extractions`.
+        log_data (list of lists): The Summary log to extend.
+
+    Yields:
+        tuple: (object name, records iterator or SheetRows).
+    """
+    for stream in streams:
+        data = stream.sheet_data()
+        if isinstance(data, SheetRows):
+            yield stream.object_name, SheetRows(data.headers, _then_log(data.rows, stream, log_data))
+        else:
+            yield stream.object_name, _then_log(data, stream, log_data)
+
+
+def _then_log(rows, stream, log_data):
+    yield from rows
+    stream.wait_finished()
+    log_data.extend(stream.log_rows)
@@ -0,0 +1,173 @@
+import json
+import os
+from datetime import datetime, timezone
+from salesforce.model import build_soql, combine_filters
+from salesforce.queries import iter_query
+
+# Directory holding per-org watermark state, relative to the working directory
+DEFAULT_STATE_DIR = os.path.join(".cache", "watermarks")
+# Timestamp format returned by the REST API, e.g. 2024-05-01T12:34:56.000+0000
+API_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+
+def _state_file(org_alias, dbml_name, state_dir):
+    return os.path.join(state_dir, f"{org_alias}_{dbml_name}.json")
+
+
+def load_watermarks(org_alias, dbml_name, state_dir=DEFAULT_STATE_DIR):
+    """
+    Loads the incremental extraction state for an org and DBML file.
+
+    Args:
+        org_alias (str): The Salesforce org alias.
+        dbml_name (str): Base name of the .dbml file.
+        state_dir (str): Directory holding the state files.
+
+    Returns:
+        dict: `{"snapshot": path or None, "watermarks": {object_name: SystemModstamp}}`.
+    """
+    try:
+        with open(_state_file(org_alias, dbml_name, state_dir), "r") as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        state = {}
+    return {"snapshot": state.get("snapshot"), "watermarks": state.get("watermarks", {})}
+
+
+def save_watermarks(org_alias, dbml_name, snapshot, watermarks, state_dir=DEFAULT_STATE_DIR):
+    """
+    Saves the incremental extraction state once a snapshot has been written.
+
+    Args:
+        org_alias (str): The Salesforce org alias.
+        dbml_name (str): Base name of the .dbml file.
+        snapshot (str): Path of the snapshot the watermarks describe.
+        watermarks (dict): Object names mapped to their high-water SystemModstamp.
+        state_dir (str): Directory holding the state files.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    state_file = _state_file(org_alias, dbml_name, state_dir)
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, "w") as file:
+        json.dump({"snapshot": snapshot, "watermarks": watermarks}, file, indent=2)
+    os.replace(tmp_file, state_file)
+
+
+def soql_datetime(stamp):
+    """
+    Converts an API timestamp to a SOQL datetime literal in UTC.
+
+    Fractional seconds are dropped, which can only widen a `>` comparison.
+
+    Args:
+        stamp (str): e.g. `2024-05-01T12:34:56.000+0000`.
+
+    Returns:
+        str: e.g. `2024-05-01T12:34:56Z`.
+    """
+    parsed = datetime.strptime(stamp, API_DATETIME_FORMAT).astimezone(timezone.utc)
+    return parsed.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def fetch_high_water_mark(sf, object_name):
+    """
+    Returns the object's latest SystemModstamp.
+
+    Taken before the extraction query runs, so any change made while the
+    snapshot is being downloaded is picked up again by the next run.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        object_name (str): The object to check.
+
+    Returns:
+        str or None: The latest SystemModstamp, or None if the object is empty.
+    """
+    response = sf.query(
+        f"SELECT SystemModstamp FROM {object_name} ORDER BY SystemModstamp DESC LIMIT 1"
+    )
+    records = response.get("records") or []
+    return records[0]["SystemModstamp"] if records else None
+
+
+def build_delta_soql(object_name, table_plan, watermark):
+    """
+    Builds the query for records changed since `watermark`, keeping the
+    table's own note filter. Records changed so they no longer match the
+    filter are not returned; `iter_changed_ids` finds those.
+
+    Args:
+        object_name (str): The object to query.
+        table_plan (dict): The table's plan from `generate_plan_from_dbml`.
+        watermark (str): The previous high-water SystemModstamp.
+
+    Returns:
+        str: The SOQL query.
+    """
+    condition = f"SystemModstamp > {soql_datetime(watermark)}"
+    return build_soql(object_name, table_plan["fields"], combine_filters(table_plan.get("filter"), condition))
+
+
+def iter_changed_ids(sf, object_name, watermark):
+    """
+    Yields the Id of every record changed since `watermark`, ignoring the
+    table's note filter, so rows of records edited out of the filter can be
+    dropped from the snapshot.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        object_name (str): The object to query.
+        watermark (str): The previous high-water SystemModstamp.
+
+    Yields:
+        str: Each changed record Id.
+    """
+    soql_query = f"SELECT Id FROM {object_name} WHERE SystemModstamp > {soql_datetime(watermark)}"
+    for record in iter_query(sf, soql_query):
+        yield record["Id"]
+
+
+def iter_deleted_ids(sf, object_name, watermark):
+    """
+    Yields the Ids of records deleted since `watermark`, using queryAll.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        object_name (str): The object to query.
+        watermark (str): The previous high-water SystemModstamp.
+
+    Yields:
+        str: Each deleted record Id.
+    """
+    soql_query = (
+        f"SELECT Id FROM {object_name} "
+        f"WHERE IsDeleted = TRUE AND SystemModstamp > {soql_datetime(watermark)}"
+    )
+    for record in iter_query(sf, soql_query, include_deleted=True):
+        yield record["Id"]
+
+
+def merge_snapshot_rows(previous_rows, delta_rows, removed_ids, id_index):
+    """
+    Merges changed and deleted records into the previous snapshot's rows.
+
+    Previous rows are streamed, dropping any whose Id was changed or
+    deleted, then the changed rows are appended.
+
+    Args:
+        previous_rows (iterable): Data rows of the previous snapshot sheet.
+        delta_rows (list): Row tuples of records changed since the watermark
+            that match the table's filter.
+        removed_ids (set): Ids deleted since the watermark, and Ids changed
+            since then whether or not they still match the filter.
+        id_index (int): Position of the `Id` column.
+
+    Yields:
+        tuple: Each row of the merged snapshot.
+    """
+    replaced_ids = {row[id_index] for row in delta_rows}
+    replaced_ids.update(removed_ids)
+    for row in previous_rows:
+        if row[id_index] not in replaced_ids:
+            yield row
+    yield from delta_rows
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import re
+
+# Bump when the model layout or SOQL generation changes, to invalidate old caches
+MODEL_VERSION = "2"
+# Directory holding cached DBML models, relative to the working directory
+DEFAULT_CACHE_DIR = os.path.join(".cache", "dbml")
+
+# Logical column types for DBML field types; anything else is stored as a string
+LOGICAL_TYPES = {
+    "boolean": "boolean",
+    "integer": "integer",
+    "int": "integer",
+    "double": "double",
+    "currency": "double",
+    "percent": "double",
+}
+
+# Clauses that may follow the conditions in a note filter
+_FILTER_TAIL = re.compile(r"\b(ORDER\s+BY|LIMIT|OFFSET)\b", re.IGNORECASE)
+
+
+def _relationship_field(source_field, referenced_table):
+    """
+    Returns the relationship name field selected alongside a lookup field.
+
+    Args:
+        source_field (str): The lookup field, e.g. `Pricebook2Id` or `s_c__Store_Id__c`.
+        referenced_table (str): The object the lookup points to.
+
+    Returns:
+        str: e.g. `Pricebook2.Name` or `s_c__Store_Id__r.Name`.
+    """
+    if source_field.endswith("__c"):
+        # Custom relationship field: replace __c with __r
+        return f"{source_field.replace('__c', '__r')}.Name"
+    # Standard relationship field
+    return f"{referenced_table}.Name"
+
+
+def build_soql(object_name, fields, filter_clause=None):
+    """
+    Builds the SOQL query for a table.
+
+    Args:
+        object_name (str): The object to query.
+        fields (list): Fields to select.
+        filter_clause (str, optional): A `WHERE` clause appended to the query.
+
+    Returns:
+        str: The SOQL query.
+    """
+    soql_query = f"SELECT {', '.join(fields)} FROM {object_name}"
+    if filter_clause:
+        soql_query += f" {filter_clause}"
+    return soql_query
+
+
+def split_filter(filter_clause):
+    """
+    Splits a table's `WHERE` clause into its conditions and any trailing
+    `ORDER BY`, `LIMIT` or `OFFSET` clauses.
+
+    Args:
+        filter_clause (str or None): The table's `WHERE` clause.
+
+    Returns:
+        tuple: (conditions without `WHERE`, tail), each an empty string if absent.
+    """
+    if not filter_clause:
+        return "", ""
+
+    existing = filter_clause.strip()[len("WHERE"):].strip()
+    match = _FILTER_TAIL.search(existing)
+    if not match:
+        return existing, ""
+    return existing[:match.start()].strip(), existing[match.start():].strip()
+
+
+def combine_filters(filter_clause, condition):
+    """
+    ANDs a condition into a table's `WHERE` clause.
+
+    Any trailing `ORDER BY`, `LIMIT` or `OFFSET` in the note filter is kept
+    after the combined condition.
+
+    Args:
+        filter_clause (str or None): The table's `WHERE` clause.
+        condition (str): The condition to add, without `WHERE`.
+
+    Returns:
+        str: The combined `WHERE` clause.
+    """
+    if not filter_clause:
+        return f"WHERE {condition}"
+
+    existing, tail = split_filter(filter_clause)
+    tail = f" {tail}" if tail else ""
+    return f"WHERE ({existing}) AND {condition}{tail}"
+
+
+def parse_table_note(note):
+    """
+    Splits a DBML table note into its SOQL filter and extraction directive.
+
+    A note line consisting only of `BULK` or `REST` forces that extraction
+    backend for the table. The remaining text is used as the filter when it
+    starts with `WHERE`.
+
+    Args:
+        note: The table's note (PyDBML `Note` or string), may be None.
+
+    Returns:
+        tuple: (filter_clause or None, extract_mode or None).
+    """
+    if not note:
+        return None, None
+
+    extract_mode = None
+    lines = []
+    for line in str(note).splitlines():
+        directive = line.strip().upper()
+        if directive in ("BULK", "REST"):
+            extract_mode = directive.lower()
+        else:
+            lines.append(line)
+
+    text = "\n".join(lines).strip()
+    filter_clause = text if text.startswith("WHERE") else None
+    return filter_clause, extract_mode
+
+
+def build_dbml_model(dbml_content):
+    """
+    Parses DBML with PyDBML and derives everything the tool needs from it.
+
+    Args:
+        dbml_content (str): The DBML source.
+
+    Returns:
+        dict: `{"tables": {object_name: table}}` in DBML order, where each table
+        has `columns` (name, type, not_null), `fields` (selected fields in
+        order, which is also the sheet column plan), `types` (the logical
+        type of each field: string, boolean, integer or double), `refs` (column,
+        table, ref_column, type, not_null), `filter`, `mode` and `soql`.
+    """
+    from pydbml import PyDBML
+
+    dbml = PyDBML(dbml_content)
+
+    tables = {}
+    for table in dbml.tables:
+        columns = []
+        fields = []
+        types = []
+        refs = []
+
+        for col in table.columns:
+            columns.append({"name": col.name, "type": str(col.type), "not_null": bool(col.not_null)})
+            # Always include the field itself
+            fields.append(col.name)
+            types.append(LOGICAL_TYPES.get(str(col.type).lower(), "string"))
+
+            # `get_refs()` returns the references where this column is col1
+            for ref in col.get_refs():
+                if not ref.table2 or not ref.col2:
+                    continue
+                refs.append({
+                    "column": col.name,
+                    "table": ref.table2.name,
+                    "ref_column": ref.col2[0].name,
+                    "type": ref.type,
+                    "not_null": bool(col.not_null),
+                })
+                fields.append(_relationship_field(col.name, ref.table2.name))
+                types.append("string")
+
+        # Check for a custom filter and backend directive in the table's note
+        filter_clause, extract_mode = parse_table_note(table.note)
+
+        soql_query = build_soql(table.name, fields, filter_clause) if fields else None
+
+        tables[table.name] = {
+            "columns": columns,
+            "fields": fields,
+            "types": types,
+            "refs": refs,
+            "filter": filter_clause,
+            "mode": extract_mode,
+            "soql": soql_query,
+        }
+
+    return {"tables": tables}
+
+
+def _model_cache_file(raw_content, cache_dir):
+    digest = hashlib.sha256(MODEL_VERSION.encode() + b"\0" + raw_content).hexdigest()
+    return os.path.join(cache_dir, f"{digest}.json")
+
+
+def model_cache_file(dbml_file_path, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Returns the path the model of a .dbml file is cached at, whether or not
+    it has been cached yet.
+    """
+    with open(dbml_file_path, "rb") as file:
+        return _model_cache_file(file.read(), cache_dir)
+
+
+def load_dbml_model(dbml_file_path, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Loads the model for a .dbml file, parsing it only if the cache is stale.
+
+    Models are cached as JSON named by a hash of the file content and
+    `MODEL_VERSION`, so an unchanged file is never parsed twice and every
+    entry point shares the same cached model.
+
+    Args:
+        dbml_file_path (str): Path to the .dbml file.
+        cache_dir (str, optional): Cache directory, or None to disable caching.
+
+    Returns:
+        dict: The model described in `build_dbml_model`.
+    """
+    with open(dbml_file_path, "rb") as file:
+        raw_content = file.read()
+
+    cache_file = None
+    if cache_dir:
+        cache_file = _model_cache_file(raw_content, cache_dir)
+        try:
+            with open(cache_file, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            pass
+
+    model = build_dbml_model(raw_content.decode("utf-8"))
+
+    if cache_file:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file first so readers never see a partial cache
+            tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "w") as file:
+                json.dump(model, file)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"Warning: Could not write DBML cache {cache_file}: {e}")
+
+    return model
@@ -0,0 +1,354 @@
+import csv
+import io
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from salesforce.bulk import iter_failed_results, submit_ingest_job, wait_for_ingest_job
+from salesforce.subset import order_plan_by_refs
+from sheets.utils import SnapshotReader, iter_columns, read_sheet_header
+from telemetry.tracing import describe_span, get_tracer
+
+# Default number of objects upserted in parallel
+DEFAULT_UPSERT_WORKERS = 4
+# CSV bytes uploaded per ingest job. Salesforce accepts up to 100 MB per job;
+# smaller jobs start processing sooner and bound the memory of each upload.
+DEFAULT_MAX_JOB_BYTES = 10 * 1024 * 1024
+# Failed rows of one object listed individually in the Summary log
+DEFAULT_MAX_LOGGED_FAILURES = 1000
+
+
+def describe_upsert_fields(sf, object_name, external_id_field=None):
+    """
+    Finds the fields of an object an upsert can write and the external Id
+    field it matches records on.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        object_name (str): The object to describe.
+        external_id_field (str, optional): The external Id field to use,
+            instead of the first one the describe lists.
+
+    Returns:
+        tuple: (external Id field or None, set of createable or updateable fields).
+
+    Raises:
+        Exception: If the describe call fails.
+    """
+    try:
+        fields = sf.restful(f"sobjects/{object_name}/describe")["fields"]
+    except Exception as e:
+        raise Exception(f"Error describing {object_name}: {e}")
+    writable = {field["name"] for field in fields if field.get("createable") or field.get("updateable")}
+    if external_id_field is None:
+        external_id_field = next((field["name"] for field in fields if field.get("externalId")), None)
+    return external_id_field, writable
+
+
+def relationship_column(lookup_field, external_id_field):
+    """
+    Returns the CSV column that sets a lookup by its parent's external Id.
+
+    Args:
+        lookup_field (str): The lookup field, e.g. `Pricebook2Id` or `s_c__Store_Id__c`.
+        external_id_field (str): The parent's external Id field.
+
+    Returns:
+        str: e.g. `Pricebook2.s_c__sC_Id__c` or `s_c__Store_Id__r.s_c__sC_Id__c`.
+    """
+    if lookup_field.endswith("__c"):
+        return f"{lookup_field[:-3]}__r.{external_id_field}"
+    if lookup_field.endswith("Id"):
+        return f"{lookup_field[:-2]}.{external_id_field}"
+    return f"{lookup_field}.{external_id_field}"
+
+
+def _csv_value(value, logical_type="string"):
+    """Formats a snapshot value for an ingest CSV; blank cells leave the field unchanged."""
+    if value is None:
+        return ""
+    if isinstance(value, bool) or logical_type == "boolean":
+        # SQLite snapshots store booleans as 0 and 1
+        return "true" if value in (True, 1, "1", "true", "TRUE") else "false"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_csv_batches(headers, rows, max_bytes=DEFAULT_MAX_JOB_BYTES):
+    """
+    Encodes rows as UTF-8 CSV in batches of at most `max_bytes`, each with
+    the header row. A single row larger than that gets a batch of its own.
+
+    Args:
+        headers (list): Column names.
+        rows (iterable): Rows of values in `headers` order.
+        max_bytes (int): Encoded size a batch stays within.
+
+    Yields:
+        tuple: (CSV bytes, number of rows) for each batch.
+    """
+    line = io.StringIO()
+    writer = csv.writer(line, lineterminator="\n")
+
+    def encode(row):
+        writer.writerow(row)
+        # Sized once encoded, as non-ASCII characters take several bytes
+        data = line.getvalue().encode("utf-8")
+        line.seek(0)
+        line.truncate()
+        return data
+
+    header = encode(headers)
+    batch, size, row_count = [header], len(header), 0
+    for row in rows:
+        data = encode(row)
+        if row_count and size + len(data) > max_bytes:
+            yield b"".join(batch), row_count
+            batch, size, row_count = [header], len(header), 0
+        batch.append(data)
+        size += len(data)
+        row_count += 1
+    if row_count:
+        yield b"".join(batch), row_count
+
+
+class ExternalIdIndex:
+    """
+    Source record Ids mapped to their external Id values, read from the
+    snapshot once per object, so lookups can be remapped to the target org.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def get(self, object_name, external_id_field):
+        """
+        Returns:
+            dict: Source Ids mapped to external Id values, empty if the
+            object or field is not in the snapshot.
+        """
+        with self._lock:
+            key = (object_name, external_id_field)
+            if key not in self._maps:
+                try:
+                    self._maps[key] = {
+                        record_id: value
+                        for record_id, value in iter_columns(self.snapshot, object_name, ["Id", external_id_field])
+                        if record_id and value not in (None, "")
+                    }
+                except KeyError:
+                    self._maps[key] = {}
+            return self._maps[key]
+
+
+def _log_row(action, details, outcome, artifact=""):
+    return [datetime.now().strftime("%Y-%m-%d %H:%M:%S"), action, details, artifact, outcome]
+
+
+def upsert_object(sf, snapshot, object_name, table_plan, describes, id_index, options):
+    """
+    Upserts one object's snapshot rows with Bulk API 2.0 ingest jobs.
+
+    Rows are streamed from the snapshot into CSV batches of about
+    `max_job_bytes`, each uploaded to its own job as soon as it is full, so
+    Salesforce processes the batches while the rest are read. Lookups to
+    tables with an external Id are remapped from the source org's Ids to
+    the parent's external Id; lookups that cannot be remapped are left out.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        snapshot (str or SnapshotReader): The snapshot written by `--extract`.
+        object_name (str): The object to upsert.
+        table_plan (dict): The table's plan from `generate_plan_from_dbml`.
+        describes (dict): Object names mapped to `describe_upsert_fields`
+            results, or the Exception describing them raised.
+        id_index (ExternalIdIndex): Remaps the lookups.
+        options (dict): `max_job_bytes` and `max_logged_failures`.
+
+    Returns:
+        dict: `object`, `status` (`success`, `partial`, `failed` or
+        `skipped`), `records`, `failed` and `log_rows` for the Summary log.
+    """
+    result = {"object": object_name, "status": "failed", "records": 0, "failed": 0, "log_rows": []}
+    log_rows = result["log_rows"]
+    max_logged = options.get("max_logged_failures", DEFAULT_MAX_LOGGED_FAILURES)
+    try:
+        with get_tracer().span(f"Upsert {object_name}", "object", object=object_name) as span:
+            try:
+                snapshot_columns = read_sheet_header(snapshot, object_name)
+            except KeyError:
+                snapshot_columns = []
+            if not snapshot_columns:
+                logging.warning(f"No data for {object_name} in the snapshot.")
+                log_rows.append(_log_row("Upsert Records", f"No {object_name} rows in the snapshot", "No Data"))
+                result["status"] = "skipped"
+                return result
+
+            describe = describes[object_name]
+            if isinstance(describe, Exception):
+                raise describe
+            external_id_field, writable = describe
+            if not external_id_field:
+                raise Exception(f"{object_name} has no external Id field to upsert on")
+
+            refs = {ref["column"]: ref for ref in table_plan.get("refs", ()) if ref["type"] == ">"}
+            types = dict(zip(table_plan["fields"], table_plan.get("types") or ()))
+            selected, headers, id_maps = [], [], []
+            for column in table_plan["columns"]:
+                name = column["name"]
+                if name == "Id" or name not in writable or name not in snapshot_columns:
+                    continue
+                id_map = None
+                header = name
+                if name in refs:
+                    parent = refs[name]["table"]
+                    parent_describe = describes.get(parent)
+                    parent_external_id = None if isinstance(parent_describe, Exception) or not parent_describe else parent_describe[0]
+                    if not parent_external_id:
+                        log_rows.append(_log_row(
+                            "Skip Field", f"{object_name}.{name}: {parent} has no external Id to remap it to", "Warning"
+                        ))
+                        continue
+                    id_map = id_index.get(parent, parent_external_id)
+                    header = relationship_column(name, parent_external_id)
+                selected.append(name)
+                headers.append(header)
+                id_maps.append(id_map)
+            if external_id_field not in selected:
+                raise Exception(f"The snapshot has no {external_id_field} column for {object_name}")
+            key_index = selected.index(external_id_field)
+
+            failures = []
+            unkeyed = 0
+
+            def rows():
+                nonlocal unkeyed
+                for row in iter_columns(snapshot, object_name, selected):
+                    if row[key_index] in (None, ""):
+                        unkeyed += 1
+                        continue
+                    yield [
+                        _csv_value(id_map.get(value, "") if id_map is not None and value else value, types.get(name))
+                        for name, value, id_map in zip(selected, row, id_maps)
+                    ]
+
+            job_ids = []
+            for csv_data, row_count in iter_csv_batches(headers, rows(), options.get("max_job_bytes") or DEFAULT_MAX_JOB_BYTES):
+                job_ids.append(submit_ingest_job(sf, object_name, csv_data, "upsert", external_id_field))
+            for job_id in job_ids:
+                job_info = wait_for_ingest_job(sf, job_id)
+                result["records"] += job_info.get("numberRecordsProcessed", 0)
+                if job_info.get("numberRecordsFailed"):
+                    for failed_row in iter_failed_results(sf, job_id):
+                        result["failed"] += 1
+                        if len(failures) < max_logged:
+                            failures.append((failed_row.get(external_id_field), failed_row.get("sf__Error")))
+            span.add(records=result["records"])
+
+        upserted = result["records"] - result["failed"]
+        result["status"] = "partial" if result["failed"] or unkeyed else "success"
+        logging.info(f"Upserted {upserted} of {result['records']} {object_name} records in {len(job_ids)} Bulk API job(s).")
+        log_rows.append(_log_row(
+            "Upsert Records",
+            f"Upserted {upserted} of {result['records']} {object_name} records on {external_id_field} "
+            f"in {len(job_ids)} Bulk API job(s)",
+            "Success" if result["status"] == "success" else "Partial",
+            describe_span(span),
+        ))
+        if unkeyed:
+            log_rows.append(_log_row(
+                "Upsert Failure", f"{unkeyed} {object_name} rows have no {external_id_field} and were not sent", "Failure"
+            ))
+        for key, error in failures:
+            log_rows.append(_log_row("Upsert Failure", f"{object_name} {external_id_field} {key}: {error}", "Failure"))
+        if result["failed"] > len(failures):
+            log_rows.append(_log_row(
+                "Upsert Failure", f"{result['failed'] - len(failures)} more failed {object_name} rows not listed", "Failure"
+            ))
+    except Exception as e:
+        result["status"] = "failed"
+        logging.error(f"Error upserting {object_name}: {e}")
+        log_rows.append(_log_row("Error upserting to Salesforce", f"{e}", "Failure", object_name))
+    return result
+
+
+def _skipped_child(object_name, failed_parents):
+    """Returns the `upsert_object` result of an object left out because its parents failed."""
+    details = f"{object_name} not upserted as {', '.join(failed_parents)} failed to upsert"
+    logging.warning(f"{details}.")
+    return {
+        "object": object_name,
+        "status": "failed",
+        "records": 0,
+        "failed": 0,
+        "log_rows": [_log_row("Upsert Records", details, "Skipped")],
+    }
+
+
+def upsert_snapshot(sf, plan, snapshot, workers, options=None):
+    """
+    Upserts every table of a snapshot into an org, parents first.
+
+    Objects are ordered by their `ref: >` references and each starts as soon
+    as the tables it references have finished, so independent objects load
+    concurrently while a child never races its parents. References caught in
+    a cycle are ignored for the ordering. A child of a table that failed is
+    not sent, since every row's lookup would fail; it is logged as failed.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        plan (dict): Object names mapped to table plans from `generate_plan_from_dbml`.
+        snapshot (str): The snapshot written by `--extract`, in any format.
+        workers (int): Objects upserted at once.
+        options (dict, optional): `external_ids` (object names mapped to the
+            external Id field to upsert on), `max_job_bytes` and
+            `max_logged_failures`.
+
+    Returns:
+        list: The `upsert_object` result of each object, parents first.
+    """
+    options = options or {}
+    plan = order_plan_by_refs(plan)
+    position = {object_name: index for index, object_name in enumerate(plan)}
+    parents = {
+        object_name: {
+            ref["table"]
+            for ref in table_plan.get("refs", ())
+            if ref["type"] == ">" and ref["table"] in plan and position[ref["table"]] < position[object_name]
+        }
+        for object_name, table_plan in plan.items()
+    }
+    external_ids = options.get("external_ids") or {}
+
+    def describe(object_name):
+        try:
+            return describe_upsert_fields(sf, object_name, external_ids.get(object_name))
+        except Exception as e:
+            return e
+
+    # Every object's rows and external Ids are read through one reader, so the workbook is loaded once
+    with SnapshotReader(snapshot) as reader:
+        id_index = ExternalIdIndex(reader)
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, int(workers))) as executor:
+            describes = dict(zip(plan, executor.map(describe, plan)))
+            pending = list(plan)
+            running = {}
+            while pending or running:
+                for object_name in [name for name in pending if parents[name].issubset(results)]:
+                    pending.remove(object_name)
+                    failed_parents = sorted(parent for parent in parents[object_name] if results[parent]["status"] == "failed")
+                    if failed_parents:
+                        results[object_name] = _skipped_child(object_name, failed_parents)
+                        continue
+                    future = executor.submit(
+                        upsert_object, sf, reader, object_name, plan[object_name], describes, id_index, options
+                    )
+                    running[future] = object_name
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    results[running.pop(future)] = future.result()
+    return [results[object_name] for object_name in plan]
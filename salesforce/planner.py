@@ -0,0 +1,262 @@
+import heapq
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from salesforce.bulk import BULK_POLL_INTERVAL
+from salesforce.composite import MAX_BATCH_REQUESTS, count_records_batched
+from salesforce.extraction import choose_backend
+from salesforce.queries import (
+    DEFAULT_CHUNK_WORKERS,
+    DEFAULT_PAGE_SIZE,
+    ID_SAMPLE_BATCH_SIZE,
+    build_count_soql,
+    count_records,
+)
+from salesforce.subset import build_subset_constraints, order_plan_by_refs
+
+# Rough costs behind the estimates, overridable with the `plan_costs` config key:
+# seconds per REST request, seconds a Bulk API job spends queued and polled,
+# Bulk API result rows downloaded per second, rows per Bulk result set,
+# rows read back from the query cache or the run's spool per second, and
+# rows the snapshot writer writes per second
+DEFAULT_COSTS = {
+    "request_seconds": 0.5,
+    "bulk_job_seconds": 20.0,
+    "bulk_records_per_second": 20000,
+    "bulk_result_records": 50000,
+    "cache_records_per_second": 50000,
+    "write_records_per_second": 10000,
+}
+
+# How each backend from `choose_backend` is described in the plan
+STRATEGIES = {
+    "empty": "none (empty)",
+    "composite": "Composite Batch",
+    "single": "single REST call",
+    "rest": "paginated stream",
+    "chunked": "PK-chunked",
+    "bulk": "Bulk API",
+    "cached": "query cache",
+    "spooled": "run's spool",
+}
+
+
+def count_tables(sf, plan, org_limiter, workers, batched=False):
+    """
+    Counts every table's records with concurrent `SELECT COUNT()` queries,
+    using the table's note filter.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        plan (dict): Object names mapped to table plans from `generate_plan_from_dbml`.
+        org_limiter (threading.Semaphore): Limits concurrent requests against the org.
+        workers (int): Requests run at once.
+        batched (bool): Send the counts as Composite Batch requests of up to
+            `MAX_BATCH_REQUESTS` queries, themselves sent concurrently.
+
+    Returns:
+        dict: Object names mapped to their record counts. Objects whose
+        count failed are left out.
+    """
+    object_names = list(plan)
+    if batched:
+        groups = [object_names[start:start + MAX_BATCH_REQUESTS] for start in range(0, len(object_names), MAX_BATCH_REQUESTS)]
+    else:
+        groups = [[object_name] for object_name in object_names]
+
+    def count(group):
+        if batched:
+            return count_records_batched(
+                sf, {object_name: build_count_soql(object_name, plan[object_name].get("filter")) for object_name in group}, org_limiter
+            )
+        with org_limiter:
+            return {group[0]: count_records(sf, group[0], plan[group[0]].get("filter"))}
+
+    counts = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(int(workers), len(groups)))) as executor:
+        for group, future in [(group, executor.submit(count, group)) for group in groups]:
+            try:
+                counts.update(future.result())
+            except Exception as e:
+                logging.warning(f"Error counting {', '.join(group)}: {e}")
+    for object_name in object_names:
+        if object_name not in counts:
+            logging.warning(f"No record count for {object_name}; its strategy is picked when it is extracted.")
+    return counts
+
+
+def _estimate(strategy, record_count, options, costs):
+    """Returns (API calls, seconds) to extract one table with a strategy."""
+    page_size = options.get("batch_size") or DEFAULT_PAGE_SIZE
+    pages = max(1, math.ceil(record_count / page_size))
+    if strategy == "empty":
+        # Counted by the batched requests, costed in the totals
+        return 0, 0.0
+    if strategy == "composite":
+        # The first page comes with the batched requests, costed in the totals; any others are paged over REST
+        return pages - 1, (pages - 1) * costs["request_seconds"]
+    if strategy in ("cached", "spooled"):
+        return 0, record_count / costs["cache_records_per_second"]
+    if strategy == "single":
+        return 1, costs["request_seconds"]
+    if strategy == "rest":
+        return pages, pages * costs["request_seconds"]
+    if strategy == "chunked":
+        # One pass over the Ids finds the slice boundaries, starting each slice as it goes,
+        # so the slices finish one slice after the pass or when the workers get through them
+        sample_pages = max(1, math.ceil(record_count / ID_SAMPLE_BATCH_SIZE))
+        slices = math.ceil(record_count / options["chunk_size"])
+        slice_pages = math.ceil(min(record_count, options["chunk_size"]) / page_size)
+        chunk_workers = options.get("chunk_workers") or DEFAULT_CHUNK_WORKERS
+        calls = sample_pages + slices * slice_pages
+        rounds = max(sample_pages + slice_pages, math.ceil(slices / chunk_workers) * slice_pages)
+        return calls, rounds * costs["request_seconds"]
+    # Bulk API: submit, poll, then download the result sets
+    polls = math.ceil(costs["bulk_job_seconds"] / BULK_POLL_INTERVAL)
+    result_sets = max(1, math.ceil(record_count / costs["bulk_result_records"]))
+    seconds = costs["bulk_job_seconds"] + record_count / costs["bulk_records_per_second"]
+    return 1 + polls + result_sets, seconds
+
+
+def plan_extraction(plan, counts, options, workers, costs=None):
+    """
+    Picks each table's strategy from its record count and estimates the API
+    calls and time the extraction will take.
+
+    Tables whose results are in the query cache, or that an earlier attempt
+    of a resumed run spooled in full, take no API calls. The
+    backend is the one `choose_backend` picks, Bulk API, PK-chunked slices
+    or REST, as the extraction does. REST tables at or under the composite
+    threshold get their first page from a share of a Composite Batch
+    request, other tables that fit in one page take a single REST call,
+    and larger ones a paginated stream. Tables with a known count are listed
+    biggest first, which is also the order they are best started in. The
+    total time is the makespan of that order over the object workers, with
+    the single writer taking the tables in plan order: a table is only done
+    once it has been fetched and every table before it written.
+
+    Args:
+        plan (dict): Object names mapped to table plans from `generate_plan_from_dbml`.
+        counts (dict): Object names mapped to record counts from `count_tables`.
+        options (dict): Extraction options, as for `run_extractions`, plus
+            `cached`, the object names whose results are in the query cache,
+            and `spooled`, those replayed from the spool of a resumed run.
+        workers (int): Objects extracted at once.
+        costs (dict, optional): Overrides of `DEFAULT_COSTS`.
+
+    Returns:
+        dict: `objects`, one entry per table with `object`, `records`,
+        `strategy`, `api_calls` and `seconds` (None where the count is
+        unknown), plus the totals `records`, `api_calls` and `seconds`.
+    """
+    costs = dict(DEFAULT_COSTS, **(costs or {}))
+    page_size = options.get("batch_size") or DEFAULT_PAGE_SIZE
+    composite_threshold = 0 if options.get("incremental") else options.get("composite_threshold") or 0
+    cached = set(options.get("cached", ()))
+    spooled = set(options.get("spooled", ()))
+    # Tables narrowed by their subset parents are queried on their own, never batched
+    constrained = build_subset_constraints(order_plan_by_refs(plan)) if options.get("subset") else {}
+    entries = []
+    for object_name, table_plan in plan.items():
+        record_count = counts.get(object_name)
+        if record_count is None:
+            entries.append({"object": object_name, "records": None, "strategy": None, "api_calls": None, "seconds": None})
+            continue
+        if object_name in spooled:
+            strategy = "spooled"
+        elif object_name in cached:
+            strategy = "cached"
+        else:
+            strategy = choose_backend(None, object_name, table_plan, options, record_count)
+        # The same precedence as the extraction: only a table going over REST is batched
+        if strategy == "rest" and composite_threshold and record_count <= composite_threshold and object_name not in constrained:
+            strategy = "composite" if record_count else "empty"
+        elif strategy == "rest" and record_count <= page_size:
+            strategy = "single"
+        api_calls, seconds = _estimate(strategy, record_count, options, costs)
+        entries.append({
+            "object": object_name,
+            "records": record_count,
+            "strategy": strategy,
+            "api_calls": api_calls,
+            "seconds": round(seconds, 1),
+        })
+    entries.sort(key=lambda entry: (entry["seconds"] is None, -(entry["seconds"] or 0), -(entry["records"] or 0)))
+    known = [entry for entry in entries if entry["seconds"] is not None]
+    # The writer takes the tables in plan order, parents first for a subset, which also starts them that way
+    write_order = list(order_plan_by_refs(plan) if options.get("subset") else plan)
+    start_order = sorted(known, key=lambda entry: write_order.index(entry["object"])) if options.get("subset") else known
+    # The counts of the tables not cached or spooled, plus the Composite Batch requests fetching the small tables
+    counted = len(plan) - len((cached | spooled) & set(plan))
+    batched = sum(1 for entry in known if entry["strategy"] == "composite")
+    if composite_threshold:
+        batch_calls = math.ceil(counted / MAX_BATCH_REQUESTS) + math.ceil(batched / MAX_BATCH_REQUESTS)
+    else:
+        batch_calls = counted
+    return {
+        "objects": entries,
+        "records": sum(entry["records"] for entry in known),
+        "api_calls": batch_calls + sum(entry["api_calls"] for entry in known),
+        "seconds": round(
+            (math.ceil(batched / MAX_BATCH_REQUESTS) + 1) * costs["request_seconds"]
+            + _makespan(start_order, write_order, workers, costs),
+            1,
+        ),
+    }
+
+
+def _makespan(entries, write_order, workers, costs):
+    """
+    Time to extract the entries, started in their order on `workers`
+    parallel workers, each taking the next when free, while one writer
+    writes them in `write_order`.
+
+    Pages a table fetches before the writer reaches it wait in its buffer,
+    so the workers never wait on the writer; the writer starts a table once
+    it has finished the one before and the table has started, and is done
+    with it no sooner than the table is fetched.
+    """
+    workers = [0.0] * max(1, int(workers))
+    fetched = {}
+    for entry in entries:
+        started = heapq.heappop(workers)
+        fetched[entry["object"]] = (started, started + entry["seconds"])
+        heapq.heappush(workers, started + entry["seconds"])
+
+    records = {entry["object"]: entry["records"] for entry in entries}
+    written = 0.0
+    for object_name in write_order:
+        if object_name not in fetched:
+            continue
+        started, finished = fetched[object_name]
+        written = max(max(written, started) + records[object_name] / costs["write_records_per_second"], finished)
+    return written
+
+
+def schedule_order(extraction_plan):
+    """Returns the object names biggest first, the order that minimizes the run's makespan."""
+    return [entry["object"] for entry in extraction_plan["objects"]]
+
+
+def format_plan(extraction_plan):
+    """
+    Renders an extraction plan as a table for the console.
+
+    Returns:
+        list: Lines of text.
+    """
+    width = max([len("Object")] + [len(entry["object"]) for entry in extraction_plan["objects"]])
+    lines = [f"{'Object':<{width}}  {'Records':>10}  {'Strategy':<16}  {'API calls':>9}  {'Est. time':>9}"]
+    for entry in extraction_plan["objects"]:
+        if entry["records"] is None:
+            lines.append(f"{entry['object']:<{width}}  {'?':>10}  {'(count failed)':<16}  {'?':>9}  {'?':>9}")
+            continue
+        lines.append(
+            f"{entry['object']:<{width}}  {entry['records']:>10}  {STRATEGIES[entry['strategy']]:<16}  "
+            f"{entry['api_calls']:>9}  {entry['seconds']:>8}s"
+        )
+    lines.append(
+        f"{'Total':<{width}}  {extraction_plan['records']:>10}  {'':<16}  "
+        f"{extraction_plan['api_calls']:>9}  {extraction_plan['seconds']:>8}s"
+    )
+    return lines
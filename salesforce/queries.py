@@ -1,4 +1,60 @@
-from pydbml import PyDBML
+import math
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import chain
+from salesforce.model import build_soql, combine_filters, load_dbml_model, split_filter
+from telemetry.tracing import get_tracer
+
+# Records per REST query page when no batch size is set
+DEFAULT_PAGE_SIZE = 2000
+# Id range slices of one object fetched at once in chunked mode
+DEFAULT_CHUNK_WORKERS = 4
+# Ids per page requested by the boundary sampling pass
+ID_SAMPLE_BATCH_SIZE = 2000
+# Pages each slice may fetch ahead of the merge
+CHUNK_BUFFER_PAGES = 2
+
+# The parts of a generated query: SELECT fields FROM object [WHERE ...]
+_SOQL_PARTS = re.compile(
+    r"^\s*SELECT\s+(?P<fields>.+?)\s+FROM\s+(?P<object>\w+)(?:\s+(?P<filter>WHERE\b.*?))?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Marks the end of a slice's pages
+_SLICE_END = object()
+
+
+def generate_plan_from_dbml(dbml_file_path):
+    """
+    Builds the extraction plan for each Salesforce object in a .dbml file.
+
+    The file is parsed with PyDBML only when its cached model is missing or
+    stale (see `load_dbml_model`).
+
+    Args:
+        dbml_file_path (str): Path to the .dbml file.
+
+    Returns:
+        dict: Object names mapped to a plan dict with keys `soql` (the SOQL
+        query), `fields` (selected fields in order, which is also the sheet
+        column plan), `refs` (the table's references), `filter` (the `WHERE`
+        clause from the table note, or None) and `mode` (`bulk`, `rest` or
+        None when the backend should be chosen automatically).
+    """
+    plan = {}
+    try:
+        model = load_dbml_model(dbml_file_path)
+        for object_name, table in model["tables"].items():
+            if table["soql"]:
+                plan[object_name] = table
+    except Exception as e:
+        print(f"Error parsing .dbml file with PyDBML: {e}")
+
+    return plan
+
 
 def generate_soql_from_dbml(dbml_file_path):
     """
@@ -10,76 +66,400 @@ def generate_soql_from_dbml(dbml_file_path):
     Returns:
         dict: A dictionary with object names as keys and SOQL queries as values.
     """
-    queries = {}
+    return {
+        object_name: table_plan["soql"]
+        for object_name, table_plan in generate_plan_from_dbml(dbml_file_path).items()
+    }
+
+
+def build_count_soql(object_name, filter_clause=None):
+    """
+    Builds the `SELECT COUNT()` query for a table.
+
+    Args:
+        object_name (str): The object to count.
+        filter_clause (str, optional): The table's `WHERE` clause.
+
+    Returns:
+        str: The SOQL query.
+    """
+    return build_soql(object_name, ["COUNT()"], filter_clause)
+
+
+def count_records(sf, object_name, filter_clause=None):
+    """
+    Counts the records a table's query would return with `SELECT COUNT()`.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        object_name (str): The object to count.
+        filter_clause (str, optional): The table's `WHERE` clause.
+
+    Returns:
+        int: The number of matching records.
+
+    Raises:
+        Exception: If the query fails or an error response is returned.
+    """
     try:
-        # Parse the .dbml file
-        with open(dbml_file_path, "r") as file:
-            dbml_content = file.read()
-        
-        dbml = PyDBML(dbml_content)
-
-        # Iterate through tables and construct SOQL queries
-        for table in dbml.tables:
-            object_name = table.name
-            soql_fields = []
-
-            # Inspect columns to build the field list
-            for col in table.columns:
-                # Always include the field itself
-                soql_fields.append(col.name)
-
-                # Use `get_refs()` to check for relationships
-                refs = col.get_refs()
-                for ref in refs:
-                    # Extract the source field (col1) and target table (table2)
-                    source_field = ref.col1[0].name if ref.col1 and isinstance(ref.col1, list) else None
-                    referenced_table = ref.table2.name if ref.table2 else None
-
-                    if source_field and referenced_table:
-                        if source_field.endswith("__c"):
-                            # Custom relationship field: replace __c with __r
-                            custom_relationship = source_field.replace("__c", "__r")
-                            soql_fields.append(f"{custom_relationship}.Name")
-                        else:
-                            # Standard relationship field
-                            soql_fields.append(f"{referenced_table}.Name")
-
-            # Check for a custom filter in the table's note attribute
-            filter_clause = None
-            if table.note and str(table.note).startswith("WHERE"):
-                filter_clause = str(table.note).strip()
-
-            # Build SOQL query for the table
-            if soql_fields:
-                soql_query = f"SELECT {', '.join(soql_fields)} FROM {object_name}"
-                if filter_clause:
-                    soql_query += f" {filter_clause}"
-                queries[object_name] = soql_query
-    
+        return sf.query(build_count_soql(object_name, filter_clause))["totalSize"]
     except Exception as e:
-        print(f"Error parsing .dbml file with PyDBML: {e}")
-    
-    return queries
+        raise Exception(f"Error counting {object_name}: {e}")
 
 
-def query_objects(sf, soql_query):
+def iter_query_pages(sf, soql_query, batch_size=None, include_deleted=False, locator=None):
     """
-    Executes a SOQL query against the Salesforce API.
+    Executes a SOQL query and yields each page of results as it is retrieved,
+    following `nextRecordsUrl` until the query locator is exhausted.
 
     Args:
         sf (Salesforce): The Salesforce connection object.
         soql_query (str): The SOQL query to execute.
+        batch_size (int, optional): Requested page size, sent as the
+            `Sforce-Query-Options` header (200-2000). Salesforce may return
+            smaller pages than requested.
+        include_deleted (bool): Use the queryAll resource so deleted and
+            archived records are included.
+        locator (str, optional): Continue an earlier execution of the query
+            from this locator (see `next_locator`) instead of running it.
+
+    Yields:
+        dict: The raw response for each page (`records`, `totalSize`, `done`
+        and `nextRecordsUrl`).
+
+    Raises:
+        Exception: If a request fails or an error response is returned.
+    """
+    headers = {}
+    if batch_size:
+        headers["Sforce-Query-Options"] = f"batchSize={int(batch_size)}"
+
+    def query_more(locator):
+        return _timed_page(
+            sf.query_more,
+            locator,
+            identifier_is_url=False,
+            include_deleted=include_deleted,
+            headers=headers,
+        )
+
+    try:
+        if locator is None:
+            response = _timed_page(sf.query, soql_query, include_deleted=include_deleted, headers=headers)
+        else:
+            response = query_more(locator)
+        while True:
+            if not response or 'records' not in response:
+                raise Exception(f"Invalid response structure: {response}")
+            yield response
+
+            locator = next_locator(response)
+            if locator is None:
+                break
+            response = query_more(locator)
+    except Exception as e:
+        raise Exception(f"Error querying Salesforce: {e}")
+
+
+def next_locator(response):
+    """
+    Returns the locator of the page after a query response.
+
+    The locator is taken from `nextRecordsUrl` and resolved against the
+    connection's base URL rather than used as an absolute URL, so the same
+    code path works against any endpoint.
+
+    Args:
+        response (dict): A query response from `iter_query_pages`.
 
     Returns:
-        list: The query result records.
+        str or None: e.g. `01gD0000002HU6KIAW-2000`, or None on the last page.
+    """
+    next_records_url = response.get('nextRecordsUrl')
+    if response.get('done', True) or not next_records_url:
+        return None
+    return next_records_url.rstrip('/').rsplit('/', 1)[-1]
+
+
+def _timed_page(request, *args, **kwargs):
+    """Makes one query request inside a page span counting its records."""
+    with get_tracer().span("Query page", "page") as span:
+        response = request(*args, **kwargs)
+        span.add(records=len((response or {}).get('records') or []))
+    return response
+
+
+def iter_query(sf, soql_query, batch_size=None, include_deleted=False):
+    """
+    Executes a SOQL query and yields records one at a time as pages arrive.
+
+    Only one page of records is held in memory at a time, so callers can start
+    processing before the final page has been retrieved.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        soql_query (str): The SOQL query to execute.
+        batch_size (int, optional): Requested page size (see `iter_query_pages`).
+        include_deleted (bool): Include deleted and archived records.
+
+    Yields:
+        dict: Each record as returned by the API.
+    """
+    for page in iter_query_pages(sf, soql_query, batch_size, include_deleted):
+        yield from page['records']
+
+
+def query_objects(sf, soql_query, batch_size=None, chunk_size=None, workers=DEFAULT_CHUNK_WORKERS):
+    """
+    Executes a SOQL query against the Salesforce API, following
+    `nextRecordsUrl` so that every page of results is returned.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        soql_query (str): The SOQL query to execute.
+        batch_size (int, optional): Requested page size (see `iter_query_pages`).
+        chunk_size (int, optional): Split the query into Id range slices of
+            this many records, fetched concurrently and returned in Id order
+            (see `iter_id_chunked_pages`).
+        workers (int): Slices fetched at once in chunked mode.
+
+    Returns:
+        list: All query result records.
 
     Raises:
         Exception: If the query fails or an error response is returned.
     """
+    if chunk_size:
+        return [
+            record
+            for page in iter_id_chunked_pages(sf, soql_query, chunk_size, batch_size, workers)
+            for record in page['records']
+        ]
+    return list(iter_query(sf, soql_query, batch_size))
+
+
+def split_soql(soql_query):
+    """
+    Splits a generated query into the parts needed to slice it by Id.
+
+    Args:
+        soql_query (str): A query of the form `SELECT fields FROM object [WHERE ...]`.
+
+    Returns:
+        tuple or None: (fields, object name, `WHERE` clause or None), or None
+        if the query cannot be sliced because it has subqueries or its own
+        `ORDER BY`, `LIMIT` or `OFFSET`.
+    """
+    match = _SOQL_PARTS.match(soql_query)
+    if not match or "(" in match.group("fields"):
+        return None
+    filter_clause = match.group("filter")
+    if split_filter(filter_clause)[1]:
+        return None
+    fields = [field.strip() for field in match.group("fields").split(",")]
+    return fields, match.group("object"), filter_clause
+
+
+def iter_id_boundaries(sf, object_name, filter_clause, chunk_size, limiter=None, parent_span=None):
+    """
+    Finds the Ids that split an object's records into slices of `chunk_size`,
+    with one pass over its Ids in `ORDER BY Id` order.
+
+    Only the `Id` field is fetched, in the largest pages Salesforce allows,
+    and each boundary is yielded as soon as its page arrives, so the slices
+    before it can start while the pass goes on.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        object_name (str): The object to slice.
+        filter_clause (str or None): The table's `WHERE` clause.
+        chunk_size (int): Records per slice.
+        limiter (optional): Context manager held around each request, such as
+            the org limiter.
+        parent_span (Span, optional): Span the pass belongs to, when it runs
+            on a thread of its own.
+
+    Yields:
+        str: The first Id of every slice after the first, in ascending order.
+    """
+    limiter = limiter or nullcontext()
+    chunk_size = max(1, int(chunk_size))
+    pages = iter_query_pages(
+        sf, f"{build_soql(object_name, ['Id'], filter_clause)} ORDER BY Id", ID_SAMPLE_BATCH_SIZE
+    )
+
+    position = 0
+    # The sampled Ids are not records of the extraction itself
+    with get_tracer().span("Find Id boundaries", "sampling", parent=parent_span, isolate=("records",)):
+        while True:
+            with limiter:
+                page = next(pages, None)
+            if page is None:
+                return
+            for record in page["records"]:
+                if position and position % chunk_size == 0:
+                    yield record["Id"]
+                position += 1
+
+
+def chunking_saves_time(record_count, chunk_size, batch_size=None, workers=DEFAULT_CHUNK_WORKERS):
+    """
+    Whether fetching a table as Id range slices takes fewer round trips in a
+    row than one query cursor.
+
+    The boundary pass walks the Ids serially, ID_SAMPLE_BATCH_SIZE at a
+    time, so the last slice starts only once it is done; with pages as
+    large as the pass's, the pass alone costs as much as the cursor.
+
+    Args:
+        record_count (int): The table's record count.
+        chunk_size (int): Records per slice.
+        batch_size (int, optional): Requested page size.
+        workers (int): Slices fetched at once.
+
+    Returns:
+        bool: True if the slices should finish sooner.
+    """
+    page_size = batch_size or DEFAULT_PAGE_SIZE
+    pages = math.ceil(record_count / page_size)
+    slices = math.ceil(record_count / chunk_size)
+    slice_pages = math.ceil(min(record_count, chunk_size) / page_size)
+    pass_pages = math.ceil(record_count / ID_SAMPLE_BATCH_SIZE)
+    return max(pass_pages + slice_pages, math.ceil(slices / max(1, int(workers))) * slice_pages) < pages
+
+
+def build_id_range_query(soql_query, lower=None, upper=None):
+    """
+    Rewrites a query into the query of one Id range slice, ordered by Id.
+
+    Args:
+        soql_query (str): A query accepted by `split_soql`.
+        lower (str, optional): First Id of the slice, from `iter_id_boundaries`.
+        upper (str, optional): First Id of the next slice.
+
+    Returns:
+        str: A SOQL query for the records from `lower` up to `upper`, in Id order.
+    """
+    fields, object_name, filter_clause = split_soql(soql_query)
+    conditions = []
+    if lower:
+        conditions.append(f"Id >= '{lower}'")
+    if upper:
+        conditions.append(f"Id < '{upper}'")
+    slice_filter = combine_filters(filter_clause, " AND ".join(conditions)) if conditions else filter_clause
+    return f"{build_soql(object_name, fields, slice_filter)} ORDER BY Id"
+
+
+def _put_page(pages_queue, item, cancelled):
+    """Queues an item for the merge, giving up once the merge is cancelled."""
+    while not cancelled.is_set():
+        try:
+            pages_queue.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _fetch_slice(sf, soql_query, batch_size, limiter, pages_queue, cancelled, parent_span):
+    """Fetches one slice's pages into its queue, ending with `_SLICE_END` or the error."""
+    end = _SLICE_END
     try:
-        response = sf.query(soql_query)
-        if not response or 'records' not in response:
-            raise Exception(f"Invalid response structure: {response}")
-        return response['records']
+        with get_tracer().span("Id range slice", "slice", parent=parent_span):
+            pages = iter_query_pages(sf, soql_query, batch_size)
+            while not cancelled.is_set():
+                with limiter:
+                    page = next(pages, None)
+                if page is None or not _put_page(pages_queue, page, cancelled):
+                    break
     except Exception as e:
-        raise Exception(f"Error querying Salesforce: {e}")
+        end = e
+    finally:
+        _put_page(pages_queue, end, cancelled)
+
+
+def iter_id_chunked_pages(sf, soql_query, chunk_size, batch_size=None, workers=DEFAULT_CHUNK_WORKERS, limiter=None):
+    """
+    Executes a query as concurrent Id range slices and yields the pages
+    merged back in Id order.
+
+    The boundaries come from `iter_id_boundaries`, on a thread of its own,
+    and each slice starts as soon as its upper boundary is found rather than
+    after the whole pass. Each slice runs on its own query cursor and may
+    fetch a few pages ahead, while pages are yielded strictly slice by
+    slice, so records arrive in ascending Id order. Queries that cannot be
+    sliced run on a single cursor.
+
+    Args:
+        sf (Salesforce): The Salesforce connection object.
+        soql_query (str): The SOQL query to execute.
+        chunk_size (int): Records per slice.
+        batch_size (int, optional): Requested page size (see `iter_query_pages`).
+        workers (int): Slices fetched at once.
+        limiter (optional): Context manager held around each request, such as
+            the org limiter.
+
+    Yields:
+        dict: The raw response for each page, in Id order.
+
+    Raises:
+        Exception: If a request fails or an error response is returned.
+    """
+    limiter = limiter or nullcontext()
+    parts = split_soql(soql_query)
+    if not parts:
+        pages = iter_query_pages(sf, soql_query, batch_size)
+        while True:
+            with limiter:
+                page = next(pages, None)
+            if page is None:
+                return
+            yield page
+
+    _, object_name, filter_clause = parts
+    cancelled = threading.Event()
+    parent_span = get_tracer().current()
+    # The page queue of each slice in Id order, ending with `_SLICE_END` or the boundary pass's error
+    slices = queue.Queue()
+    executor = ThreadPoolExecutor(max_workers=max(1, int(workers)))
+
+    def start_slices():
+        # Each slice is started once its upper boundary is known, in Id order, so the
+        # slice being merged always has a worker
+        end = _SLICE_END
+        try:
+            lower = None
+            boundaries = iter_id_boundaries(sf, object_name, filter_clause, chunk_size, limiter, parent_span)
+            for upper in chain(boundaries, [None]):
+                if cancelled.is_set():
+                    break
+                pages_queue = queue.Queue(maxsize=CHUNK_BUFFER_PAGES)
+                executor.submit(
+                    _fetch_slice, sf, build_id_range_query(soql_query, lower, upper), batch_size, limiter,
+                    pages_queue, cancelled, parent_span,
+                )
+                slices.put(pages_queue)
+                lower = upper
+        except Exception as e:
+            end = e
+        finally:
+            slices.put(end)
+
+    threading.Thread(target=start_slices, daemon=True).start()
+    try:
+        while True:
+            pages_queue = slices.get()
+            if pages_queue is _SLICE_END:
+                return
+            if isinstance(pages_queue, Exception):
+                raise pages_queue
+            while True:
+                item = pages_queue.get()
+                if item is _SLICE_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,286 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+# Directory holding the page spools of extraction runs, relative to the working directory
+DEFAULT_RUNS_DIR = os.path.join(".cache", "runs")
+# Rows per spooled page when pre-tabulated rows (Bulk API results, merged deltas) are spooled
+SPOOL_PAGE_ROWS = 2000
+
+_MANIFEST = "run.json"
+
+
+def _write_json(path, data):
+    """
+    Replaces a JSON file atomically, so a crash leaves the old or the new
+    version. The temporary file has a unique name, so processes sharing a
+    directory never write into each other's.
+    """
+    fd, tmp_file = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file, indent=2)
+        os.replace(tmp_file, path)
+    except BaseException:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+        raise
+
+
+def new_run_id(org_alias, dbml_name):
+    """
+    Builds the Id of a new extraction run.
+
+    Returns:
+        str: e.g. `NewDemo_Products_20240501-123456`.
+    """
+    return f"{org_alias}_{dbml_name}_{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+
+
+class RunSpool:
+    """
+    The on-disk spool of one extraction run: a manifest with the run's
+    arguments, plus one `ObjectSpool` per object.
+    """
+
+    def __init__(self, run_id, runs_dir=DEFAULT_RUNS_DIR):
+        self.run_id = run_id
+        self.run_dir = os.path.join(runs_dir, run_id)
+
+    @classmethod
+    def create(cls, run_id, arguments, runs_dir=DEFAULT_RUNS_DIR):
+        """
+        Creates the spool for a new run.
+
+        Args:
+            run_id (str): Id from `new_run_id`.
+            arguments (dict): The run's command line arguments, restored by `--resume`.
+            runs_dir (str): Directory holding the run spools.
+
+        Returns:
+            RunSpool: The new spool.
+        """
+        spool = cls(run_id, runs_dir)
+        os.makedirs(spool.run_dir, mode=0o700)
+        _write_json(os.path.join(spool.run_dir, _MANIFEST), {
+            "run_id": run_id,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "arguments": arguments,
+        })
+        return spool
+
+    @classmethod
+    def open(cls, run_id, runs_dir=DEFAULT_RUNS_DIR):
+        """
+        Opens the spool of an earlier run.
+
+        Returns:
+            RunSpool: The spool.
+
+        Raises:
+            Exception: If the run has no spool.
+        """
+        spool = cls(run_id, runs_dir)
+        if not os.path.exists(os.path.join(spool.run_dir, _MANIFEST)):
+            raise Exception(f"No spooled run {run_id} in {runs_dir}")
+        return spool
+
+    @property
+    def arguments(self):
+        """The command line arguments the run was started with."""
+        with open(os.path.join(self.run_dir, _MANIFEST)) as file:
+            return json.load(file)["arguments"]
+
+    def completed_objects(self):
+        """
+        Returns:
+            dict: The objects an earlier attempt of the run spooled in full,
+            mapped to their record counts.
+        """
+        completed = {}
+        for name in os.listdir(self.run_dir):
+            if name.endswith(".state.json"):
+                reader = SpoolReader(self.run_dir, name[:-len(".state.json")])
+                if reader.complete:
+                    completed[reader.object_name] = reader.records
+        return completed
+
+    def object_spool(self, object_name):
+        """Returns the spool of one object, loading any state left by an earlier attempt."""
+        return ObjectSpool(self.run_dir, object_name)
+
+    def remove(self):
+        """Deletes the run's spool once its snapshot has been written."""
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+
+class _BoundedFile(io.RawIOBase):
+    """Reads a file only up to `size` bytes, ignoring anything appended after."""
+
+    def __init__(self, file, size):
+        self._file = file
+        self._remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._file.read(min(len(buffer), self._remaining))
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+
+class SpoolReader:
+    """
+    Reads spooled pages without ever changing the files, for spools another
+    thread or process may be using, such as query cache entries. Only the
+    bytes the state file vouches for are read.
+    """
+
+    def __init__(self, run_dir, object_name):
+        self.object_name = object_name
+        self.data_file = os.path.join(run_dir, f"{object_name}.jsonl.gz")
+        self.state_file = os.path.join(run_dir, f"{object_name}.state.json")
+        try:
+            with open(self.state_file) as file:
+                self.state = json.load(file)
+        except (OSError, ValueError):
+            self.state = {}
+
+    @property
+    def complete(self):
+        return self.state.get("status") == "complete"
+
+    @property
+    def kind(self):
+        return self.state.get("kind")
+
+    @property
+    def cursor(self):
+        """Where to continue a partial record spool, or None if it must start over."""
+        return self.state.get("cursor") if self.state.get("status") == "partial" else None
+
+    @property
+    def records(self):
+        return self.state.get("records", 0)
+
+    def iter_pages(self):
+        """
+        Reads the spooled pages back in order.
+
+        Yields:
+            list: Each page of records or rows.
+        """
+        offset = self.state.get("offset")
+        if not offset:
+            return
+        with open(self.data_file, "rb") as raw:
+            bounded = io.BufferedReader(_BoundedFile(raw, offset))
+            with gzip.open(bounded, "rt", encoding="utf-8") as file:
+                for line in file:
+                    yield json.loads(line)
+
+    def iter_rows(self):
+        """Yields every spooled row of a `rows` spool."""
+        for page in self.iter_pages():
+            yield from page
+
+
+class ObjectSpool(SpoolReader):
+    """
+    The spooled pages of one object and the state needed to resume it.
+
+    Pages are appended to `<object>.jsonl.gz` as one gzip member each, and
+    the state file records the bytes, pages and records known to be
+    complete along with the cursor of the next page. The state is only
+    updated after a page has been written, so on load any partly written
+    page left by a crash is cut off.
+
+    A spool holds either record pages (REST queries) or rows with a header
+    (Bulk API results and incremental merges), and is `partial` until every
+    page has been spooled, then `complete`.
+    """
+
+    def __init__(self, run_dir, object_name):
+        super().__init__(run_dir, object_name)
+        if os.path.exists(self.data_file):
+            with open(self.data_file, "r+b") as file:
+                file.truncate(self.state.get("offset", 0))
+
+    def _save(self):
+        _write_json(self.state_file, self.state)
+
+    def reset(self, kind="records", headers=None, **attributes):
+        """
+        Empties the spool before the object is extracted (again).
+
+        Args:
+            kind (str): `records` for record pages, `rows` for tabulated rows.
+            headers (list, optional): Column names of a `rows` spool.
+            **attributes: Extra state restored on resume, such as the watermark.
+        """
+        with open(self.data_file, "wb"):
+            pass
+        self.state = {
+            "status": "partial",
+            "kind": kind,
+            "headers": headers,
+            "offset": 0,
+            "pages": 0,
+            "records": 0,
+            "cursor": None,
+            **attributes,
+        }
+        self._save()
+
+    def append(self, page, cursor=None):
+        """
+        Spools one page of records or rows.
+
+        Args:
+            page (list): The records or rows.
+            cursor (dict, optional): Where the next page starts, for resuming.
+        """
+        member = gzip.compress(json.dumps(page, default=str).encode("utf-8") + b"\n", compresslevel=1)
+        with open(self.data_file, "ab") as file:
+            file.write(member)
+        self.state["offset"] += len(member)
+        self.state["pages"] += 1
+        self.state["records"] += len(page)
+        self.state["cursor"] = cursor
+        self._save()
+
+    def mark_complete(self):
+        """Marks every page as spooled."""
+        self.state["status"] = "complete"
+        self.state["cursor"] = None
+        self._save()
+
+    def spool_rows(self, rows):
+        """
+        Passes tabulated rows through while spooling them in pages, marking
+        the spool complete once the rows are exhausted.
+
+        Args:
+            rows (iterable): The rows, consumed by the snapshot writer.
+
+        Yields:
+            The same rows.
+        """
+        page = []
+        for row in rows:
+            page.append(row)
+            if len(page) >= SPOOL_PAGE_ROWS:
+                self.append(page)
+                page = []
+            yield row
+        if page:
+            self.append(page)
+        self.mark_complete()
@@ -0,0 +1,114 @@
+from salesforce.model import build_soql, combine_filters
+
+# Longest SOQL sent for one batch of a subset query. Queries are sent in the
+# URL of a GET request, so stay well below both the 100,000 character SOQL
+# limit and the request line limit once the Ids are URL-encoded.
+DEFAULT_MAX_SOQL_LENGTH = 10000
+
+
+def order_plan_by_refs(plan):
+    """
+    Orders a plan so every table comes after the tables it references.
+
+    Only `ref: >` references between tables in the plan count. Ties keep the
+    DBML order, and tables caught in a reference cycle are appended in DBML
+    order once nothing else can be placed.
+
+    Args:
+        plan (dict): Object names mapped to table plans from `generate_plan_from_dbml`.
+
+    Returns:
+        dict: The same table plans, parents first.
+    """
+    parents = {
+        object_name: {
+            ref["table"]
+            for ref in table_plan.get("refs", ())
+            if ref["type"] == ">" and ref["table"] in plan and ref["table"] != object_name
+        }
+        for object_name, table_plan in plan.items()
+    }
+
+    ordered = {}
+    while len(ordered) < len(plan):
+        ready = [
+            object_name for object_name in plan
+            if object_name not in ordered and parents[object_name].issubset(ordered)
+        ]
+        if not ready:
+            # Break a cycle at the first remaining table in DBML order
+            ready = [next(object_name for object_name in plan if object_name not in ordered)]
+        for object_name in ready:
+            ordered[object_name] = plan[object_name]
+    return ordered
+
+
+def build_subset_constraints(plan):
+    """
+    Works out which tables a subset extraction narrows to their parents.
+
+    A table is restricted when its note has a filter or when it references a
+    restricted table earlier in `plan`. Each restricted child is queried by
+    one driving reference (a `not null` one when there is a choice), with the
+    parent's keys sent in batched `IN` clauses. Any other references to
+    restricted parents are checked as records arrive.
+
+    Args:
+        plan (dict): Table plans in the order from `order_plan_by_refs`.
+
+    Returns:
+        dict: Child object names mapped to their references to restricted
+        parents, driving reference first.
+    """
+    restricted = set()
+    constraints = {}
+    for object_name, table_plan in plan.items():
+        refs = [
+            ref for ref in table_plan.get("refs", ())
+            if ref["type"] == ">" and ref["table"] in restricted and ref["table"] != object_name
+        ]
+        if refs:
+            # Stable sort puts required references first
+            constraints[object_name] = sorted(refs, key=lambda ref: not ref["not_null"])
+        if refs or table_plan.get("filter"):
+            restricted.add(object_name)
+    return constraints
+
+
+def build_subset_queries(object_name, table_plan, column, keys, max_length=DEFAULT_MAX_SOQL_LENGTH):
+    """
+    Builds the queries for the records whose `column` is one of `keys`,
+    batching the keys into `IN` clauses that keep each query under `max_length`.
+
+    Args:
+        object_name (str): The object to query.
+        table_plan (dict): The table's plan from `generate_plan_from_dbml`.
+        column (str): The lookup field to filter on.
+        keys (iterable): The parent keys to match.
+        max_length (int): Longest SOQL query to build.
+
+    Returns:
+        list: SOQL queries, empty when there are no keys.
+    """
+    def query(batch):
+        condition = f"{column} IN ({', '.join(batch)})"
+        return build_soql(object_name, table_plan["fields"], combine_filters(table_plan.get("filter"), condition))
+
+    # Length of a query with an empty IN list, then each literal adds its own length plus ", "
+    base_length = len(query([]))
+    queries = []
+    batch = []
+    length = base_length
+    for key in sorted(keys):
+        literal = "'{}'".format(str(key).replace("\\", "\\\\").replace("'", "\\'"))
+        added = len(literal) + (2 if batch else 0)
+        if batch and length + added > max_length:
+            queries.append(query(batch))
+            batch = []
+            length = base_length
+            added = len(literal)
+        batch.append(literal)
+        length += added
+    if batch:
+        queries.append(query(batch))
+    return queries
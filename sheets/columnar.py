@@ -0,0 +1,113 @@
+import sys
+from array import array
+from sheets.manager import compile_flattener
+
+# Byte marking a null in a boolean column, and the values each byte decodes to
+_NULL_BOOLEAN = 2
+_BOOLEANS = (False, True, None)
+_BOOLEAN_BYTES = {False: 0, True: 1, None: _NULL_BOOLEAN}
+_NUMBER_TYPES = {"double": {int, float}, "integer": {int}}
+_INTEGER_RANGE = (-2 ** 63, 2 ** 63)
+_NONE = type(None)
+
+
+def _pack_column(values, logical_type):
+    """
+    Stores one column's values compactly for its logical type.
+
+    Args:
+        values (tuple): The column's values in row order.
+        logical_type (str): string, boolean, integer or double.
+
+    Returns:
+        tuple: (kind, data, nulls). `boolean` columns are bytes of 0, 1 or
+        `_NULL_BOOLEAN`; `double` and `integer` columns an `array('d')` or
+        `array('q')` with zeros for nulls and a null mask, which is None when
+        the column has no nulls. Anything else, including values that do not
+        fit the type, is a list with its strings interned.
+    """
+    value_types = set(map(type, values))
+    has_nulls = _NONE in value_types
+    value_types.discard(_NONE)
+    if logical_type == "boolean" and value_types <= {bool}:
+        return "boolean", bytes(map(_BOOLEAN_BYTES.__getitem__, values)), None
+    if value_types and value_types <= _NUMBER_TYPES.get(logical_type, set()):
+        present = [value for value in values if value is not None] if has_nulls else values
+        if logical_type == "double" or _INTEGER_RANGE[0] <= min(present) and max(present) < _INTEGER_RANGE[1]:
+            typecode = "d" if logical_type == "double" else "q"
+            if not has_nulls:
+                return logical_type, array(typecode, values), None
+            nulls = bytes(value is None for value in values)
+            return logical_type, array(typecode, [0 if value is None else value for value in values]), nulls
+    if value_types == {str} and not has_nulls:
+        return "object", list(map(sys.intern, values)), None
+    return "object", [sys.intern(value) if type(value) is str else value for value in values], None
+
+
+def _unpack_column(kind, data, nulls):
+    """Returns a packed column's values as a list, with None for nulls."""
+    if kind == "boolean":
+        return list(map(_BOOLEANS.__getitem__, data))
+    if kind == "object":
+        return data
+    if nulls is None:
+        return data.tolist()
+    return [None if null else value for value, null in zip(data, nulls)]
+
+
+class RecordBatch:
+    """
+    One page of records held column by column in the table's DBML field
+    order.
+
+    A page is decoded as soon as it arrives. The table's flattener reads
+    only the planned fields, so `attributes` and the nested lookup dicts are
+    released with the page. Booleans and numbers go into typed arrays and
+    strings are interned, so repeated picklist values share one object.
+    """
+
+    __slots__ = ("columns", "length", "_data")
+
+    def __init__(self, columns, length, data):
+        self.columns = columns
+        self.length = length
+        self._data = data
+
+    @classmethod
+    def from_records(cls, columns, records, types=None, flattener=None):
+        """
+        Decodes a page of API records.
+
+        Args:
+            columns (list): Field paths in sheet column order.
+            records (list): Record dicts from a query page.
+            types (list, optional): Logical type of each column, defaulting to string.
+            flattener (callable, optional): `compile_flattener(columns)`, to
+                reuse across the pages of a table.
+
+        Returns:
+            RecordBatch: The decoded page.
+        """
+        flattener = flattener or compile_flattener(columns)
+        types = types or ["string"] * len(columns)
+        rows = [flattener(record) for record in records]
+        if not rows:
+            return cls(list(columns), 0, [("object", [], None) for _ in columns])
+        data = [_pack_column(values, logical_type) for values, logical_type in zip(zip(*rows), types)]
+        return cls(list(columns), len(rows), data)
+
+    def __len__(self):
+        return self.length
+
+    def column(self, name):
+        """
+        Returns one column's values in row order, with None for nulls.
+
+        Raises:
+            ValueError: If the batch has no such column.
+        """
+        return _unpack_column(*self._data[self.columns.index(name)])
+
+    def iter_rows(self):
+        """Yields each record as a tuple of values in column order."""
+        return zip(*(_unpack_column(*packed) for packed in self._data))
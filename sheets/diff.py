@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+from sheets.manager import SheetRows
+from sheets.utils import SnapshotReader, iter_sheet_rows, list_sheet_names, read_sheet_header
+
+# Entries an index keeps in memory before spilling to disk. A hash-only entry
+# costs about 150 bytes, so the default stays around 150 MB per index.
+DEFAULT_MAX_INDEX_RECORDS = 1000000
+# Columns of the table listing the differences
+CHANGE_HEADERS = ["Object", "Id", "Change", "Field", "Old Value", "New Value"]
+# Name of the run log table in every snapshot
+SUMMARY_TABLE = "Summary"
+
+# A number written as text, as the Bulk API and CSV sources hold them; leading zeros mark a code, not a number
+_NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?")
+# Booleans written as text, rendered as stored booleans are
+_BOOLEAN_TEXT = {"true": "1", "false": "0"}
+
+
+class SpillingIndex:
+    """
+    A map from record Id to a small value that lives in memory until it
+    holds `max_records` entries, then moves to a SQLite file on disk.
+    """
+
+    def __init__(self, max_records=DEFAULT_MAX_INDEX_RECORDS, spill_dir=None):
+        self.max_records = max_records
+        self.spill_dir = spill_dir
+        self._memory = {}
+        self._connection = None
+        self._spill_file = None
+
+    @property
+    def spilled(self):
+        return self._connection is not None
+
+    def _spill(self):
+        fd, self._spill_file = tempfile.mkstemp(prefix="diff-index-", suffix=".sqlite", dir=self.spill_dir)
+        os.close(fd)
+        self._connection = sqlite3.connect(self._spill_file)
+        self._connection.execute("PRAGMA journal_mode = OFF")
+        self._connection.execute("PRAGMA synchronous = OFF")
+        self._connection.execute("CREATE TABLE entries (id TEXT PRIMARY KEY, value BLOB)")
+        self._connection.executemany("INSERT INTO entries VALUES (?, ?)", self._memory.items())
+        self._memory = {}
+
+    def __setitem__(self, record_id, value):
+        if self._connection is not None:
+            self._connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?)", (record_id, value))
+            return
+        self._memory[record_id] = value
+        if len(self._memory) > self.max_records:
+            self._spill()
+
+    def get(self, record_id):
+        if self._connection is None:
+            return self._memory.get(record_id)
+        row = self._connection.execute("SELECT value FROM entries WHERE id = ?", (record_id,)).fetchone()
+        return row[0] if row else None
+
+    def pop(self, record_id):
+        """Removes an entry, returning its value or None."""
+        if self._connection is None:
+            return self._memory.pop(record_id, None)
+        value = self.get(record_id)
+        if value is not None:
+            self._connection.execute("DELETE FROM entries WHERE id = ?", (record_id,))
+        return value
+
+    def __len__(self):
+        if self._connection is None:
+            return len(self._memory)
+        return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def keys(self):
+        """Yields the Ids in the index."""
+        if self._connection is None:
+            yield from list(self._memory)
+        else:
+            yield from (row[0] for row in self._connection.execute("SELECT id FROM entries ORDER BY id"))
+
+    def close(self):
+        self._memory = {}
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            os.remove(self._spill_file)
+
+
+def _normalize(value):
+    """
+    Renders a cell so equal values compare equal whichever format or API
+    stored them: booleans as 1 or 0, whole numbers without a fraction, and
+    numbers and booleans held as text the same way as typed ones.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        if value in _BOOLEAN_TEXT:
+            return _BOOLEAN_TEXT[value]
+        if not _NUMBER.fullmatch(value):
+            return value
+        number = Decimal(value)
+        return str(int(number)) if number == number.to_integral_value() else str(float(number))
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _row_digest(values):
+    return hashlib.blake2b("\x1f".join(values).encode("utf-8"), digest_size=8).digest()
+
+
+def _keyed_rows(path, table_name, columns):
+    """Yields (Id, normalized values of `columns`) for each row of a table with an Id."""
+    rows = iter_sheet_rows(path, table_name)
+    try:
+        headers = list(next(rows, None) or [])
+        id_index = headers.index("Id")
+        indexes = [headers.index(column) for column in columns]
+        for row in rows:
+            record_id = row[id_index] if id_index < len(row) else None
+            if record_id in (None, ""):
+                continue
+            yield record_id, [_normalize(row[index]) if index < len(row) else "" for index in indexes]
+    finally:
+        rows.close()
+
+
+def _read_headers(path, table_name):
+    """Returns a table's header row, empty if the snapshot does not have the table."""
+    try:
+        return read_sheet_header(path, table_name)
+    except KeyError:
+        return []
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def diff_table(old_path, new_path, table_name, log_data, max_records=DEFAULT_MAX_INDEX_RECORDS, spill_dir=None):
+    """
+    Compares one table between two snapshots, keyed by record `Id`.
+
+    The old snapshot is read once into an index of Id to a hash of the
+    row's values, then the new snapshot is streamed against it: unknown Ids
+    are added, matching hashes unchanged. Changed rows keep their new
+    values until a second pass over the old snapshot produces the per-field
+    deltas, and Ids left in the index were removed. Both indexes spill to
+    disk past `max_records` entries, so memory stays bounded.
+
+    Only columns present in both snapshots are compared; added and removed
+    columns are logged.
+
+    Args:
+        old_path (str or SnapshotReader): The earlier snapshot, in any format.
+        new_path (str or SnapshotReader): The later snapshot, in any format.
+        table_name (str): The table to compare.
+        log_data (list of lists): Receives the table's Summary rows once its
+            differences have been consumed.
+        max_records (int): Index entries held in memory before spilling.
+        spill_dir (str, optional): Directory for spilled indexes.
+
+    Yields:
+        list: One row per added or removed record, and one per changed
+        field of a changed record, in `CHANGE_HEADERS` order.
+    """
+    old_headers = _read_headers(old_path, table_name)
+    new_headers = _read_headers(new_path, table_name)
+    if (old_headers and "Id" not in old_headers) or (new_headers and "Id" not in new_headers):
+        log_data.append([_now(), "Compare Table", f"{table_name} has no Id column", "", "Skipped"])
+        return
+    if old_headers and new_headers:
+        columns = [column for column in new_headers if column in old_headers and column != "Id"]
+        for column in new_headers:
+            if column not in old_headers:
+                log_data.append([_now(), "Compare Table", f"Column {table_name}.{column} added", "", "Changed"])
+        for column in old_headers:
+            if column not in new_headers:
+                log_data.append([_now(), "Compare Table", f"Column {table_name}.{column} removed", "", "Changed"])
+    else:
+        columns = []
+
+    old_index = SpillingIndex(max_records, spill_dir)
+    changed = SpillingIndex(max_records, spill_dir)
+    counts = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+    try:
+        if old_headers:
+            for record_id, values in _keyed_rows(old_path, table_name, columns):
+                old_index[record_id] = _row_digest(values)
+
+        if new_headers:
+            for record_id, values in _keyed_rows(new_path, table_name, columns):
+                old_digest = old_index.pop(record_id)
+                if old_digest is None:
+                    counts["added"] += 1
+                    yield [table_name, record_id, "added", "", "", ""]
+                elif old_digest != _row_digest(values):
+                    changed[record_id] = json.dumps(values)
+                else:
+                    counts["unchanged"] += 1
+
+        if len(changed):
+            for record_id, old_values in _keyed_rows(old_path, table_name, columns):
+                new_values = changed.pop(record_id)
+                if new_values is None:
+                    continue
+                counts["changed"] += 1
+                for column, old_value, new_value in zip(columns, old_values, json.loads(new_values)):
+                    if old_value != new_value:
+                        yield [table_name, record_id, "changed", column, old_value, new_value]
+
+        for record_id in old_index.keys():
+            counts["removed"] += 1
+            yield [table_name, record_id, "removed", "", "", ""]
+
+        spilled = " (indexed on disk)" if old_index.spilled or changed.spilled else ""
+        log_data.append([
+            _now(),
+            "Compare Table",
+            f"{table_name}: {counts['added']} added, {counts['removed']} removed, "
+            f"{counts['changed']} changed, {counts['unchanged']} unchanged{spilled}",
+            "Sheet Changes",
+            "Changed" if counts["added"] or counts["removed"] or counts["changed"] else "Unchanged",
+        ])
+    finally:
+        old_index.close()
+        changed.close()
+
+
+def diff_snapshots(old_path, new_path, log_data, max_records=DEFAULT_MAX_INDEX_RECORDS, spill_dir=None):
+    """
+    Compares every table of two snapshots, one table at a time.
+
+    Args:
+        old_path (str): The earlier snapshot, in any format.
+        new_path (str): The later snapshot, in any format.
+        log_data (list of lists): Receives a Summary row per table.
+        max_records (int): Index entries held in memory before spilling.
+        spill_dir (str, optional): Directory for spilled indexes.
+
+    Returns:
+        dict: `{"Changes": SheetRows}`, ready for `write_snapshot`. The rows
+        are produced as the writer consumes them, with each snapshot opened
+        once for every table.
+    """
+    def rows():
+        with SnapshotReader(old_path) as old_snapshot, SnapshotReader(new_path) as new_snapshot:
+            old_tables = [name for name in list_sheet_names(old_snapshot) if name != SUMMARY_TABLE]
+            new_tables = [name for name in list_sheet_names(new_snapshot) if name != SUMMARY_TABLE]
+            tables = new_tables + [name for name in old_tables if name not in new_tables]
+            for table_name in tables:
+                yield from diff_table(old_snapshot, new_snapshot, table_name, log_data, max_records, spill_dir)
+
+    return {"Changes": SheetRows(CHANGE_HEADERS, rows())}
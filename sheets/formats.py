@@ -0,0 +1,202 @@
+import os
+import shutil
+import sqlite3
+from decimal import Decimal
+from itertools import islice
+from sheets.manager import create_workbook, iter_tables
+
+# File extension of each snapshot format
+FORMAT_EXTENSIONS = {
+    "xlsx": ".xlsx",
+    "sqlite": ".sqlite",
+    "parquet": ".parquet",
+}
+# Rows buffered per insert batch or Parquet row group
+WRITE_BATCH_ROWS = 10000
+# Name of the run log table in every format
+SUMMARY_TABLE = "Summary"
+
+# SQLite column affinity for each logical type
+_SQLITE_TYPES = {"boolean": "INTEGER", "integer": "INTEGER", "double": "REAL", "string": "TEXT"}
+
+
+def _to_boolean(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return value.lower() == "true"
+    return bool(value)
+
+
+def _to_integer(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        # Parsed exactly rather than through a float, which loses digits past 2**53
+        try:
+            return int(value)
+        except ValueError:
+            return int(Decimal(value))
+    return int(value)
+
+
+def _to_double(value):
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def _to_string(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return value
+    return str(value)
+
+
+# Converts API, CSV or workbook values to each logical type
+VALUE_CONVERTERS = {
+    "boolean": _to_boolean,
+    "integer": _to_integer,
+    "double": _to_double,
+    "string": _to_string,
+}
+
+
+def _column_types(schema, table_name, headers):
+    """Returns the logical type of each header, defaulting to string."""
+    table_types = (schema or {}).get(table_name, {})
+    return [table_types.get(header, "string") for header in headers]
+
+
+def _typed_rows(rows, types):
+    """Yields rows with every value converted to its column's logical type."""
+    converters = [VALUE_CONVERTERS[column_type] for column_type in types]
+    for row in rows:
+        yield tuple(convert(value) for convert, value in zip(converters, row))
+
+
+def _summary_rows(log_data):
+    """Splits the Summary log into headers and string rows."""
+    headers = [str(value) for value in log_data[0]] if log_data else []
+    rows = [[_to_string(value) for value in row] for row in log_data[1:]]
+    return headers, rows
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def write_sqlite(data, filename, log_data, schema=None):
+    """
+    Writes a snapshot to a SQLite database with one typed table per object.
+
+    Rows are inserted in batches as they stream in. The run log is stored in
+    a `Summary` table, written last.
+
+    Args:
+        data (dict or iterable): Data for each table (see `iter_tables`).
+        filename (str): Path of the database file, replaced if it exists.
+        log_data (list of lists): Logs for the Summary table, header row first.
+        schema (dict, optional): Table names mapped to {field: logical type}.
+    """
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    connection = sqlite3.connect(filename)
+    try:
+        for table_name, headers, rows in iter_tables(data):
+            types = _column_types(schema, table_name, headers)
+            columns = ", ".join(
+                f"{_quote(header)} {_SQLITE_TYPES[column_type]}" for header, column_type in zip(headers, types)
+            )
+            connection.execute(f"CREATE TABLE {_quote(table_name)} ({columns})")
+
+            insert = f"INSERT INTO {_quote(table_name)} VALUES ({', '.join('?' * len(headers))})"
+            typed_rows = _typed_rows(rows, types)
+            while True:
+                batch = list(islice(typed_rows, WRITE_BATCH_ROWS))
+                if not batch:
+                    break
+                connection.executemany(insert, batch)
+
+        # Write logs last, once every table has been consumed
+        headers, rows = _summary_rows(log_data)
+        connection.execute(
+            f"CREATE TABLE {_quote(SUMMARY_TABLE)} ({', '.join(f'{_quote(header)} TEXT' for header in headers)})"
+        )
+        connection.executemany(
+            f"INSERT INTO {_quote(SUMMARY_TABLE)} VALUES ({', '.join('?' * len(headers))})", rows
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def write_parquet(data, filename, log_data, schema=None):
+    """
+    Writes a snapshot as a directory of Parquet files, one typed file per
+    object plus `Summary.parquet` for the run log.
+
+    Rows are written one row group at a time as they stream in. Requires
+    the optional `pyarrow` package.
+
+    Args:
+        data (dict or iterable): Data for each table (see `iter_tables`).
+        filename (str): Path of the snapshot directory, replaced if it exists.
+        log_data (list of lists): Logs for the Summary table, header row first.
+        schema (dict, optional): Table names mapped to {field: logical type}.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise Exception("The parquet format requires pyarrow (pip install pyarrow).")
+
+    arrow_types = {"boolean": pa.bool_(), "integer": pa.int64(), "double": pa.float64(), "string": pa.string()}
+
+    if os.path.isdir(filename):
+        shutil.rmtree(filename)
+    os.makedirs(filename)
+
+    for table_name, headers, rows in iter_tables(data):
+        types = _column_types(schema, table_name, headers)
+        arrow_schema = pa.schema([(header, arrow_types[column_type]) for header, column_type in zip(headers, types)])
+        typed_rows = _typed_rows(rows, types)
+
+        with pq.ParquetWriter(os.path.join(filename, f"{table_name}.parquet"), arrow_schema) as writer:
+            while True:
+                batch = list(islice(typed_rows, WRITE_BATCH_ROWS))
+                if not batch:
+                    break
+                writer.write_batch(pa.record_batch(list(zip(*batch)), schema=arrow_schema))
+
+    # Write logs last, once every table has been consumed
+    headers, rows = _summary_rows(log_data)
+    summary_schema = pa.schema([(header, pa.string()) for header in headers])
+    columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in headers]
+    pq.write_table(pa.table(columns, schema=summary_schema), os.path.join(filename, f"{SUMMARY_TABLE}.parquet"))
+
+
+def write_snapshot(output_format, data, filename, log_data, schema=None, workbook_options=None):
+    """
+    Writes a snapshot in the requested format.
+
+    Args:
+        output_format (str): One of `FORMAT_EXTENSIONS`.
+        data (dict or iterable): Data for each table (see `iter_tables`).
+        filename (str): Output path.
+        log_data (list of lists): Logs for the Summary table, header row first.
+        schema (dict, optional): Table names mapped to {field: logical type},
+            used by the typed formats.
+        workbook_options (dict, optional): Extra `create_workbook` arguments
+            for xlsx, such as `max_workbook_rows`.
+    """
+    if output_format == "xlsx":
+        create_workbook(data, filename, log_data, **(workbook_options or {}))
+    elif output_format == "sqlite":
+        write_sqlite(data, filename, log_data, schema)
+    elif output_format == "parquet":
+        write_parquet(data, filename, log_data, schema)
+    else:
+        raise Exception(f"Unsupported output format: {output_format}")
@@ -1,5 +1,76 @@
-from openpyxl import Workbook
+import multiprocessing
+import queue
+from collections import namedtuple
+from itertools import chain, islice
 from datetime import datetime
+from sheets.utils import companion_filename, shard_title
+from telemetry.tracing import get_tracer
+
+# Rows Excel allows on one sheet, including the header row
+EXCEL_MAX_ROWS = 1048576
+# Data rows written to one workbook before further sheets go to a companion
+# workbook; Excel slows down badly well before the file format's limits
+DEFAULT_WORKBOOK_ROWS = 2000000
+# Companion workbooks built at once, each in its own process
+DEFAULT_WORKBOOK_WORKERS = 2
+# Rows sent to a companion workbook's process per message, and messages queued
+COMPANION_BATCH_ROWS = 1000
+COMPANION_QUEUE_BATCHES = 16
+# Seconds between checks that a companion workbook's process is still alive while its queue is full
+COMPANION_POLL_SECONDS = 1
+
+# Pre-tabulated sheet data (e.g. Bulk API CSV results): a header row and an
+# iterable of value rows in the same column order
+SheetRows = namedtuple("SheetRows", ["headers", "rows"])
+
+# Stand-in for a null lookup so nested field access yields None
+_EMPTY = {}
+# Marks the end of a table's rows
+_NO_ROW = object()
+
+
+def compile_flattener(columns):
+    """
+    Builds a function that turns a raw API record into a row tuple.
+
+    The column plan (e.g. `["Id", "Pricebook2Id", "Pricebook2.Name"]`) is
+    known up front from the DBML, so the top-level field of every column is
+    read in one `map` over `record.get`, and only relationship columns walk
+    into their nested dicts. Records are converted without inspecting their
+    keys, `attributes` is never read, and a null lookup yields an empty cell
+    instead of dropping the column.
+
+    Args:
+        columns (list): Field paths in sheet column order, using `.` for
+            relationship fields.
+
+    Returns:
+        callable: Maps a record dict to a tuple of values in column order.
+    """
+    paths = [column.split(".") for column in columns]
+    heads = tuple(path[0] for path in paths)
+    # Lookup fields one level deep (`Pricebook2.Name`), and any deeper paths
+    lookups = tuple((index, path[1]) for index, path in enumerate(paths) if len(path) == 2)
+    deeper = tuple((index, tuple(path[1:])) for index, path in enumerate(paths) if len(path) > 2)
+
+    if not lookups and not deeper:
+        def flatten(record):
+            return tuple(map(record.get, heads))
+        return flatten
+
+    def flatten_nested(record):
+        values = list(map(record.get, heads))
+        for index, field in lookups:
+            parent = values[index]
+            values[index] = parent.get(field) if parent else None
+        for index, parts in deeper:
+            value = values[index]
+            for part in parts:
+                value = (value or _EMPTY).get(part)
+            values[index] = value
+        return tuple(values)
+    return flatten_nested
+
 
 def flatten_record(record):
     """
@@ -22,41 +93,303 @@ def flatten_record(record):
             flattened[key] = str(value) if value is not None else ""  # Convert to string
     return flattened
 
-def create_workbook(data, filename, log_data):
+
+def iter_tables(data):
+    """
+    Normalizes writer input into tabulated tables, skipping tables without rows.
+
+    Args:
+        data (dict or iterable): Data for each table (table name as key,
+            an iterable of records or a `SheetRows` of already tabulated rows
+            as values), or an iterable of (table name, data) pairs.
+
+    Yields:
+        tuple: (table name, headers, rows iterator). Record dicts are
+        flattened lazily with headers taken from the first record. Each
+        table is timed as a `write` span covering the time the writer spends
+        on it, including waiting for streamed records.
+    """
+    items = data.items() if hasattr(data, "items") else data
+    for table_name, records in items:
+        if isinstance(records, SheetRows):
+            rows = iter(records.rows)
+            first_row = next(rows, None)
+            if first_row is not None:
+                yield table_name, list(records.headers), _timed_rows(table_name, chain([first_row], rows))
+            continue
+
+        records = iter(records)
+        first_record = next(records, None)
+        if first_record is None:
+            continue
+
+        # Extract headers from the first record, excluding 'attributes' columns
+        flattened = flatten_record(first_record)
+        headers = [key for key in flattened.keys() if key not in ['attributes.type', 'attributes.url'] and not key.endswith(".attributes")]
+        yield table_name, headers, _timed_rows(table_name, _flatten_rows(chain([first_record], records), headers))
+
+
+def _timed_rows(table_name, rows):
+    span = get_tracer().start_span(f"Write {table_name}", "write", table=table_name)
+    row_count = 0
+    try:
+        for row in rows:
+            row_count += 1
+            yield row
+    finally:
+        span.add(records=row_count)
+        span.finish()
+
+
+def _flatten_rows(records, headers):
+    for record in records:
+        flattened = flatten_record(record)
+        yield [flattened.get(header, "") for header in headers]
+
+
+def _append_rows(sheet, rows, illegal_characters):
+    """
+    Appends rows to a worksheet, returning how many were written. Control
+    characters Excel does not allow in a cell are removed from strings.
+    """
+    row_count = 0
+    for row in rows:
+        sheet.append([illegal_characters.sub("", value) if type(value) is str else value for value in row])
+        row_count += 1
+    return row_count
+
+
+def _write_companion_workbook(filename, messages, errors):
+    """
+    Builds a companion workbook in a worker process from the messages sent
+    by `_CompanionWorkbook`: `("sheet", title, headers)`, `("rows", rows)`
+    and finally `("save",)`. An error is sent back on `errors` before the
+    process exits.
+    """
+    try:
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+        workbook = Workbook(write_only=True)
+        sheet = None
+        while True:
+            message = messages.get()
+            if message[0] == "sheet":
+                sheet = workbook.create_sheet(title=message[1])
+                _append_rows(sheet, [message[2]], ILLEGAL_CHARACTERS_RE)
+            elif message[0] == "rows":
+                _append_rows(sheet, message[1], ILLEGAL_CHARACTERS_RE)
+            else:
+                break
+        workbook.save(filename)
+    except BaseException as e:
+        errors.put(f"{type(e).__name__}: {e}")
+        raise
+
+
+class _PrimaryWorkbook:
+    """The workbook holding the Summary sheet, built in this process."""
+
+    def __init__(self, filename):
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+        self.filename = filename
+        self.workbook = Workbook(write_only=True)
+        self._illegal_characters = ILLEGAL_CHARACTERS_RE
+        # The Summary tab comes first but is written last
+        self.summary_sheet = self.workbook.create_sheet(title="Summary")
+
+    def write_sheet(self, title, headers, rows):
+        """Writes one sheet, returning its number of data rows."""
+        sheet = self.workbook.create_sheet(title=title)
+        _append_rows(sheet, [headers], self._illegal_characters)
+        return _append_rows(sheet, rows, self._illegal_characters)
+
+    def write_summary(self, log_rows):
+        """Appends rows to the Summary sheet."""
+        _append_rows(self.summary_sheet, log_rows, self._illegal_characters)
+
+
+class _CompanionWorkbook:
+    """A companion workbook built by a worker process from the rows sent to it."""
+
+    def __init__(self, filename):
+        # Spawned rather than forked, as extraction threads may be running
+        context = multiprocessing.get_context("spawn")
+        self.filename = filename
+        self._messages = context.Queue(maxsize=COMPANION_QUEUE_BATCHES)
+        self._errors = context.Queue()
+        self._process = context.Process(
+            target=_write_companion_workbook, args=(filename, self._messages, self._errors), daemon=True
+        )
+        self._process.start()
+
+    def _send(self, message):
+        """
+        Queues a message for the worker, waiting while the queue is full.
+
+        Raises:
+            Exception: If the worker has died, so nothing would drain the queue.
+        """
+        while True:
+            try:
+                self._messages.put(message, timeout=COMPANION_POLL_SECONDS)
+                return
+            except queue.Full:
+                if not self._process.is_alive():
+                    raise self._failure()
+
+    def _failure(self):
+        """Returns the worker's error once it has exited."""
+        self._process.join()
+        # Messages left for a dead worker must not keep this process from exiting
+        self._messages.cancel_join_thread()
+        try:
+            detail = self._errors.get(timeout=COMPANION_POLL_SECONDS)
+        except queue.Empty:
+            detail = f"exit code {self._process.exitcode}"
+        return Exception(f"Error writing companion workbook {self.filename}: {detail}")
+
+    def write_sheet(self, title, headers, rows):
+        """Sends one sheet to the worker, returning its number of data rows."""
+        self._send(("sheet", title, list(headers)))
+        row_count = 0
+        rows = iter(rows)
+        while True:
+            batch = [tuple(row) for row in islice(rows, COMPANION_BATCH_ROWS)]
+            if not batch:
+                return row_count
+            self._send(("rows", batch))
+            row_count += len(batch)
+
+    def close(self):
+        """Tells the worker to save the workbook once it has written every row."""
+        self._send(("save",))
+
+    def is_alive(self):
+        return self._process.is_alive()
+
+    def join(self):
+        """
+        Waits for the worker to save the workbook.
+
+        Raises:
+            Exception: If the worker failed.
+        """
+        self._process.join()
+        if self._process.exitcode != 0:
+            raise self._failure()
+
+    def terminate(self):
+        self._messages.cancel_join_thread()
+        self._process.terminate()
+        self._process.join()
+
+
+def create_workbook(data, filename, log_data, max_workbook_rows=DEFAULT_WORKBOOK_ROWS, workers=DEFAULT_WORKBOOK_WORKERS):
     """
     Creates an Excel workbook with logs and data.
 
+    The workbook is written in openpyxl's write-only mode: each record is
+    flattened and appended as it is read, so memory does not grow with the
+    number of rows. The Summary tab comes first but is written last, so log
+    rows added while the data sheets stream in are included.
+
+    A table with more rows than fit on one sheet continues on numbered
+    sheets (`Product2`, `Product2 (2)`, ...). Once a workbook holds
+    `max_workbook_rows` rows, further sheets go to companion workbooks
+    (`<name>.part2.xlsx`, ...), each built and saved by its own worker
+    process while the next one is fed. The Summary tab ends with an index
+    of the sheet and workbook each table's rows landed in.
+
     Args:
-        data (dict): Data for each table (table name as key, records as values).
+        data (dict or iterable): Data for each table (see `iter_tables`).
+            Tables without records get no sheet.
         filename (str): Path to save the workbook.
         log_data (list of lists): Logs to include in the workbook's Summary tab.
+        max_workbook_rows (int, optional): Data rows per workbook before a
+            companion workbook is started, None for a single workbook.
+        workers (int): Companion workbooks built at once.
+
+    Returns:
+        list: The workbooks written, this one first.
+
+    Raises:
+        Exception: If a companion workbook could not be written.
     """
-    workbook = Workbook()
+    primary = _PrimaryWorkbook(filename)
+    workbook = primary
+    companions = []
+    index_rows = []
+    workbook_rows = 0
+    try:
+        # Create sheets for each table's data, writing rows as they stream in
+        for table_name, headers, rows in iter_tables(data):
+            rows = iter(rows)
+            part = 0
+            first_row = 1
+            while True:
+                row = next(rows, _NO_ROW)
+                if row is _NO_ROW:
+                    break
+                if max_workbook_rows and workbook_rows >= max_workbook_rows:
+                    if workbook is not primary:
+                        workbook.close()
+                    workbook = _start_companion(filename, companions, workers)
+                    workbook_rows = 0
+
+                part += 1
+                limit = EXCEL_MAX_ROWS - 1
+                if max_workbook_rows:
+                    limit = min(limit, max_workbook_rows - workbook_rows)
+                title = shard_title(table_name, part)
+                row_count = workbook.write_sheet(title, headers, chain([row], islice(rows, limit - 1)))
 
-    # Create the summary sheet for logs
-    summary_sheet = workbook.active
-    summary_sheet.title = "Summary"
+                location = f"Sheet {title}"
+                if workbook is not primary:
+                    location += f" in workbook part {len(companions) + 1}"
+                index_rows.append([
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "Sheet Index",
+                    f"Rows {first_row}-{first_row + row_count - 1} of {table_name}",
+                    location,
+                    "Success"
+                ])
+                first_row += row_count
+                workbook_rows += row_count
+        if workbook is not primary:
+            workbook.close()
 
-    # Write logs starting at row 1
-    for row_idx, log_row in enumerate(log_data, start=1):
-        for col_idx, value in enumerate(log_row, start=1):
-            summary_sheet.cell(row=row_idx, column=col_idx, value=value)
+        # Write logs last, once every data sheet has been consumed
+        primary.write_summary(log_data + index_rows)
 
-    # Create sheets for each table's data
-    for sheet_name, records in data.items():
-        # Create a new sheet for the table
-        sheet = workbook.create_sheet(title=sheet_name)
+        # Save the workbook
+        with get_tracer().span("Save workbook", "write"):
+            primary.workbook.save(filename)
+            for companion in companions:
+                companion.join()
+    except BaseException:
+        for companion in companions:
+            companion.terminate()
+        raise
+    return [filename] + [companion.filename for companion in companions]
 
-        if records:
-            # Flatten records and extract headers, excluding 'attributes' columns
-            flattened_records = [flatten_record(record) for record in records]
-            headers = [key for key in flattened_records[0].keys() if key not in ['attributes.type', 'attributes.url'] and not key.endswith(".attributes")]
-            sheet.append(headers)
 
-            # Append flattened records
-            for record in flattened_records:
-                row = [record.get(header, "") for header in headers]
-                sheet.append(row)
+def _start_companion(filename, companions, workers):
+    """
+    Starts the next companion workbook, once fewer than `workers` are still
+    being built.
 
-    # Save the workbook
-    workbook.save(filename)
+    Raises:
+        Exception: If a companion workbook that has finished failed.
+    """
+    for companion in companions:
+        if not companion.is_alive():
+            companion.join()
+    building = [companion for companion in companions if companion.is_alive()]
+    if len(building) >= max(1, int(workers)):
+        building[0].join()
+    companion = _CompanionWorkbook(companion_filename(filename, len(companions) + 2))
+    companions.append(companion)
+    return companion
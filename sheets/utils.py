@@ -0,0 +1,357 @@
+import glob
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Title of a sheet continuing an oversized table, e.g. `Product2 (2)`
+_SHARD_TITLE = re.compile(r"^(?P<table>.+) \((?P<part>\d+)\)$")
+# Companion workbook of a workbook, e.g. `snapshot.part2.xlsx`
+_COMPANION_FILE = re.compile(r"\.part(?P<part>\d+)\.xlsx$")
+
+
+def _store_format(path):
+    """Returns the snapshot format of a path: xlsx, sqlite or parquet."""
+    if os.path.isdir(path) or path.endswith(".parquet"):
+        return "parquet"
+    if path.endswith((".sqlite", ".db")):
+        return "sqlite"
+    return "xlsx"
+
+
+def companion_filename(filename, part):
+    """
+    Returns the name of a workbook's companion workbook.
+
+    Args:
+        filename (str): The primary workbook, e.g. `snapshot.xlsx`.
+        part (int): The companion's number, from 2.
+
+    Returns:
+        str: e.g. `snapshot.part2.xlsx`.
+    """
+    root, extension = os.path.splitext(filename)
+    return f"{root}.part{part}{extension}"
+
+
+def companion_workbooks(filename):
+    """
+    Lists the companion workbooks written next to a workbook whose tables did
+    not fit in it.
+
+    Args:
+        filename (str): The primary workbook.
+
+    Returns:
+        list: (part number, path) pairs in part order.
+    """
+    root, extension = os.path.splitext(filename)
+    companions = []
+    for path in glob.glob(f"{glob.escape(root)}.part*{extension}"):
+        match = _COMPANION_FILE.search(path)
+        if match and path[:match.start()] == root:
+            companions.append((int(match.group("part")), path))
+    return sorted(companions)
+
+
+def shard_title(table_name, part):
+    """Returns the sheet title of one part of a table: its name, then `Name (2)` and so on."""
+    return table_name if part == 1 else f"{table_name} ({part})"
+
+
+def _shard_table(title):
+    """Returns the table a sheet title belongs to. Salesforce API names never contain spaces."""
+    match = _SHARD_TITLE.match(title)
+    return match.group("table") if match else title
+
+
+class SnapshotReader:
+    """
+    An open snapshot, for reading many sheets or columns without opening the
+    store again each time.
+
+    Loading a workbook is the expensive part of reading one: workbooks
+    written in write-only mode have no dimensions, so openpyxl scans every
+    sheet of a workbook each time it is loaded. The primary and companion
+    workbooks are loaded once, on first use, and shared by every read until
+    the reader is closed. SQLite and Parquet stores are cheap to open and
+    are still opened per read, so a reader can be shared between threads.
+
+    Every function below taking a snapshot path also takes a reader.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.format = _store_format(path)
+        self._workbooks = None
+        self._lock = threading.Lock()
+
+    def workbooks(self):
+        """Returns the loaded primary workbook, then its companions in part order."""
+        with self._lock:
+            if self._workbooks is None:
+                from openpyxl import load_workbook
+
+                workbooks = []
+                try:
+                    for workbook_file in [self.path] + [companion for _, companion in companion_workbooks(self.path)]:
+                        workbooks.append(load_workbook(workbook_file, read_only=True, data_only=True))
+                except Exception:
+                    for workbook in workbooks:
+                        workbook.close()
+                    raise
+                self._workbooks = workbooks
+            return self._workbooks
+
+    def close(self):
+        with self._lock:
+            for workbook in self._workbooks or []:
+                workbook.close()
+            self._workbooks = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@contextmanager
+def _open_snapshot(snapshot):
+    """Yields a reader for a snapshot path, or the given reader, closing only a reader opened here."""
+    if isinstance(snapshot, SnapshotReader):
+        yield snapshot
+        return
+    with SnapshotReader(snapshot) as reader:
+        yield reader
+
+
+def list_sheet_names(path):
+    """
+    Lists the sheets (tables) in a snapshot of any format.
+
+    Args:
+        path (str or SnapshotReader): Path to the workbook, SQLite database
+            or Parquet directory, or an open reader.
+
+    Returns:
+        list: Sheet names, including `Summary`.
+    """
+    with _open_snapshot(path) as reader:
+        return _list_sheet_names(reader)
+
+
+def _list_sheet_names(reader):
+    path = reader.path
+    store_format = reader.format
+    if store_format == "parquet":
+        return sorted(os.path.splitext(name)[0] for name in os.listdir(path) if name.endswith(".parquet"))
+    if store_format == "sqlite":
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        finally:
+            connection.close()
+
+    sheet_names = []
+    for workbook in reader.workbooks():
+        for title in workbook.sheetnames:
+            if _shard_table(title) not in sheet_names:
+                sheet_names.append(_shard_table(title))
+    return sheet_names
+
+
+def iter_sheet_rows(path, sheet_name):
+    """
+    Streams the rows of one sheet (table) from a snapshot of any format.
+
+    Workbooks are opened in read-only mode. A store opened for the call is
+    closed when the iterator is exhausted or discarded; a reader stays open.
+
+    Args:
+        path (str or SnapshotReader): Path to the workbook, SQLite database
+            or Parquet directory, or an open reader.
+        sheet_name (str): The sheet to read.
+
+    Yields:
+        tuple: The header row first, then each data row, as cell values.
+
+    Raises:
+        KeyError: If the sheet does not exist.
+    """
+    with _open_snapshot(path) as reader:
+        if reader.format == "parquet":
+            yield from _iter_parquet_rows(reader.path, sheet_name)
+        elif reader.format == "sqlite":
+            yield from _iter_sqlite_rows(reader.path, sheet_name)
+        else:
+            yield from _iter_xlsx_rows(reader, sheet_name)
+
+
+def _iter_xlsx_rows(reader, sheet_name):
+    """Reads a table's sheet and any numbered sheets continuing it, across the companion workbooks too."""
+    found = False
+    for workbook in reader.workbooks():
+        for title in workbook.sheetnames:
+            if _shard_table(title) != sheet_name:
+                continue
+            rows = workbook[title].iter_rows(values_only=True)
+            # Every part repeats the header row
+            header = next(rows, None)
+            if not found:
+                found = True
+                if header is not None:
+                    yield header
+            yield from rows
+    if not found:
+        raise KeyError(sheet_name)
+
+
+def _iter_sqlite_rows(path, sheet_name):
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        try:
+            cursor = connection.execute('SELECT * FROM "{}"'.format(sheet_name.replace('"', '""')))
+        except sqlite3.OperationalError:
+            raise KeyError(sheet_name)
+        yield tuple(column[0] for column in cursor.description)
+        yield from cursor
+    finally:
+        connection.close()
+
+
+def _iter_parquet_rows(path, sheet_name):
+    import pyarrow.parquet as pq
+
+    table_file = os.path.join(path, f"{sheet_name}.parquet")
+    if not os.path.exists(table_file):
+        raise KeyError(sheet_name)
+
+    parquet_file = pq.ParquetFile(table_file)
+    yield tuple(parquet_file.schema_arrow.names)
+    for batch in parquet_file.iter_batches():
+        yield from zip(*(column.to_pylist() for column in batch.columns))
+
+
+def read_sheet_header(path, sheet_name):
+    """
+    Returns the header row of one sheet (table) in a snapshot.
+
+    Args:
+        path (str or SnapshotReader): Path to the workbook, SQLite database
+            or Parquet directory, or an open reader.
+        sheet_name (str): The sheet to read.
+
+    Returns:
+        list: Column names, empty if the sheet has no rows.
+
+    Raises:
+        KeyError: If the sheet does not exist.
+    """
+    rows = iter_sheet_rows(path, sheet_name)
+    try:
+        return list(next(rows, None) or [])
+    finally:
+        rows.close()
+
+
+def iter_columns(path, sheet_name, columns):
+    """
+    Streams only the requested columns of one sheet (table) in a snapshot.
+
+    SQLite and Parquet stores read just those columns. Workbooks are read
+    in read-only mode and each row is cut down to those columns as it is
+    parsed, so only one row is held at a time.
+
+    Args:
+        path (str or SnapshotReader): Path to the workbook, SQLite database
+            or Parquet directory, or an open reader.
+        sheet_name (str): The sheet to read.
+        columns (list): Column names to read.
+
+    Yields:
+        tuple: The values of `columns` for each data row, in order.
+
+    Raises:
+        KeyError: If the sheet or one of the columns does not exist.
+    """
+    columns = list(columns)
+    store_format = path.format if isinstance(path, SnapshotReader) else _store_format(path)
+    if store_format != "xlsx" and isinstance(path, SnapshotReader):
+        path = path.path
+
+    if store_format == "parquet":
+        import pyarrow.parquet as pq
+
+        table_file = os.path.join(path, f"{sheet_name}.parquet")
+        if not os.path.exists(table_file):
+            raise KeyError(sheet_name)
+        parquet_file = pq.ParquetFile(table_file)
+        missing = set(columns) - set(parquet_file.schema_arrow.names)
+        if missing:
+            raise KeyError(sorted(missing)[0])
+        for batch in parquet_file.iter_batches(columns=columns):
+            yield from zip(*(batch.column(column).to_pylist() for column in columns))
+        return
+
+    if store_format == "sqlite":
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            selected = ", ".join('"{}"'.format(column.replace('"', '""')) for column in columns)
+            try:
+                cursor = connection.execute('SELECT {} FROM "{}"'.format(selected, sheet_name.replace('"', '""')))
+            except sqlite3.OperationalError as e:
+                raise KeyError(str(e))
+            yield from cursor
+        finally:
+            connection.close()
+        return
+
+    rows = iter_sheet_rows(path, sheet_name)
+    try:
+        headers = list(next(rows, None) or [])
+        indexes = [headers.index(column) if column in headers else None for column in columns]
+        if None in indexes:
+            raise KeyError(columns[indexes.index(None)])
+        for row in rows:
+            # Read-only rows can be shorter than the header when trailing cells are empty
+            yield tuple(row[index] if index < len(row) else None for index in indexes)
+    finally:
+        rows.close()
+
+
+def read_columns(path, sheet_name, columns, as_set=False):
+    """
+    Reads only the requested columns of one sheet (table) in a snapshot.
+
+    Args:
+        path (str or SnapshotReader): Path to the workbook, SQLite database
+            or Parquet directory, or an open reader.
+        sheet_name (str): The sheet to read.
+        columns (list): Column names to read.
+        as_set (bool): Return the set of non-null values per column instead
+            of the values in row order.
+
+    Returns:
+        dict: Column name mapped to a list of values (row order, None for
+        blanks) or a set of non-null values.
+
+    Raises:
+        KeyError: If the sheet or one of the columns does not exist.
+    """
+    columns = list(columns)
+    if as_set:
+        values = {column: set() for column in columns}
+        for row in iter_columns(path, sheet_name, columns):
+            for column, value in zip(columns, row):
+                if value is not None:
+                    values[column].add(value)
+        return values
+
+    values = {column: [] for column in columns}
+    appends = [values[column].append for column in columns]
+    for row in iter_columns(path, sheet_name, columns):
+        for append, value in zip(appends, row):
+            append(value)
+    return values
@@ -0,0 +1,249 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def peak_memory_bytes():
+    """
+    Returns the process's peak resident memory so far.
+
+    Returns:
+        int or None: Bytes, or None where the platform does not report it.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Span:
+    """
+    One timed operation: a run phase, an object, a query page or a table write.
+
+    Counters such as `records`, `bytes` and `requests` added to a span are
+    also added to its ancestors, so an object's span totals its pages. A span
+    can keep some counters to itself, e.g. the records of a sampling pass.
+    """
+
+    def __init__(self, tracer, name, category, parent, attributes, isolate=()):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.attributes = attributes
+        self.isolate = set(isolate)
+        self.counters = {}
+        self.thread_id = threading.get_ident()
+        self.start = time.perf_counter()
+        self.end = None
+        self.peak_memory = None
+
+    def add(self, **counters):
+        """Adds to this span's counters and its ancestors'."""
+        with self.tracer._lock:
+            span = self
+            while span is not None and counters:
+                for key, value in counters.items():
+                    span.counters[key] = span.counters.get(key, 0) + value
+                counters = {key: value for key, value in counters.items() if key not in span.isolate}
+                span = span.parent
+
+    def finish(self):
+        """Stops the clock and records the peak memory so far."""
+        if self.end is None:
+            self.end = time.perf_counter()
+            self.peak_memory = peak_memory_bytes()
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self):
+        duration = self.duration
+        span = {
+            "name": self.name,
+            "category": self.category,
+            "parent": self.parent.name if self.parent else None,
+            "thread": self.thread_id,
+            "start": round(self.start - self.tracer.origin, 6),
+            "duration": round(duration, 6),
+            "peak_memory": self.peak_memory,
+            **self.counters,
+            **self.attributes,
+        }
+        if self.counters.get("records") and duration > 0:
+            span["rows_per_sec"] = round(self.counters["records"] / duration, 1)
+        return span
+
+
+class Tracer:
+    """
+    Collects spans from every thread of a run.
+
+    Spans opened with `span()` nest per thread, so a request made inside a
+    page span is counted against that page. Work handed to another thread
+    passes its parent span explicitly.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        """Returns the innermost open span on this thread, or None."""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def start_span(self, name, category="phase", parent=None, isolate=(), **attributes):
+        """
+        Starts a span that is not tied to this thread's nesting, for work
+        spread over generator steps. Call `finish()` on it when done.
+        """
+        span = Span(self, name, category, parent, attributes, isolate)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @contextmanager
+    def activate(self, span):
+        """Makes an existing span this thread's current span for the block."""
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+
+    @contextmanager
+    def span(self, name, category="phase", parent=None, isolate=(), **attributes):
+        """
+        Times a block of work as a span nested in this thread's current span.
+
+        Args:
+            name (str): Span name, e.g. `Extract Product2`.
+            category (str): `phase`, `object`, `page`, `write` and so on.
+            parent (Span, optional): Parent span when the work was handed
+                over from another thread.
+            isolate (iterable): Counters kept on this span rather than added
+                to its ancestors.
+            **attributes: Extra values exported with the span.
+
+        Yields:
+            Span: The open span, for adding counters.
+        """
+        span = self.start_span(name, category, parent or self.current(), isolate, **attributes)
+        try:
+            with self.activate(span):
+                yield span
+        finally:
+            span.finish()
+
+    def summary_rows(self, category="phase"):
+        """
+        Builds Summary sheet rows for the finished spans of one category.
+
+        Returns:
+            list of lists: Rows in the Summary log layout.
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return [
+            [now, "Timing", describe_span(span), span.name, "Success"]
+            for span in list(self.spans)
+            if span.category == category and span.end is not None
+        ]
+
+    def to_dict(self):
+        """Returns every span as a JSON-serializable report."""
+        return {
+            "peak_memory": peak_memory_bytes(),
+            "spans": [span.to_dict() for span in list(self.spans)],
+        }
+
+    def export(self, filename, trace_format="json"):
+        """
+        Writes the spans to a file.
+
+        Args:
+            filename (str): Output path.
+            trace_format (str): `json` for the span report, or `chrome` for
+                the Trace Event format read by chrome://tracing and Perfetto.
+        """
+        if trace_format == "chrome":
+            report = {"traceEvents": [_chrome_event(span) for span in list(self.spans)], "displayTimeUnit": "ms"}
+        else:
+            report = self.to_dict()
+        with open(filename, "w") as file:
+            json.dump(report, file, indent=2, default=str)
+
+
+def describe_span(span):
+    """Formats a span's duration, counters and throughput for the Summary log."""
+    parts = [f"{span.duration:.3f}s"]
+    if "records" in span.counters:
+        parts.append(f"{span.counters['records']} records")
+        if span.duration > 0:
+            parts.append(f"{span.counters['records'] / span.duration:.0f} rows/s")
+    if "bytes" in span.counters:
+        parts.append(f"{span.counters['bytes']} bytes")
+    if "requests" in span.counters:
+        parts.append(f"{span.counters['requests']} requests")
+    if span.peak_memory:
+        parts.append(f"peak memory {span.peak_memory / (1024 * 1024):.0f} MB")
+    return ", ".join(parts)
+
+
+def _chrome_event(span):
+    args = {key: value for key, value in span.to_dict().items() if key not in ("name", "category", "start", "duration")}
+    return {
+        "name": span.name,
+        "cat": span.category,
+        "ph": "X",
+        "ts": round((span.start - span.tracer.origin) * 1e6),
+        "dur": round(span.duration * 1e6),
+        "pid": os.getpid(),
+        "tid": span.thread_id,
+        "args": args,
+    }
+
+
+def count_response_bytes(response, *args, **kwargs):
+    """
+    Response hook: counts a request and its bytes against the current span.
+
+    Bodies of non-streamed responses are read here, as requests would right
+    after the hooks run. Streamed responses are left to their reader to count.
+    """
+    span = _tracer.current()
+    if span is None or kwargs.get("stream"):
+        return response
+    content = response.content
+    # Bytes pulled over the wire, before gzip decoding
+    received = response.raw.tell() if hasattr(response.raw, "tell") else len(content)
+    span.add(requests=1, bytes=received)
+    return response
+
+
+# One tracer per process, shared by every module
+_tracer = Tracer()
+
+
+def get_tracer():
+    """Returns the process's tracer."""
+    return _tracer
@@ -1,9 +1,11 @@
+import json
 import os
-import pandas as pd
-import openpyxl
-from pydbml import PyDBML
+from concurrent.futures import ThreadPoolExecutor
+from salesforce.model import load_dbml_model
+from sheets.utils import SnapshotReader, iter_columns, list_sheet_names, read_columns, read_sheet_header
 
 def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: str):
+    snapshot = None
     try:
         print(f"Debug: Starting validation for {object_api_name} using {dbml_file} and {excel_file}")
 
@@ -12,49 +14,37 @@ def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: st
             print(f"Error: File {excel_file} not found.")
             return
 
-        # Load the workbook
-        workbook = openpyxl.load_workbook(excel_file)
-        print(f"Debug: Workbook {excel_file} loaded successfully with sheets: {workbook.sheetnames}")
+        # Open the snapshot (workbook, SQLite database or Parquet directory) once for every read
+        snapshot = SnapshotReader(excel_file)
+        sheet_names = list_sheet_names(snapshot)
+        print(f"Debug: Snapshot {excel_file} opened successfully with sheets: {sheet_names}")
 
         # Check if the object sheet exists
-        if object_api_name not in workbook.sheetnames:
+        if object_api_name not in sheet_names:
             print(f"Error: Sheet {object_api_name} not found in {excel_file}.")
             return
 
-        # Load the object sheet
-        sheet = workbook[object_api_name]
-        data = pd.DataFrame(sheet.values)
-        headers = data.iloc[0].tolist()
-        data = data[1:]
-        data.columns = headers
-        print(f"Debug: Sheet {object_api_name} loaded successfully with headers: {headers}")
-        print(f"Debug: Data in sheet:\n{data.head()}")
+        # Read the object sheet's headers; only the columns needed are loaded later
+        headers = read_sheet_header(snapshot, object_api_name)
+        print(f"Debug: Sheet {object_api_name} opened successfully with headers: {headers}")
 
-        # Parse the DBML file
-        with open(dbml_file, "r") as file:
-            dbml_content = PyDBML(file.read())
-        print(f"Debug: DBML file {dbml_file} parsed successfully.")
+        # Load the (cached) DBML model
+        dbml_model = load_dbml_model(dbml_file)
+        print(f"Debug: DBML file {dbml_file} loaded successfully.")
 
         # Extract the table for the given object
-        table = next((tbl for tbl in dbml_content.tables if tbl.name == object_api_name), None)
+        table = dbml_model["tables"].get(object_api_name)
         if not table:
-            print(f"Error: No table found for {object_api_name} in {dbml_file}. Available tables: {[tbl.name for tbl in dbml_content.tables]}")
+            print(f"Error: No table found for {object_api_name} in {dbml_file}. Available tables: {list(dbml_model['tables'])}")
             return
         print(f"Debug: Table {object_api_name} found in DBML file.")
 
-        # Parse the DBML file with property support
-        with open(dbml_file, "r") as file:
-            dbml_content = PyDBML(file.read(), allow_properties=True)
-        print(f"Debug: DBML file {dbml_file} parsed successfully with properties enabled.")
-
-
-        # Extract relationships from the table using properties
-        relationships = []
-        for column in table.columns:
-            if 'ref' in column.properties and column.not_null:
-                # Extract referenced table and column from the `ref` property
-                ref_table, ref_column = column.properties['ref'].split('.')
-                relationships.append((column.name, ref_table.strip(), ref_column.strip()))
+        # Extract required relationships from the table's references
+        relationships = [
+            (ref["column"], ref["table"], ref["ref_column"])
+            for ref in table["refs"]
+            if ref["type"] == ">" and ref["not_null"]
+        ]
 
         print(f"Debug: Relationships extracted for {object_api_name}: {relationships}")
 
@@ -62,6 +52,11 @@ def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: st
             print(f"No required relationships with [ref: > ... AND not null] found for {object_api_name}.")
             return
 
+        # Load just the relationship columns of the object sheet
+        data = read_columns(
+            snapshot, object_api_name, {column_name for column_name, _, _ in relationships if column_name in headers}
+        )
+
         unmatched = {}
 
         for column_name, ref_table, ref_column in relationships:
@@ -72,18 +67,13 @@ def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: st
                 continue
 
             # Fetch referenced table
-            if ref_table not in workbook.sheetnames:
+            if ref_table not in sheet_names:
                 print(f"Error: Referenced table {ref_table} not found in workbook.")
                 unmatched[column_name] = "Table not found"
                 continue
 
-            ref_sheet = workbook[ref_table]
-            ref_data = pd.DataFrame(ref_sheet.values)
-            ref_headers = ref_data.iloc[0].tolist()
-            ref_data = ref_data[1:]
-            ref_data.columns = ref_headers
-            print(f"Debug: Referenced table {ref_table} loaded successfully with headers: {ref_headers}")
-            print(f"Debug: Data in referenced table:\n{ref_data.head()}")
+            ref_headers = read_sheet_header(snapshot, ref_table)
+            print(f"Debug: Referenced table {ref_table} opened successfully with headers: {ref_headers}")
 
             if ref_column not in ref_headers:
                 print(f"Error: Column {ref_column} not found in referenced table {ref_table}.")
@@ -91,10 +81,10 @@ def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: st
                 continue
 
             # Check for matches
-            ref_ids = ref_data[ref_column].dropna().unique()
-            sheet_ids = data[column_name].dropna().unique()
-            matched_ids = set(sheet_ids).intersection(ref_ids)
-            unmatched_ids = set(sheet_ids).difference(ref_ids)
+            ref_ids = read_columns(snapshot, ref_table, [ref_column], as_set=True)[ref_column]
+            sheet_ids = {value for value in data[column_name] if value is not None}
+            matched_ids = sheet_ids.intersection(ref_ids)
+            unmatched_ids = sheet_ids.difference(ref_ids)
 
             print(f"On Sheet {object_api_name}.{column_name} has {len(sheet_ids)} Id values.")
             print(f"In Sheet {ref_table}.{ref_column} finds {len(matched_ids)} of {len(sheet_ids)} matching Id's.")
@@ -106,7 +96,8 @@ def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: st
             print("\nValidation failed:")
             for column, issue in unmatched.items():
                 if isinstance(issue, set):
-                    rows = [i + 2 for i, val in enumerate(data[column_name]) if val in issue]
+                    # The header is row 1, so the first data row is row 2
+                    rows = [row for row, value in enumerate(data[column], start=2) if value in issue]
                     print(f"  {object_api_name}.{column} has unmatched Ids at rows: {rows}.")
                 else:
                     print(f"  {column}: {issue}")
@@ -115,18 +106,173 @@ def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: st
             print("Parent Data relationship validated based on .dbml")
     except Exception as e:
         print(f"Critical Error: {e}")
+    finally:
+        if snapshot is not None:
+            snapshot.close()
+
+
+def _build_key_sets(snapshot: SnapshotReader, table: str, columns: set):
+    """
+    Reads the given columns of one table in a single pass.
+
+    Returns:
+        dict: Column name mapped to the set of its non-null values. Columns
+        missing from the table are absent from the result.
+    """
+    headers = read_sheet_header(snapshot, table)
+    columns = [column for column in columns if column in headers]
+    return read_columns(snapshot, table, columns, as_set=True) if columns else {}
+
+
+def _check_object(snapshot: SnapshotReader, object_api_name: str, refs: list, key_sets: dict):
+    """
+    Checks every reference of one object in a single pass over its sheet.
+
+    Returns:
+        list: One result dict per reference.
+    """
+    headers = read_sheet_header(snapshot, object_api_name)
+
+    results = []
+    checks = []
+    for ref in refs:
+        result = {
+            "object": object_api_name,
+            "column": ref["column"],
+            "ref_table": ref["table"],
+            "ref_column": ref["ref_column"],
+            "required": ref["not_null"],
+            "checked": 0,
+            "nulls": 0,
+            "unmatched": [],
+        }
+        keys = key_sets.get((ref["table"], ref["ref_column"]))
+        if ref["column"] not in headers:
+            result["status"] = "column not found"
+        elif keys is None:
+            result["status"] = "referenced table or column not found"
+        else:
+            result["status"] = "ok"
+            checks.append((len(checks), keys, result))
+        results.append(result)
+
+    # Stream only the checked columns; the header is row 1, so data starts at row 2
+    rows = iter_columns(snapshot, object_api_name, [result["column"] for _, _, result in checks]) if checks else ()
+    for row_number, row in enumerate(rows, start=2):
+        for index, keys, result in checks:
+            value = row[index]
+            if value is None:
+                result["nulls"] += 1
+                continue
+            result["checked"] += 1
+            if value not in keys:
+                result["unmatched"].append({"row": row_number, "value": value})
+
+    for index, keys, result in checks:
+        if result["unmatched"]:
+            result["status"] = "unmatched"
+    return results
+
+
+def validate_all_relationships(dbml_file: str, snapshot: str, workers: int = 1):
+    """
+    Validates every `ref: >` relationship in the DBML model against a snapshot.
+
+    Each referenced table is read once to build the key sets for all the
+    columns referenced in it, then each object's sheet is read once to check
+    all of its references. Objects can be checked in parallel.
+
+    Args:
+        dbml_file (str): Path to the DBML file.
+        snapshot (str): Path to the snapshot (.xlsx, .sqlite or .parquet directory).
+        workers (int): Number of objects checked in parallel.
+
+    Returns:
+        dict: The report, with `valid` and one entry per relationship in
+        `relationships` including the rows of any unmatched values.
+    """
+    dbml_model = load_dbml_model(dbml_file)
+    # Every table is read through one reader, so each workbook is loaded once
+    with SnapshotReader(snapshot) as reader:
+        sheet_names = set(list_sheet_names(reader))
+
+        # Group the references by child object and by referenced table
+        object_refs = {}
+        referenced_columns = {}
+        for object_api_name, table in dbml_model["tables"].items():
+            refs = [ref for ref in table["refs"] if ref["type"] == ">"]
+            if refs:
+                object_refs[object_api_name] = refs
+            for ref in refs:
+                referenced_columns.setdefault(ref["table"], set()).add(ref["ref_column"])
+
+        # Build each referenced table's key sets exactly once
+        key_sets = {}
+        for ref_table, columns in referenced_columns.items():
+            if ref_table not in sheet_names:
+                continue
+            for column, keys in _build_key_sets(reader, ref_table, columns).items():
+                key_sets[(ref_table, column)] = keys
+
+        relationships = []
+        missing = [name for name in object_refs if name not in sheet_names]
+        for object_api_name in missing:
+            for ref in object_refs.pop(object_api_name):
+                relationships.append({
+                    "object": object_api_name,
+                    "column": ref["column"],
+                    "ref_table": ref["table"],
+                    "ref_column": ref["ref_column"],
+                    "required": ref["not_null"],
+                    "status": "sheet not found",
+                    "checked": 0,
+                    "nulls": 0,
+                    "unmatched": [],
+                })
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [
+                executor.submit(_check_object, reader, object_api_name, refs, key_sets)
+                for object_api_name, refs in object_refs.items()
+            ]
+            for future in futures:
+                relationships.extend(future.result())
+
+    return {
+        "dbml": dbml_file,
+        "snapshot": snapshot,
+        "valid": all(result["status"] in ("ok", "sheet not found") for result in relationships),
+        "relationships": relationships,
+    }
 
 
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Validate Object Parent Relationships")
-    parser.add_argument("-t", "--target", required=True, help="Path to the Excel file")
-    parser.add_argument("-o", "--object", required=True, help="Object API Name")
+    parser.add_argument("-t", "--target", required=True, help="Path to the snapshot (.xlsx, .sqlite or .parquet directory)")
+    parser.add_argument("-o", "--object", required=False, help="Object API Name")
     parser.add_argument("-d", "--dbml", required=True, help="Path to the DBML file")
+    parser.add_argument("-a", "--all", action="store_true", help="Validate every ref: > in the DBML in one pass")
+    parser.add_argument("-r", "--report", required=False, help="Write the --all report as JSON to this file")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Objects checked in parallel with --all")
 
     args = parser.parse_args()
 
-    print(f"Debug: Running validation with args {args}")
-    obj_master_parent_parse(args.dbml, args.target, args.object)
-    print("Debug: Validation completed.")
+    if args.all:
+        report = validate_all_relationships(args.dbml, args.target, args.workers)
+        for result in report["relationships"]:
+            print(f"{result['object']}.{result['column']} -> {result['ref_table']}.{result['ref_column']}: "
+                  f"{result['status']} ({result['checked']} checked, {len(result['unmatched'])} unmatched)")
+        if args.report:
+            with open(args.report, "w") as report_file:
+                json.dump(report, report_file, indent=2, default=str)
+            print(f"Report written to {args.report}")
+        print("Parent Data relationships validated based on .dbml" if report["valid"]
+              else "Parent Data relationship validation IS NOT met!")
+    elif args.object:
+        print(f"Debug: Running validation with args {args}")
+        obj_master_parent_parse(args.dbml, args.target, args.object)
+        print("Debug: Validation completed.")
+    else:
+        parser.error("Specify an object with -o or validate every relationship with --all")
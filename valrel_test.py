@@ -1,6 +1,5 @@
 import os
-import pandas as pd
-import openpyxl
+from sheets.utils import list_sheet_names, read_columns, read_sheet_header
 from pydbml import PyDBML
 
 def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: str):
@@ -10,20 +9,16 @@ def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: st
             print(f"Error: File {excel_file} not found.")
             return
 
-        # Load the workbook
-        workbook = openpyxl.load_workbook(excel_file)
+        # List the snapshot's sheets (workbook, SQLite database or Parquet directory)
+        sheet_names = list_sheet_names(excel_file)
 
         # Check if the object sheet exists
-        if object_api_name not in workbook.sheetnames:
+        if object_api_name not in sheet_names:
             print(f"Error: Sheet {object_api_name} not found in {excel_file}.")
             return
 
-        # Load the object sheet
-        sheet = workbook[object_api_name]
-        data = pd.DataFrame(sheet.values)
-        headers = data.iloc[0].tolist()
-        data = data[1:]
-        data.columns = headers
+        # Read the object sheet's headers; only the columns needed are loaded later
+        headers = read_sheet_header(excel_file, object_api_name)
 
         # Hardcoded DBML example for testing
         table_name = "OrderItem"
@@ -39,6 +34,11 @@ def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: st
             print(f"No relationships defined for {object_api_name}.")
             return
 
+        # Load just the relationship columns of the object sheet
+        data = read_columns(
+            excel_file, object_api_name, {column_name for column_name, _, _ in relationships if column_name in headers}
+        )
+
         unmatched = {}
 
         for column_name, ref_table, ref_column in relationships:
@@ -47,16 +47,12 @@ def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: st
                 continue
 
             # Fetch referenced table
-            if ref_table not in workbook.sheetnames:
+            if ref_table not in sheet_names:
                 print(f"Referenced table {ref_table} not found in workbook.")
                 unmatched[column_name] = "Table not found"
                 continue
 
-            ref_sheet = workbook[ref_table]
-            ref_data = pd.DataFrame(ref_sheet.values)
-            ref_headers = ref_data.iloc[0].tolist()
-            ref_data = ref_data[1:]
-            ref_data.columns = ref_headers
+            ref_headers = read_sheet_header(excel_file, ref_table)
 
             if ref_column not in ref_headers:
                 print(f"Column {ref_column} not found in referenced table {ref_table}.")
@@ -64,10 +60,10 @@ def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: st
                 continue
 
             # Check for matches
-            ref_ids = ref_data[ref_column].dropna().unique()
-            sheet_ids = data[column_name].dropna().unique()
-            matched_ids = set(sheet_ids).intersection(ref_ids)
-            unmatched_ids = set(sheet_ids).difference(ref_ids)
+            ref_ids = read_columns(excel_file, ref_table, [ref_column], as_set=True)[ref_column]
+            sheet_ids = {value for value in data[column_name] if value is not None}
+            matched_ids = sheet_ids.intersection(ref_ids)
+            unmatched_ids = sheet_ids.difference(ref_ids)
 
             print(f"On Sheet {object_api_name}.{column_name} has {len(sheet_ids)} Id values.")
             print(f"In Sheet {ref_table}.{ref_column} finds {len(matched_ids)} of {len(sheet_ids)} matching Id's.")
@@ -79,7 +75,7 @@ def obj_master_parent_parse(dbml_file: str, excel_file: str, object_api_name: st
             print("\nValidation failed:")
             for column, issue in unmatched.items():
                 if isinstance(issue, set):
-                    rows = [i + 2 for i, val in enumerate(data[column_name]) if val in issue]
+                    rows = [i + 2 for i, val in enumerate(data[column]) if val in issue]
                     print(f"  {object_api_name}.{column} has unmatched Ids at rows: {rows}.")
                 else:
                     print(f"  {column}: {issue}")
@@ -94,7 +90,7 @@ if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Validate Object Parent Relationships")
-    parser.add_argument("-t", "--target", required=True, help="Path to the Excel file")
+    parser.add_argument("-t", "--target", required=True, help="Path to the snapshot (.xlsx, .sqlite or .parquet directory)")
     parser.add_argument("-o", "--object", required=True, help="Object API Name")
     parser.add_argument("-d", "--dbml", required=False, help="Path to the DBML file")
 